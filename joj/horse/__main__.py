@@ -1,4 +1,6 @@
+import asyncio
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, List, Optional
 
@@ -59,7 +61,79 @@ def openapi(output: Optional[str], version: str, pretty: bool) -> None:
     exit(-1)
 
 
+@click.group("records")
+def records() -> None:
+    """Manage the partitions and the cold storage of records."""
+
+
+@records.command("create-partitions")
+@click.option("-m", "--months", type=int, default=3, help="Number of months ahead.")
+def create_record_partitions(months: int) -> None:
+    init_settings(AllSettings)
+    from joj.horse.services.db import get_db_engine
+    from joj.horse.services.partition import create_monthly_partitions, is_partitioned
+
+    async def main() -> None:
+        async with get_db_engine().begin() as conn:
+            if not await is_partitioned(conn, "records"):
+                raise click.ClickException(
+                    "records is not partitioned, "
+                    "upgrade with `alembic -x partition_records=true`"
+                )
+            now = datetime.now(tz=timezone.utc)
+            names = await create_monthly_partitions(conn, "records", now, months)
+        logger.info(f"partitions ensured: {', '.join(names)}")
+
+    asyncio.run(main())
+
+
+@records.command("archive")
+@click.option(
+    "-b",
+    "--before",
+    type=click.DateTime(formats=["%Y-%m"]),
+    required=True,
+    help="Archive the cases of records created before this month.",
+)
+@click.option("--batch-size", type=int, default=1000)
+def archive_records(before: datetime, batch_size: int) -> None:
+    init_settings(AllSettings)
+    from sqlalchemy.sql.expression import text
+
+    from joj.horse.models import Record
+    from joj.horse.services.db import get_db_engine
+    from joj.horse.services.partition import (
+        add_months,
+        get_month_start,
+        get_monthly_partitions,
+        is_partitioned,
+    )
+
+    async def main() -> None:
+        end = get_month_start(before.replace(tzinfo=timezone.utc))
+        async with get_db_engine().connect() as conn:
+            if await is_partitioned(conn, "records"):
+                partitions = await get_monthly_partitions(conn, "records")
+                months = [month for _, month in partitions if month < end]
+            else:
+                result = await conn.execute(text("SELECT min(created_at) FROM records"))
+                first = result.scalar()
+                months = []
+                month = get_month_start(first) if first else end
+                while month < end:
+                    months.append(month)
+                    month = add_months(month, 1)
+        for month in months:
+            archived = await Record.archive_cases(
+                month, add_months(month, 1), f"records/{month:%Y/%m}", batch_size
+            )
+            logger.info(f"records of {month:%Y-%m}: {archived} archived")
+
+    asyncio.run(main())
+
+
 if __name__ == "__main__":
     cli_group.add_command(serve)
     cli_group.add_command(openapi)
+    cli_group.add_command(records)
     cli_group()
@@ -1,3 +1,5 @@
+import os
+
 from fastapi import Depends
 from fastapi_jwt_auth import AuthJWT
 from sqlmodel import select
@@ -6,9 +8,16 @@ from joj.horse import models, schemas
 from joj.horse.models.permission import DefaultRole
 from joj.horse.schemas.auth import Authentication, auth_jwt_encode_user
 from joj.horse.schemas.base import StandardListResponse
+from joj.horse.services.db import get_db_engines
+from joj.horse.services.tiered_cache import get_tiered_cache
 from joj.horse.utils.errors import ForbiddenError
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
 from joj.horse.utils.fastapi.router import MyRouter
-from joj.horse.utils.parser import parse_ordering_query, parse_pagination_query
+from joj.horse.utils.parser import (
+    parse_ordering_query,
+    parse_pagination_query,
+    parse_stream_query,
+)
 
 
 def ensure_site_root(auth: Authentication = Depends()) -> None:
@@ -25,36 +34,47 @@ router_tag = "admin"
 async def list_users(
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
-) -> StandardListResponse[schemas.User]:
+    stream: bool = Depends(parse_stream_query),
+) -> ListResponse[schemas.User]:
     statement = select(models.User)
-    users, count = await models.User.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.User,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        schemas.User.from_orm,
+        count_strategy=schemas.CountStrategy.cached,
     )
-    return StandardListResponse(users, count)
 
 
 @router.get("/domain_roles")
 async def list_domain_roles(
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
-) -> StandardListResponse[schemas.DomainRole]:
+    stream: bool = Depends(parse_stream_query),
+) -> ListResponse[schemas.DomainRole]:
     statement = select(models.DomainRole)
-    domain_roles, count = await models.DomainRole.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.DomainRole,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        schemas.DomainRole.from_orm,
     )
-    return StandardListResponse(domain_roles, count)
 
 
 @router.get("/judgers")
 async def list_judgers(
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
-) -> StandardListResponse[schemas.User]:
+    stream: bool = Depends(parse_stream_query),
+) -> ListResponse[schemas.User]:
     statement = select(models.User).where(models.User.role == DefaultRole.JUDGER)
-    users, count = await models.User.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.User, statement, ordering, pagination, stream, schemas.User.from_orm
     )
-    return StandardListResponse(users, count)
 
 
 @router.post("/judgers")
@@ -71,3 +91,35 @@ async def create_judger(
             token_type="bearer",
         )
     )
+
+
+@router.get("/db_pools")
+async def list_db_pools() -> StandardListResponse[schemas.DatabasePoolStats]:
+    pools = []
+    for name, engine in get_db_engines().items():
+        pool = engine.sync_engine.pool
+        pools.append(
+            schemas.DatabasePoolStats(
+                name=name,
+                pid=os.getpid(),
+                size=pool.size(),  # type: ignore
+                checked_out=pool.checkedout(),  # type: ignore
+                idle=pool.checkedin(),  # type: ignore
+                overflow=pool.overflow(),  # type: ignore
+                checkout_count=getattr(pool, "checkout_count", 0),
+                checkout_wait_seconds=getattr(pool, "checkout_wait_seconds", 0.0),
+                max_checkout_wait_seconds=getattr(
+                    pool, "max_checkout_wait_seconds", 0.0
+                ),
+            )
+        )
+    return StandardListResponse(pools)
+
+
+@router.get("/cache_stats")
+async def list_cache_stats() -> StandardListResponse[schemas.CacheStats]:
+    stats = [
+        schemas.CacheStats(namespace=namespace, pid=os.getpid(), **counters)
+        for namespace, counters in get_tiered_cache().get_stats().items()
+    ]
+    return StandardListResponse(stats)
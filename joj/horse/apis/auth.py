@@ -22,6 +22,7 @@ from joj.horse.schemas.auth import (
     auth_jwt_raw_access_token,
     auth_jwt_raw_refresh_token,
 )
+from joj.horse.services.db import use_primary_db
 from joj.horse.services.oauth import BaseOAuth2, OAuth2Dependency, OAuth2Token
 from joj.horse.services.oauth.github import GitHubOAuth2
 from joj.horse.services.oauth.jaccount import JaccountOAuth2
@@ -167,6 +168,7 @@ def get_oauth_router(
     @oauth_router.get(
         "/{oauth2}/callback", name=callback_route_name, include_in_schema=False
     )
+    @use_primary_db
     async def callback(
         request: Request,
         response: Response,
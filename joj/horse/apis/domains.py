@@ -23,9 +23,10 @@ from joj.horse.schemas.permission import (
     DefaultRole,
     Permission,
 )
-from joj.horse.services.db import db_session_dependency
+from joj.horse.services.db import db_session_dependency, statement_timeout
 from joj.horse.utils.errors import BizError, ErrorCode, UnauthorizedError
-from joj.horse.utils.fastapi.router import MyRouter
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
+from joj.horse.utils.fastapi.router import MyRouter, request_deadline
 from joj.horse.utils.parser import (
     parse_domain_from_auth,
     parse_domain_invitation,
@@ -33,9 +34,12 @@ from joj.horse.utils.parser import (
     parse_domain_without_validation,
     parse_ordering_query,
     parse_pagination_query,
+    parse_stream_query,
     parse_uid,
     parse_user_from_auth,
     parse_user_from_path_or_query,
+    parse_view_hidden_problem,
+    parse_view_hidden_problem_set,
 )
 
 router = MyRouter()
@@ -49,14 +53,14 @@ async def list_domains(
     groups: Optional[List[str]] = Query(None),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     user: models.User = Depends(parse_user_from_auth),
-) -> StandardListResponse[schemas.Domain]:
+) -> ListResponse[schemas.Domain]:
     """List all domains that the current user has a role."""
     statement = user.find_domains_statement(roles, groups)
-    domains, count = await models.Domain.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.Domain, statement, ordering, pagination, stream, schemas.Domain.from_orm
     )
-    return StandardListResponse(domains, count)
 
 
 @router.post("", permissions=[Permission.SiteDomain.create])
@@ -74,17 +78,19 @@ async def create_domain(
         )
         session.sync_session.add(domain_user)
         logger.info(f"create domain user: {domain_user}")
-        for role in DefaultRole:
-            # skip fixed roles (judger)
-            if role in FIXED_ROLES:
-                continue
-            domain_role = models.DomainRole(
+        await session.flush()
+        domain_roles = [
+            models.DomainRole(
                 domain_id=domain.id,
                 role=role,
                 permission=DEFAULT_DOMAIN_PERMISSION[role].dict(),
             )
-            logger.info(f"create domain role: {domain_role}")
-            session.sync_session.add(domain_role)
+            for role in DefaultRole
+            # skip fixed roles (judger)
+            if role not in FIXED_ROLES
+        ]
+        logger.info(f"create domain roles: {domain_roles}")
+        await models.DomainRole.bulk_insert(domain_roles, commit=False)
         await session.commit()
         await session.refresh(domain)
     except sqlalchemy.exc.IntegrityError as e:
@@ -100,7 +106,7 @@ async def search_domain_groups(
     query: SearchQueryStr = Query(..., description="search query"),
 ) -> StandardListResponse[DomainTag]:
     statement = models.Domain.find_groups_statement(query)
-    rows, count = await models.Domain.execute_list_statement(statement)
+    rows, count, _ = await models.Domain.execute_list_statement(statement)
     return StandardListResponse(rows, count)
 
 
@@ -181,13 +187,17 @@ async def list_domain_users(
     domain: models.Domain = Depends(parse_domain_from_auth),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
-) -> StandardListResponse[schemas.UserWithDomainRole]:
+    stream: bool = Depends(parse_stream_query),
+) -> ListResponse[schemas.UserWithDomainRole]:
     statement = domain.find_domain_users_statement()
-    rows, count = await models.DomainUser.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.DomainUser,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        lambda row: schemas.UserWithDomainRole.from_domain_user(*row),
     )
-    domain_users = [schemas.UserWithDomainRole.from_domain_user(*row) for row in rows]
-    return StandardListResponse(domain_users, count)
 
 
 @router.post("/{domain}/users", permissions=[Permission.DomainGeneral.edit])
@@ -302,6 +312,8 @@ async def get_domain_user_permission(
 
 
 @router.get("/{domain}/candidates", permissions=[Permission.DomainGeneral.edit])
+@statement_timeout(5)
+@request_deadline(10)
 async def search_domain_candidates(
     domain: models.Domain = Depends(parse_domain_from_auth),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query(["username"])),
@@ -309,25 +321,53 @@ async def search_domain_candidates(
 ) -> StandardListResponse[schemas.UserDetailWithDomainRole]:
     pagination = schemas.PaginationQuery(offset=0, limit=10)
     statement = domain.find_candidates_statement(query)
-    rows, count = await models.User.execute_list_statement(
+    rows, count, _ = await models.User.execute_list_statement(
         statement, ordering, pagination
     )
     domain_users = [
-        schemas.UserDetailWithDomainRole.from_domain_user(*row[::-1]) for row in rows
+        schemas.UserDetailWithDomainRole.from_domain_user(None, user) for user in rows
     ]
     return StandardListResponse(domain_users, count)
 
 
+@router.get(
+    "/{domain}/search",
+    permissions=[Permission.DomainProblem.view, Permission.DomainProblemSet.view],
+)
+@statement_timeout(5)
+@request_deadline(10)
+async def search_domain(
+    domain: models.Domain = Depends(parse_domain_from_auth),
+    pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    include_hidden_problems: bool = Depends(parse_view_hidden_problem),
+    include_hidden_problem_sets: bool = Depends(parse_view_hidden_problem_set),
+    query: SearchQueryStr = Query(..., description="search query"),
+) -> StandardListResponse[schemas.DomainSearchResult]:
+    """
+    Search the problems and problem sets in the domain by title and content,
+    ranked by the relevance. Supports quoted phrases, "or" and "-word".
+    """
+    if pagination.cursor:
+        raise BizError(
+            ErrorCode.IllegalFieldError, "cursor can not be used with search"
+        )
+    rows, count = await domain.search(
+        query, include_hidden_problems, include_hidden_problem_sets, pagination
+    )
+    results = [schemas.DomainSearchResult(**row._mapping) for row in rows]
+    return StandardListResponse(results, count)
+
+
 @router.get("/{domain}/roles", permissions=[Permission.DomainGeneral.view])
 async def list_domain_roles(
     domain: models.Domain = Depends(parse_domain_from_auth),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
 ) -> StandardListResponse[schemas.DomainRole]:
     statement = domain.find_domain_roles_statement()
-    domain_roles, count = await models.DomainRole.execute_list_statement(
+    domain_roles, count, next_cursor = await models.DomainRole.execute_list_statement(
         statement, ordering
     )
-    return StandardListResponse(domain_roles, count)
+    return StandardListResponse(domain_roles, count, next_cursor)
 
 
 @router.post("/{domain}/roles", permissions=[Permission.DomainGeneral.edit])
@@ -418,12 +458,17 @@ async def list_domain_invitations(
     domain: models.Domain = Depends(parse_domain_from_auth),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
-) -> StandardListResponse[schemas.DomainInvitation]:
+    stream: bool = Depends(parse_stream_query),
+) -> ListResponse[schemas.DomainInvitation]:
     statement = domain.find_domain_invitations_statement()
-    invitations, count = await models.DomainInvitation.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.DomainInvitation,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        schemas.DomainInvitation.from_orm,
     )
-    return StandardListResponse(invitations, count)
 
 
 @router.post("/{domain}/invitations", permissions=[Permission.DomainGeneral.edit])
@@ -60,6 +60,7 @@ async def claim_record_by_judger(
     secret_access_key = access_key.secret_access_key
     record.lakefs_access_key_id = access_key.access_key_id
     await record.save_model()
+    await record.update_user_latest_record_cache()
     await record.fetch_related("problem")
     lakefs_problem_config = LakeFSProblemConfig(record.problem)
     lakefs_record = LakeFSRecord(record.problem, record)
@@ -105,8 +106,15 @@ async def submit_record_by_judger(
                 delete_credentials(user.username, record.lakefs_access_key_id)
 
         await run_in_threadpool(sync_func)
+    accepted = (
+        record.state != schemas.RecordState.accepted
+        and record_result.state == schemas.RecordState.accepted
+    )
     record.update_from_dict(record_result.dict())
     await record.save_model()
+    await record.update_user_latest_record_cache()
+    if accepted and record.problem_id is not None:
+        await models.Problem.increment_counters(record.problem_id, num_accept=1)
     return StandardResponse()
 
 
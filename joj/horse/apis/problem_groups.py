@@ -2,10 +2,14 @@ from fastapi import Depends
 from sqlmodel import select
 
 from joj.horse import models, schemas
-from joj.horse.schemas import StandardListResponse
 from joj.horse.schemas.auth import Authentication
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
 from joj.horse.utils.fastapi.router import MyRouter
-from joj.horse.utils.parser import parse_ordering_query, parse_pagination_query
+from joj.horse.utils.parser import (
+    parse_ordering_query,
+    parse_pagination_query,
+    parse_stream_query,
+)
 
 router = MyRouter()
 router_name = "problem_groups"
@@ -16,10 +20,15 @@ router_tag = "problem group"
 async def list_problem_groups(
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     auth: Authentication = Depends(),
-) -> StandardListResponse[schemas.ProblemGroup]:
+) -> ListResponse[schemas.ProblemGroup]:
     statement = select(models.ProblemGroup)
-    problem_groups, count = await models.ProblemGroup.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.ProblemGroup,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        schemas.ProblemGroup.from_orm,
     )
-    return StandardListResponse(problem_groups, count)
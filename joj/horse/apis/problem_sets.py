@@ -7,8 +7,10 @@ from joj.horse.schemas import Empty, Operation, StandardListResponse, StandardRe
 from joj.horse.schemas.auth import DomainAuthentication
 from joj.horse.schemas.permission import Permission
 from joj.horse.services.celery_app import celery_app_dependency
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
 from joj.horse.utils.fastapi.router import MyRouter
 from joj.horse.utils.parser import (
+    get_problem_by_url_or_id,
     parse_domain_from_auth,
     parse_ordering_query,
     parse_pagination_query,
@@ -16,7 +18,7 @@ from joj.horse.utils.parser import (
     parse_problem_problem_set_link,
     parse_problem_set,
     parse_problem_set_factory,
-    parse_problem_without_validation,
+    parse_stream_query,
     parse_user_from_auth,
     parse_view_hidden_problem_set,
 )
@@ -31,13 +33,18 @@ async def list_problem_sets(
     domain: models.Domain = Depends(parse_domain_from_auth),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     include_hidden: bool = Depends(parse_view_hidden_problem_set),
-) -> StandardListResponse[schemas.ProblemSet]:
+) -> ListResponse[schemas.ProblemSet]:
     statement = domain.find_problem_sets_statement(include_hidden)
-    problem_sets, count = await models.ProblemSet.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.ProblemSet,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        schemas.ProblemSet.from_orm,
     )
-    return StandardListResponse(problem_sets, count)
 
 
 @router.post("", permissions=[Permission.DomainProblemSet.create])
@@ -115,12 +122,10 @@ async def list_problems_in_problem_set(
 @router.post("/{problemSet}/problems", permissions=[Permission.DomainProblemSet.edit])
 async def add_problem_in_problem_set(
     add_problem: schemas.ProblemSetAddProblem,
-    problem_set: models.ProblemSet = Depends(
-        parse_problem_set_factory(load_links=True)
-    ),
+    problem_set: models.ProblemSet = Depends(parse_problem_set),
     domain_auth: DomainAuthentication = Depends(DomainAuthentication),
 ) -> StandardResponse[schemas.ProblemSet]:
-    problem = await parse_problem_without_validation(
+    problem = await get_problem_by_url_or_id(
         add_problem.problem, domain_auth.auth.domain
     )
     # examine problem visibility
@@ -151,9 +156,7 @@ async def get_problem_in_problem_set(
 )
 async def update_problem_in_problem_set(
     update_problem: schemas.ProblemSetUpdateProblem,
-    problem_set: models.ProblemSet = Depends(
-        parse_problem_set_factory(load_links=True)
-    ),
+    problem_set: models.ProblemSet = Depends(parse_problem_set),
     problem: models.Problem = Depends(parse_problem),
 ) -> StandardResponse[schemas.ProblemSet]:
     await problem_set.operate_problem(
@@ -166,9 +169,7 @@ async def update_problem_in_problem_set(
     "/{problemSet}/problems/{problem}", permissions=[Permission.DomainProblemSet.edit]
 )
 async def delete_problem_in_problem_set(
-    problem_set: models.ProblemSet = Depends(
-        parse_problem_set_factory(load_links=True)
-    ),
+    problem_set: models.ProblemSet = Depends(parse_problem_set),
     problem: models.Problem = Depends(parse_problem),
 ) -> StandardResponse[schemas.ProblemSet]:
     await problem_set.operate_problem(problem, Operation.Delete)
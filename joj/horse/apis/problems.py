@@ -13,14 +13,16 @@ from joj.horse.schemas.permission import Permission
 from joj.horse.services.celery_app import celery_app_dependency
 from joj.horse.services.db import db_session_dependency
 from joj.horse.services.lakefs import LakeFSProblemConfig
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
 from joj.horse.utils.fastapi.router import MyRouter
 from joj.horse.utils.parser import (
+    get_problem_by_url_or_id,
     parse_domain_from_auth,
     parse_ordering_query,
     parse_pagination_query,
     parse_problem,
-    parse_problem_without_validation,
     parse_relevant_domain_with_tag,
+    parse_stream_query,
     parse_user_from_auth,
     parse_view_hidden_problem,
 )
@@ -35,20 +37,30 @@ async def list_problems(
     domain: models.Domain = Depends(parse_domain_from_auth),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     include_hidden: bool = Depends(parse_view_hidden_problem),
     user: models.User = Depends(parse_user_from_auth),
-) -> StandardListResponse[schemas.ProblemWithLatestRecord]:
+) -> ListResponse[schemas.ProblemWithLatestRecord]:
     statement = domain.find_problems_statement(include_hidden)
-    problems, count = await models.Problem.execute_list_statement(
-        statement, ordering, pagination
-    )
-    result = await models.Problem.get_problems_with_record_states(
-        result_cls=schemas.ProblemWithLatestRecord,
-        problem_set_id=None,
-        problems=problems,
-        user_id=user.id,
+
+    async def get_problems_with_record_states(
+        problems: List[models.Problem],
+    ) -> List[schemas.ProblemWithLatestRecord]:
+        return await models.Problem.get_problems_with_record_states(
+            result_cls=schemas.ProblemWithLatestRecord,
+            problem_set_id=None,
+            problems=problems,
+            user_id=user.id,
+        )
+
+    return await stream_or_list(
+        models.Problem,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        batch_converter=get_problems_with_record_states,
     )
-    return StandardListResponse(result, count)
 
 
 @router.post("", permissions=[Permission.DomainProblem.create])
@@ -86,6 +98,7 @@ async def get_problem(
     problem: models.Problem = Depends(parse_problem),
     user: models.User = Depends(parse_user_from_auth),
 ) -> StandardResponse[schemas.ProblemDetailWithLatestRecord]:
+    await models.Problem.load_pending_counters([problem])
     record = await models.Record.get_user_latest_record(
         problem_set_id=None, problem_id=problem.id, user_id=user.id
     )
@@ -119,26 +132,23 @@ async def clone_problem(
     domain: models.Domain = Depends(parse_domain_from_auth),
     user: models.User = Depends(parse_user_from_auth),
     auth: Authentication = Depends(),
-    session: AsyncSession = Depends(db_session_dependency),
 ) -> StandardListResponse[schemas.Problem]:
     from_domain = await parse_relevant_domain_with_tag(problem_clone.from_domain)
     problems: List[models.Problem] = [
-        parse_problem(await parse_problem_without_validation(oid, from_domain), auth)
+        parse_problem(await get_problem_by_url_or_id(oid, from_domain), auth)
         for oid in problem_clone.problems
     ]
     new_group = problem_clone.new_group
 
     try:
-        res = []
+        problem_groups = []
+        new_problems = []
         for problem in problems:
             problem_group_id: Optional[UUID]
             if new_group:
                 problem_group = models.ProblemGroup()
-                # TODO: transaction (since session has already committed here)
-                await problem_group.save_model()
+                problem_groups.append(problem_group)
                 problem_group_id = problem_group.id
-                await session.refresh(problem)
-                await session.refresh(domain)
             else:
                 problem_group_id = problem.problem_group_id
             new_problem = models.Problem(
@@ -148,9 +158,14 @@ async def clone_problem(
                 content=problem.content,
                 problem_group_id=problem_group_id,
             )
-            await new_problem.save_model()
-            res.append(models.Problem.from_orm(new_problem))
+            # url_pre_save is not called by bulk_insert
+            new_problem.url = str(new_problem.id)
+            new_problems.append(new_problem)
+        await models.ProblemGroup.bulk_insert(problem_groups, commit=False)
+        new_problems = await models.Problem.bulk_insert(new_problems, returning=True)
+        for new_problem in new_problems:
             logger.info(f"problem cloned: {new_problem}")
+        res = [models.Problem.from_orm(new_problem) for new_problem in new_problems]
     except Exception as e:
         logger.exception(f"problems clone failed: {[problem for problem in problems]}")
         raise e
@@ -6,13 +6,16 @@ from fastapi import Depends, Query
 from joj.horse import models, schemas
 from joj.horse.models.permission import PermissionType, ScopeType
 from joj.horse.schemas.auth import DomainAuthentication
-from joj.horse.schemas.base import StandardListResponse, StandardResponse
-from joj.horse.utils.fastapi.router import MyRouter
+from joj.horse.schemas.base import StandardResponse
+from joj.horse.services.db import statement_timeout
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
+from joj.horse.utils.fastapi.router import MyRouter, request_deadline
 from joj.horse.utils.parser import (
     parse_domain_from_auth,
     parse_ordering_query,
     parse_pagination_query,
     parse_record,
+    parse_stream_query,
     parse_user_from_auth,
 )
 
@@ -22,6 +25,8 @@ router_tag = "record"
 
 
 @router.get("/records", permissions=[])
+@statement_timeout(10)
+@request_deadline(30)
 async def list_records_in_domain(
     domain: models.Domain = Depends(parse_domain_from_auth),
     domain_auth: DomainAuthentication = Depends(),
@@ -30,22 +35,28 @@ async def list_records_in_domain(
     submitter_id: Optional[UUID] = Query(None, description="submitter uid"),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     user: models.User = Depends(parse_user_from_auth),
-) -> StandardListResponse[schemas.RecordListDetail]:
+) -> ListResponse[schemas.RecordListDetail]:
     statement = domain.find_records_statement(problem_set, problem, submitter_id)
 
     if not domain_auth.auth.check(ScopeType.DOMAIN_RECORD, PermissionType.view):
         statement = statement.where(models.Record.committer_id == user.id)
 
-    rows, count = await models.Record.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.Record,
+        statement,
+        ordering,
+        pagination,
+        stream,
+        schemas.RecordListDetail.from_row,
+        count_strategy=schemas.CountStrategy.window,
     )
-    record_list_details = [schemas.RecordListDetail.from_row(*row) for row in rows]
-    return StandardListResponse(record_list_details, count)
 
 
 @router.get("/records/{record}", permissions=[])
 async def get_record(
-    record: schemas.RecordDetail = Depends(parse_record),
+    record: models.Record = Depends(parse_record),
 ) -> StandardResponse[schemas.RecordDetail]:
+    await record.load_archived_cases()
     return StandardResponse(schemas.RecordDetail.from_orm(record))
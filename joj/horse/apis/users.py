@@ -5,10 +5,13 @@ from fastapi import Depends, Query
 from joj.horse import models, schemas
 from joj.horse.schemas import StandardListResponse, StandardResponse
 from joj.horse.schemas.permission import Permission
+from joj.horse.utils.errors import BizError, ErrorCode
+from joj.horse.utils.fastapi.ndjson import ListResponse, stream_or_list
 from joj.horse.utils.fastapi.router import MyRouter
 from joj.horse.utils.parser import (
     parse_ordering_query,
     parse_pagination_query,
+    parse_stream_query,
     parse_uid,
 )
 
@@ -21,13 +24,21 @@ router_tag = "user"
 async def list_users(
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query(["username"])),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     query: str = Query(""),
-) -> StandardListResponse[schemas.User]:
+) -> ListResponse[schemas.User]:
     statement = models.User.find_users_statement(query)
-    problem_sets, count = await models.User.execute_list_statement(
-        statement, ordering, pagination
+    if query and not ordering.orderings:
+        # the rank is not a column of the cursor, so the results are ranked
+        # only with offset pagination, they are capped by the search anyway
+        if pagination.cursor:
+            raise BizError(
+                ErrorCode.IllegalFieldError, "cursor can not be used with search"
+            )
+        statement = models.User.apply_search_ordering(statement, query)
+    return await stream_or_list(
+        models.User, statement, ordering, pagination, stream, schemas.User.from_orm
     )
-    return StandardListResponse(problem_sets, count)
 
 
 # TODO: stricter permission for following 3 endpoints
@@ -44,13 +55,13 @@ async def list_user_domains(
     groups: Optional[List[str]] = Query(None),
     ordering: schemas.OrderingQuery = Depends(parse_ordering_query()),
     pagination: schemas.PaginationQuery = Depends(parse_pagination_query),
+    stream: bool = Depends(parse_stream_query),
     user: models.User = Depends(parse_uid),
-) -> StandardListResponse[schemas.Domain]:
+) -> ListResponse[schemas.Domain]:
     statement = user.find_domains_statement(role, groups)
-    domains, count = await models.Domain.execute_list_statement(
-        statement, ordering, pagination
+    return await stream_or_list(
+        models.Domain, statement, ordering, pagination, stream, schemas.Domain.from_orm
     )
-    return StandardListResponse(domains, count)
 
 
 @router.get("/{uid}/problems")
@@ -14,8 +14,10 @@ import joj.horse.models  # noqa: F401 lgtm [py/unused-import]
 import joj.horse.utils.monkey_patch  # noqa: F401 lgtm [py/unused-import]
 from joj.horse.config import AllSettings, UnionSettings
 from joj.horse.schemas.cache import try_init_cache
-from joj.horse.services.db import db_session_dependency, try_init_db
+from joj.horse.services.counter import run_flusher
+from joj.horse.services.db import request_db_session_dependency, try_init_db
 from joj.horse.services.lakefs import try_init_lakefs
+from joj.horse.services.tiered_cache import get_tiered_cache
 from joj.horse.utils.exception_handlers import register_exception_handlers
 from joj.horse.utils.fastapi.router import simplify_operation_ids
 from joj.horse.utils.fastapi.version import VersionedFastAPI
@@ -28,7 +30,7 @@ app = FastAPI(
     title=settings.app_name,
     version=get_version(),
     description=f"Git version: {get_git_version()}",
-    dependencies=[Depends(db_session_dependency)],
+    dependencies=[Depends(request_db_session_dependency)],
     default_response_class=ORJSONResponse,
     swagger_ui_parameters={"docExpansion": "none"},
 )
@@ -71,6 +73,13 @@ async def startup_event() -> None:  # pragma: no cover
         else:
             logger.warning("LakeFS not configured! All file features will be disabled.")
         await asyncio.gather(*initialize_tasks)
+        app.state.cache_listener = asyncio.create_task(get_tiered_cache().listen())
+        if settings.counter_flush_interval > 0:
+            flusher = run_flusher(
+                joj.horse.models.Problem.flush_counters,
+                settings.counter_flush_interval,
+            )
+            app.state.counter_flusher = asyncio.create_task(flusher)
 
     except (RetryError, LakeFSApiException) as e:
         logger.error("Initialization failed, exiting.")
@@ -78,6 +87,14 @@ async def startup_event() -> None:  # pragma: no cover
         exit(-1)
 
 
+@app.on_event("shutdown")
+async def shutdown_event() -> None:  # pragma: no cover
+    for name in ("counter_flusher", "cache_listener"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+
+
 if settings.dsn:  # pragma: no cover
     import sentry_sdk
     from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
@@ -1,11 +1,16 @@
+import base64
+import hashlib
 from datetime import datetime
 from typing import (
     TYPE_CHECKING,
     Any,
+    AsyncIterator,
     Dict,
-    Iterator,
+    Iterable,
     List,
     Optional,
+    Sequence,
+    Set,
     Tuple,
     Type,
     TypeVar,
@@ -13,15 +18,38 @@ from typing import (
 )
 from uuid import UUID, uuid4
 
+import orjson
+from loguru import logger
+from pydantic import parse_obj_as
 from pydantic.fields import Undefined
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.engine import Connection, Row
-from sqlalchemy.exc import StatementError
-from sqlalchemy.orm import Mapper
+from sqlalchemy.exc import DBAPIError, StatementError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Mapper, Session, make_transient_to_detached, object_session
 from sqlalchemy.orm.attributes import InstrumentedAttribute
-from sqlalchemy.sql.expression import Delete, Select, Update
-from sqlalchemy.sql.functions import count
+from sqlalchemy.schema import Column, Computed, Index, Table
+from sqlalchemy.sql.expression import (
+    ClauseElement,
+    ColumnElement,
+    Delete,
+    Executable,
+    Insert,
+    Select,
+    Update,
+    and_,
+    column,
+    literal_column,
+    or_,
+    tuple_,
+    values,
+)
+from sqlalchemy.sql.functions import count, func
+from sqlalchemy.util import await_only
 from sqlmodel import Field, SQLModel, delete, select, update
 from sqlmodel.engine.result import ScalarResult
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # SAWarning: Class SelectOfScalar will not make use of SQL compilation
 # caching as it does not set the 'inherit_cache' attribute to ``True``.
@@ -32,8 +60,11 @@ from sqlmodel.sql.expression import (
 )
 
 from joj.horse.schemas.base import BaseModel, UserInputURL, get_datetime_column, utcnow
-from joj.horse.services.db import db_session
+from joj.horse.schemas.query import CountStrategy
+from joj.horse.services.db import db_session, get_db_engine
+from joj.horse.services.tiered_cache import get_tiered_cache
 from joj.horse.utils.base import is_uuid
+from joj.horse.utils.errors import BizError, ErrorCode
 
 sm_SelectOfScalar.inherit_cache = True
 sm_Select.inherit_cache = True
@@ -42,6 +73,37 @@ if TYPE_CHECKING:
     from joj.horse.models.domain import Domain
     from joj.horse.schemas.query import OrderingQuery, PaginationQuery
 
+# the text search configuration of the search vectors, "simple" does not stem
+# the words, so that the problems in any language are searched in the same way
+SEARCH_CONFIG = "'simple'::regconfig"
+
+# the key in session.info of the cache keys to delete after commit
+CACHE_INVALIDATIONS = "cache_invalidations"
+
+# the ids of the rows found by url or id, None if not found
+URL_LOOKUP_NAMESPACE = "url_lookups"
+# the rows inserted by the bulk statements do not invalidate the lookups,
+# so the rows not found are only cached for a short time
+URL_LOOKUP_NEGATIVE_TTL = 60
+# the rows found expire too, so that the lookups of rarely used urls and ids
+# do not stay in redis forever
+URL_LOOKUP_TTL = 3600
+
+# (field name, column, asc), asc is None if the direction is not specified
+OrderingColumn = Tuple[str, InstrumentedAttribute, Optional[bool]]
+
+
+class explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: Select) -> None:
+        self.statement = statement
+
+
+@compiles(explain, "postgresql")
+def pg_explain(element: explain, compiler: Any, **kwargs: Any) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kwargs)
+
 
 class ORMUtils(SQLModel, BaseModel):
     def update_from_dict(self: "BaseORMModel", d: Dict[str, Any]) -> None:
@@ -82,9 +144,14 @@ class ORMUtils(SQLModel, BaseModel):
 
     @classmethod
     async def partitions(
-        cls: Type["BaseORMModelType"], size: Optional[int] = None, **kwargs: Any
-    ) -> Iterator[List["BaseORMModelType"]]:
-        return (await cls.select_exec(**kwargs)).partitions(size)
+        cls: Type["BaseORMModelType"], size: int = 1000, **kwargs: Any
+    ) -> AsyncIterator[List["BaseORMModelType"]]:
+        """
+        Iterate over the objects in lists of size with a server side cursor.
+        """
+        statement = cls.apply_filtering(select(cls), **kwargs)
+        async for objects in cls.stream_statement(statement, size):  # type: ignore
+            yield objects
 
     @classmethod
     async def first(
@@ -157,15 +224,174 @@ class ORMUtils(SQLModel, BaseModel):
             await session.run_sync(sync_func)
 
     @classmethod
-    def apply_ordering(
+    def get_bulk_columns(cls) -> List[Column]:
+        # generated columns can not be written, and they are not mapped
+        return [
+            col for col in cls.__table__.columns if col.computed is None  # type: ignore
+        ]
+
+    @classmethod
+    def get_bulk_values(
+        cls: Type["BaseORMModelType"], objects: Sequence["BaseORMModelType"]
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the column values of the objects for a multi-row insert,
+        None is replaced with DEFAULT in the columns with server defaults.
+        """
+        columns = cls.get_bulk_columns()
+        rows = []
+        for obj in objects:
+            row = {}
+            for col in columns:
+                value = getattr(obj, col.name)
+                if value is None and col.server_default is not None:
+                    value = literal_column("DEFAULT")
+                row[col.name] = value
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def get_bulk_invalidations(
+        cls: Type["BaseORMModelType"], objects: Sequence["BaseORMModelType"]
+    ) -> Dict[str, Set[str]]:
+        """
+        Get the cache keys (by namespace) invalidated by a bulk write of the
+        objects, they replace the invalidations of the skipped mapper events.
+        """
+        return {}
+
+    @classmethod
+    async def execute_bulk_statement(
+        cls: Type["BaseORMModelType"],
+        statement: Union[Insert, Update],
+        objects: Sequence["BaseORMModelType"],
+        returning: bool,
+        commit: bool,
+    ) -> List["BaseORMModelType"]:
+        async with db_session() as session:
+            for namespace, keys in cls.get_bulk_invalidations(objects).items():
+                add_cache_invalidations(session.sync_session, namespace, keys)
+            if returning:
+                statement = statement.returning(cls)  # type: ignore
+                # the returned rows replace the objects loaded in the session
+                statement = (
+                    select(cls)
+                    .from_statement(statement)
+                    .execution_options(populate_existing=True)
+                )
+                result = await session.execute(statement)
+                objects = result.scalars().all()
+            else:
+                await session.execute(statement)
+                objects = []
+            if commit:
+                # the returned objects are loaded, keep them from being expired
+                for obj in objects:
+                    session.expunge(obj)
+                await session.commit()
+                session.add_all(objects)
+        return objects
+
+    @classmethod
+    async def bulk_insert(
+        cls: Type["BaseORMModelType"],
+        objects: Sequence["BaseORMModelType"],
+        returning: bool = False,
+        commit: bool = True,
+    ) -> List["BaseORMModelType"]:
+        """
+        Insert the objects with a single statement. Mapper events are not
+        triggered and the objects are not refreshed, the inserted rows are
+        returned as new objects if returning is set.
+        """
+        if not objects:
+            return []
+        statement = postgresql.insert(cls).values(cls.get_bulk_values(objects))
+        return await cls.execute_bulk_statement(statement, objects, returning, commit)
+
+    @classmethod
+    async def bulk_upsert(
+        cls: Type["BaseORMModelType"],
+        objects: Sequence["BaseORMModelType"],
+        index_elements: Sequence[str],
+        update_fields: Optional[Sequence[str]] = None,
+        index_where: Optional[ClauseElement] = None,
+        returning: bool = False,
+        commit: bool = True,
+    ) -> List["BaseORMModelType"]:
+        """
+        Insert the objects with a single statement, the rows conflicting on
+        index_elements are updated with update_fields (all the fields except
+        id, created_at and index_elements by default), or skipped if
+        update_fields is empty. Skipped rows are not returned.
+        """
+        if not objects:
+            return []
+        columns = cls.get_bulk_columns()
+        statement = postgresql.insert(cls).values(cls.get_bulk_values(objects))
+        if update_fields is None:
+            update_fields = [
+                col.name
+                for col in columns
+                if col.name not in ("id", "created_at", "updated_at")
+                and col.name not in index_elements
+            ]
+        if update_fields:
+            set_ = {field: statement.excluded[field] for field in update_fields}
+            if "updated_at" in cls.__table__.columns:  # type: ignore
+                set_["updated_at"] = utcnow()
+            statement = statement.on_conflict_do_update(
+                index_elements=index_elements, index_where=index_where, set_=set_
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=index_elements, index_where=index_where
+            )
+        return await cls.execute_bulk_statement(statement, objects, returning, commit)
+
+    @classmethod
+    async def bulk_update(
+        cls: Type["BaseORMModelType"],
+        objects: Sequence["BaseORMModelType"],
+        fields: Sequence[str],
+        returning: bool = False,
+        commit: bool = True,
+    ) -> List["BaseORMModelType"]:
+        """
+        Update the fields of the objects with a single statement,
+        the rows are matched by the primary key.
+        """
+        if not objects or not fields:
+            return []
+        table = cls.__table__  # type: ignore
+        keys = [col.name for col in table.primary_key]
+        names = [*keys, *fields]
+        objects_values = values(
+            *(column(name, table.c[name].type) for name in names),
+            name="objects",
+        ).data([tuple(getattr(obj, name) for name in names) for obj in objects])
+        statement = (
+            update(cls)
+            .where(and_(*(table.c[key] == objects_values.c[key] for key in keys)))
+            .values({field: objects_values.c[field] for field in fields})
+            .execution_options(synchronize_session=False)
+        )
+        return await cls.execute_bulk_statement(statement, objects, returning, commit)
+
+    @classmethod
+    def get_ordering_columns(
         cls,
-        statement: Select,
         ordering: Optional["OrderingQuery"],
-    ) -> Select:
-        if ordering is None or not ordering.orderings:
-            return statement
-        order_by_clause = []
-        for x in ordering.orderings:
+        stable: bool = False,
+    ) -> List[OrderingColumn]:
+        """
+        Parse the ordering query into (field, column, asc) tuples.
+        If stable is set, id is appended as the tie-breaker so that
+        the ordering columns form a unique sort key.
+        """
+        columns: List[OrderingColumn] = []
+        orderings = ordering.orderings if ordering is not None else []
+        for x in orderings:
             asc: Optional[bool] = None
             if x.startswith("-"):
                 asc = False
@@ -180,16 +406,136 @@ class ORMUtils(SQLModel, BaseModel):
                 continue
             sa_column = getattr(cls, field, None)
             if sa_column is not None and isinstance(sa_column, InstrumentedAttribute):
-                if asc is None:
-                    order_by_clause.append(sa_column)
-                elif asc:
-                    order_by_clause.append(sa_column.asc())
-                else:
-                    order_by_clause.append(sa_column.desc())
+                columns.append((field, sa_column, asc))
+        if stable and all(field != "id" for field, _, _ in columns):
+            id_column = getattr(cls, "id", None)
+            if isinstance(id_column, InstrumentedAttribute):
+                # follow the direction of the last column to keep a single index scan
+                asc = columns[-1][2] if columns else None
+                columns.append(("id", id_column, asc))
+        return columns
+
+    @classmethod
+    def apply_ordering(
+        cls,
+        statement: Select,
+        ordering: Optional["OrderingQuery"],
+        stable: bool = False,
+    ) -> Select:
+        order_by_clause = []
+        for _, sa_column, asc in cls.get_ordering_columns(ordering, stable):
+            if asc is None:
+                order_by_clause.append(sa_column)
+            elif asc:
+                order_by_clause.append(sa_column.asc())
+            else:
+                order_by_clause.append(sa_column.desc())
         if len(order_by_clause) > 0:
             statement = statement.order_by(*order_by_clause)
         return statement
 
+    @staticmethod
+    def _get_cursor_key(field: str, asc: Optional[bool]) -> str:
+        return f"-{field}" if asc is False else field
+
+    @classmethod
+    def encode_cursor(
+        cls,
+        columns: List[OrderingColumn],
+        row: Any,
+    ) -> str:
+        """
+        Encode the ordering values of the last row of a page. The rows must
+        contain the ordering columns, otherwise the following pages can not
+        be found and ValueError is raised.
+        """
+        if isinstance(row, cls):
+            values = [getattr(row, field) for field, _, _ in columns]
+        else:
+            entity = next((x for x in row if isinstance(x, cls)), None)
+            if entity is not None:
+                values = [getattr(entity, field) for field, _, _ in columns]
+            else:
+                # column projection, the columns are keyed by field names
+                try:
+                    values = [row._mapping[field] for field, _, _ in columns]
+                except KeyError:
+                    raise ValueError("the ordering columns are not selected")
+        payload = [
+            [cls._get_cursor_key(field, asc), value]
+            for (field, _, asc), value in zip(columns, values)
+        ]
+        return base64.urlsafe_b64encode(orjson.dumps(payload)).decode()
+
+    @classmethod
+    def decode_cursor(
+        cls,
+        columns: List[OrderingColumn],
+        cursor: str,
+    ) -> List[Any]:
+        try:
+            payload = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+            keys = [key for key, _ in payload]
+            if keys != [cls._get_cursor_key(field, asc) for field, _, asc in columns]:
+                raise ValueError("cursor does not match the ordering")
+            values = []
+            for (field, _, _), (_, value) in zip(columns, payload):
+                if value is not None:
+                    value = parse_obj_as(cls.__fields__[field].outer_type_, value)
+                values.append(value)
+            return values
+        except (ValueError, TypeError, KeyError):
+            raise BizError(ErrorCode.IllegalFieldError, "invalid pagination cursor")
+
+    @staticmethod
+    def get_keyset_clause(
+        columns: List[OrderingColumn],
+        values: List[Any],
+    ) -> ClauseElement:
+        """
+        The rows after the cursor values in the ordering. NULL is sorted as
+        the largest value, i.e. last in ascending and first in descending
+        orderings, the same as the defaults of PostgreSQL.
+        """
+        directions = {asc is not False for _, _, asc in columns}
+        nullable = any(value is None for value in values) or any(
+            getattr(sa_column.expression, "nullable", True)
+            for _, sa_column, _ in columns
+        )
+        if len(directions) == 1 and not nullable:
+            # row value comparison can be served by a single index scan
+            left = tuple_(*(sa_column for _, sa_column, _ in columns))
+            right = tuple_(*values)
+            asc = directions.pop()
+            clause = left > right if asc else left < right
+            # the planner can only prune partitions by a bound on a single column
+            _, first_column, _ = columns[0]
+            first_bound = (
+                first_column >= values[0] if asc else first_column <= values[0]
+            )
+            return and_(first_bound, clause)
+        # row value comparisons are NULL if any of the values is NULL
+        clauses = []
+        for i, (_, sa_column, asc) in enumerate(columns):
+            value = values[i]
+            if asc is False:
+                after = sa_column.is_not(None) if value is None else sa_column < value
+            elif value is None:
+                # nothing is after NULL in ascending orderings
+                continue
+            elif getattr(sa_column.expression, "nullable", True):
+                after = or_(sa_column > value, sa_column.is_(None))
+            else:
+                after = sa_column > value
+            conditions = [
+                prev_column.is_(None)
+                if prev_value is None
+                else prev_column == prev_value
+                for (_, prev_column, _), prev_value in zip(columns[:i], values[:i])
+            ]
+            clauses.append(and_(*conditions, after))
+        return or_(*clauses)
+
     @classmethod
     def apply_count(
         cls,
@@ -198,17 +544,28 @@ class ORMUtils(SQLModel, BaseModel):
     ) -> Select:
         # if alt_cls is None:
         #     alt_cls = cls
-        return statement.with_only_columns(count(), maintain_column_froms=True)
+        # the ordering of the statement, e.g. a search rank, is not grouped
+        return statement.with_only_columns(
+            count(), maintain_column_froms=True
+        ).order_by(None)
 
     @classmethod
     def apply_pagination(
         cls,
         statement: Select,
         pagination: Optional["PaginationQuery"],
+        ordering: Optional["OrderingQuery"] = None,
     ) -> Select:
-        if pagination is not None:
-            statement = statement.offset(pagination.offset).limit(pagination.limit)
-        return statement
+        if pagination is None:
+            return statement
+        if pagination.cursor:
+            # keyset pagination, must be used with apply_ordering(stable=True)
+            columns = cls.get_ordering_columns(ordering, stable=True)
+            values = cls.decode_cursor(columns, pagination.cursor)
+            statement = statement.where(cls.get_keyset_clause(columns, values))
+        else:
+            statement = statement.offset(pagination.offset)
+        return statement.limit(pagination.limit)
 
     @classmethod
     def apply_filtering(
@@ -221,27 +578,147 @@ class ORMUtils(SQLModel, BaseModel):
             statement = statement.where(getattr(__base_orm_model_cls__, k) == v)
         return statement
 
+    @staticmethod
+    def get_count_cache_key(statement: Select) -> str:
+        compiled = statement.compile(dialect=postgresql.dialect())
+        params = sorted((k, str(v)) for k, v in compiled.params.items())
+        return hashlib.sha1(f"{compiled}{params}".encode()).hexdigest()
+
+    @classmethod
+    async def execute_count_statement(
+        cls,
+        session: AsyncSession,
+        statement: Select,
+        count_strategy: CountStrategy = CountStrategy.exact,
+        cache_ttl: int = 60,
+    ) -> Optional[int]:
+        if count_strategy == CountStrategy.skipped:
+            return None
+        if count_strategy == CountStrategy.estimated:
+            result = await session.execute(explain(statement))
+            plan = result.scalar_one()
+            if isinstance(plan, (str, bytes)):
+                plan = orjson.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+
+        async def count() -> int:
+            row_count = await session.exec(cls.apply_count(statement))
+            value = row_count.one()
+            if not isinstance(value, int):
+                value = value[0]
+            return value
+
+        if count_strategy == CountStrategy.cached:
+            # the hot counts are refreshed early by one caller
+            return await get_tiered_cache().get_or_load(
+                cls.get_count_cache_key(statement), "list_count", count, cache_ttl
+            )
+        return await count()
+
     @classmethod
     async def execute_list_statement(
         cls,
         statement: Select,
         ordering: Optional["OrderingQuery"] = None,
         pagination: Optional["PaginationQuery"] = None,
-    ) -> Tuple[Union[List["BaseORMModelType"], List[Row]], int]:
-        count_statement = cls.apply_count(statement)
-        statement = cls.apply_ordering(statement, ordering)
-        statement = cls.apply_pagination(statement, pagination)
+        count_strategy: CountStrategy = CountStrategy.exact,
+        cache_ttl: int = 60,
+    ) -> Tuple[
+        Union[List["BaseORMModelType"], List[Row]], Optional[int], Optional[str]
+    ]:
+        """
+        Execute the list statement with ordering and pagination.
+        Returns (rows, count, next_cursor), count is None if it is skipped.
+
+        The window strategy must not be used with distinct statements,
+        because the window function is evaluated before the distinct.
+        """
+        if pagination is not None and not pagination.count:
+            count_strategy = CountStrategy.skipped
+        if count_strategy == CountStrategy.window and (
+            pagination is None or pagination.cursor
+        ):
+            # the keyset predicate is evaluated before the window function
+            count_strategy = CountStrategy.exact
+        list_statement = cls.apply_ordering(
+            statement, ordering, stable=pagination is not None
+        )
+        list_statement = cls.apply_pagination(list_statement, pagination, ordering)
+        if pagination is not None:
+            # fetch one more row to find out whether there is a next page
+            list_statement = list_statement.limit(pagination.limit + 1)
 
         async with db_session() as session:
             try:
-                row_count = await session.exec(count_statement)
-                results = await session.exec(statement)
+                if count_strategy == CountStrategy.window:
+                    results = await session.execute(
+                        list_statement.add_columns(count().over())
+                    )
+                    # split the count column without losing the row keys
+                    frozen_results = results.freeze()
+                    count_index = len(results.keys()) - 1
+                    if isinstance(statement, sm_SelectOfScalar):
+                        rows = frozen_results().scalars().all()
+                    else:
+                        rows = frozen_results().columns(*range(count_index)).all()
+                    if len(rows) > 0:
+                        row_count: Optional[int] = (
+                            frozen_results().scalars(count_index).first()
+                        )
+                    elif pagination is not None and pagination.offset > 0:
+                        row_count = await cls.execute_count_statement(
+                            session, statement
+                        )
+                    else:
+                        row_count = 0
+                else:
+                    row_count = await cls.execute_count_statement(
+                        session, statement, count_strategy, cache_ttl
+                    )
+                    rows = (await session.exec(list_statement)).all()
+            except DBAPIError:
+                # the errors of the database, such as the statement timeout
+                raise
             except StatementError:
-                return [], 0
-            row_count_value = row_count.one()
-            if not isinstance(row_count_value, int):
-                row_count_value = row_count_value[0]
-            return results.all(), row_count_value
+                # the parameters can not be bound, e.g. an invalid id
+                return [], 0, None
+            next_cursor = None
+            if pagination is not None and 0 < pagination.limit < len(rows):
+                rows = rows[: pagination.limit]
+                columns = cls.get_ordering_columns(ordering, stable=True)
+                next_cursor = cls.encode_cursor(columns, rows[-1])
+            return rows, row_count, next_cursor
+
+    @classmethod
+    async def stream_statement(
+        cls, statement: Select, size: int = 1000
+    ) -> AsyncIterator[Union[List["BaseORMModelType"], List[Row]]]:
+        """
+        Execute the statement with a server side cursor, only size rows are
+        fetched and kept in memory at a time.
+        """
+        statement = statement.execution_options(yield_per=size)
+        async with db_session() as session:
+            result = await session.stream(statement)
+            if isinstance(statement, sm_SelectOfScalar):
+                result = result.scalars()
+            async for rows in result.partitions(size):
+                yield rows
+
+    @classmethod
+    async def stream_list_statement(
+        cls,
+        statement: Select,
+        ordering: Optional["OrderingQuery"] = None,
+        size: int = 1000,
+    ) -> AsyncIterator[Union[List["BaseORMModelType"], List[Row]]]:
+        """
+        Stream all the rows of the list statement with the ordering in lists of size,
+        the rows are in the same order as the pages of execute_list_statement.
+        """
+        list_statement = cls.apply_ordering(statement, ordering, stable=True)
+        async for rows in cls.stream_statement(list_statement, size):
+            yield rows
 
     @staticmethod
     def parse_rows(
@@ -255,16 +732,54 @@ class ORMUtils(SQLModel, BaseModel):
 class BaseORMModel(ORMUtils):
     id: UUID = Field(default_factory=uuid4, primary_key=True, nullable=False)
     created_at: Optional[datetime] = Field(
-        None, sa_column=get_datetime_column(index=True, server_default=utcnow())
+        None, sa_column=get_datetime_column(server_default=utcnow())
     )
     updated_at: Optional[datetime] = Field(
         None,
-        sa_column=get_datetime_column(
-            index=True, server_default=utcnow(), onupdate=utcnow()
-        ),
+        sa_column=get_datetime_column(server_default=utcnow(), onupdate=utcnow()),
     )
 
 
+def get_timestamp_indexes(table_name: str) -> Tuple[Index, Index]:
+    """
+    Single column indexes on the timestamps, add them to __table_args__
+    of the models listed by created_at or updated_at without other filters.
+    """
+    return (
+        Index(f"ix_{table_name}_created_at", "created_at"),
+        Index(f"ix_{table_name}_updated_at", "updated_at"),
+    )
+
+
+def add_search_vector(table: Table, weights: Dict[str, str]) -> Column:
+    """
+    Add a generated tsvector column search_vector with a GIN index to the table,
+    weights maps the text columns to the weights ("A" to "D") of their lexemes.
+    The column is not mapped to the model, use table.c.search_vector in queries.
+    """
+    documents = [
+        f"setweight(to_tsvector({SEARCH_CONFIG}, coalesce({name}, '')), '{weight}')"
+        for name, weight in weights.items()
+    ]
+    search_vector = Column(
+        "search_vector",
+        postgresql.TSVECTOR,
+        Computed(" || ".join(documents), persisted=True),
+        nullable=True,
+    )
+    table.append_column(search_vector)
+    Index(f"ix_{table.name}_search_vector", search_vector, postgresql_using="gin")
+    return search_vector
+
+
+def get_search_query(query: str) -> ColumnElement:
+    """
+    Parse the query with the syntax of web search engines,
+    e.g. quoted phrases, "or" and "-" for negation.
+    """
+    return func.websearch_to_tsquery(literal_column(SEARCH_CONFIG), query)
+
+
 BaseORMModelType = TypeVar("BaseORMModelType", bound=ORMUtils)
 
 
@@ -276,17 +791,87 @@ class URLORMModel(BaseORMModel):
     url: str = Field(..., index=True, nullable=False, sa_column_kwargs={"unique": True})
 
     @classmethod
-    async def find_by_url_or_id(cls, url_or_id: str) -> Optional["BaseORMModelType"]:
+    def get_url_or_id_clause(cls, url_or_id: str) -> ColumnElement:
         if is_uuid(url_or_id):
-            statement = select(cls).where(cls.id == url_or_id)
-        else:
-            statement = select(cls).where(cls.url == url_or_id)
+            return cls.id == url_or_id
+        return cls.url == url_or_id
+
+    @classmethod
+    def get_url_lookup_key(cls, domain_id: Optional[UUID], url_or_id: str) -> str:
+        return f"{cls.__tablename__}:{domain_id or ''}:{url_or_id}"
+
+    def get_url_lookup_keys(self) -> List[str]:
+        """
+        The keys of the lookups of this row, including the old url if changed.
+        """
+        domain_id = getattr(self, "domain_id", None)
+        urls = {str(self.id), self.url}
+        history = sa_inspect(self).attrs.url.history
+        urls.update(url for url in history.deleted or () if url)
+        return [self.get_url_lookup_key(domain_id, url) for url in urls if url]
+
+    @classmethod
+    async def find_by_url_lookup(
+        cls,
+        domain_id: Optional[UUID],
+        url_or_id: str,
+        options: Any = None,
+    ) -> Optional["BaseORMModelType"]:
+        """
+        Find the row by url or id in the domain (if any), the id of the row or
+        its absence is cached, so that the found rows are loaded by id (from
+        the identity map of the session if loaded before) and the rows not
+        found are not queried again.
+        """
+        cache = get_tiered_cache()
+        key = cls.get_url_lookup_key(domain_id, url_or_id)
+        value = await cache.get(key, namespace=URL_LOOKUP_NAMESPACE)
+        if value is not None and value["id"] is None:
+            return None
+        if options is not None and not isinstance(options, list):
+            options = [options]
         async with db_session() as session:
+            if value is not None:
+                result = await session.get(cls, UUID(str(value["id"])), options=options)
+                # the url may have been taken by another row since cached
+                if (
+                    result is not None
+                    and getattr(result, "domain_id", None) == domain_id
+                    and (is_uuid(url_or_id) or result.url == url_or_id)
+                ):
+                    return result
+            statement = select(cls).where(cls.get_url_or_id_clause(url_or_id))
+            if domain_id is not None:
+                statement = statement.where(cls.domain_id == domain_id)
+            if options:
+                statement = statement.options(*options)
             try:
-                result = await session.exec(statement)
+                result = (await session.exec(statement)).one_or_none()
+            except DBAPIError:
+                raise
             except StatementError:
                 return None
-            return result.one_or_none()
+            # the replicas may not have the rows just inserted yet
+            cache_negative = session.bind is get_db_engine()
+        if result is not None:
+            await cache.set(
+                key,
+                {"id": result.id},
+                namespace=URL_LOOKUP_NAMESPACE,
+                ttl=URL_LOOKUP_TTL,
+            )
+        elif cache_negative:
+            await cache.set(
+                key,
+                {"id": None},
+                namespace=URL_LOOKUP_NAMESPACE,
+                ttl=URL_LOOKUP_NEGATIVE_TTL,
+            )
+        return result
+
+    @classmethod
+    async def find_by_url_or_id(cls, url_or_id: str) -> Optional["BaseORMModelType"]:
+        return await cls.find_by_url_lookup(None, url_or_id)
 
 
 class DomainURLORMModel(URLORMModel):
@@ -302,29 +887,73 @@ class DomainURLORMModel(URLORMModel):
         url_or_id: str,
         options: Any = None,
     ) -> Optional["BaseORMModelType"]:
-        if is_uuid(url_or_id):
-            statement = (
-                select(cls).where(cls.id == url_or_id).where(cls.domain_id == domain.id)
-            )
-        else:
-            statement = (
-                select(cls)
-                .where(cls.url == url_or_id)
-                .where(cls.domain_id == domain.id)
-            )
-        if options:
-            if isinstance(options, list):
-                statement = statement.options(*options)
-            else:
-                statement = statement.options(options)
-        async with db_session() as session:
-            try:
-                result = await session.exec(statement)
-            except StatementError:
-                return None
-            return result.one_or_none()
+        return await cls.find_by_url_lookup(domain.id, url_or_id, options)
+
+
+async def merge_cached_model(
+    session: AsyncSession, model: Type["BaseORMModelType"], data: Optional[Dict]
+) -> Optional["BaseORMModelType"]:
+    """
+    Merge the row cached as a dict into the session without loading it,
+    the row must not have been changed since it was cached.
+    """
+    if data is None:
+        return None
+    instance = model.validate(data)
+    make_transient_to_detached(instance)
+    return await session.merge(instance, load=False)
+
+
+def invalidate_cache_after_commit(
+    target: SQLModel, namespace: str, keys: Iterable[str]
+) -> None:
+    """
+    Collect the cache keys invalidated by the changes of the target in its
+    session, they are deleted after the session commits, so that the old
+    values can not be cached again from the uncommitted rows.
+    """
+    session = object_session(target)
+    if session is not None:
+        add_cache_invalidations(session, namespace, keys)
+
+
+def add_cache_invalidations(
+    session: Session, namespace: str, keys: Iterable[str]
+) -> None:
+    invalidations = session.info.setdefault(CACHE_INVALIDATIONS, {})
+    invalidations.setdefault(namespace, set()).update(keys)
+
+
+def invalidate_url_lookups(
+    mapper: Mapper, connection: Connection, target: URLORMModel
+) -> None:
+    invalidate_cache_after_commit(
+        target, URL_LOOKUP_NAMESPACE, target.get_url_lookup_keys()
+    )
 
 
 def url_pre_save(mapper: Mapper, connection: Connection, target: URLORMModel) -> None:
     if not target.url:
         target.url = str(target.id)
+    if sa_inspect(target).attrs.url.history.has_changes():
+        invalidate_url_lookups(mapper, connection, target)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_cache_on_commit(session: Session) -> None:
+    invalidations = session.info.pop(CACHE_INVALIDATIONS, None)
+    if not invalidations:
+        return
+    cache = get_tiered_cache()
+    for namespace, keys in invalidations.items():
+        try:
+            # the session is committed by the async session in a greenlet
+            await_only(cache.multi_delete(list(keys), namespace=namespace))
+        except Exception as e:
+            logger.error(f"error when invalidating the cache of {namespace}:")
+            logger.exception(e)
+
+
+@event.listens_for(Session, "after_rollback")
+def invalidate_cache_on_rollback(session: Session) -> None:
+    session.info.pop(CACHE_INVALIDATIONS, None)
@@ -1,15 +1,63 @@
-from typing import TYPE_CHECKING, List, Optional
-from uuid import UUID
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set, Tuple
+from uuid import UUID, uuid4
 
 from sqlalchemy import event
-from sqlalchemy.orm import defer
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.exc import DBAPIError, StatementError
+from sqlalchemy.orm import Mapper
 from sqlalchemy.schema import Column, ForeignKey
-from sqlalchemy.sql.expression import Select, or_, true
+from sqlalchemy.sql.expression import (
+    Select,
+    Subquery,
+    and_,
+    exists,
+    func,
+    literal,
+    literal_column,
+    true,
+    union_all,
+)
 from sqlmodel import Field, Relationship, select
 from sqlmodel.sql.sqltypes import GUID
 
-from joj.horse.models.base import URLORMModel, url_pre_save
-from joj.horse.schemas.domain import DomainDetail
+from joj.horse.models.base import (
+    SEARCH_CONFIG,
+    URL_LOOKUP_NAMESPACE,
+    URL_LOOKUP_NEGATIVE_TTL,
+    URL_LOOKUP_TTL,
+    URLORMModel,
+    get_search_query,
+    get_timestamp_indexes,
+    invalidate_cache_after_commit,
+    invalidate_url_lookups,
+    merge_cached_model,
+    url_pre_save,
+)
+from joj.horse.models.permission import DefaultRole
+from joj.horse.schemas.domain import (
+    SEARCH_HEADLINE_START,
+    SEARCH_HEADLINE_STOP,
+    DomainDetail,
+    DomainSearchResultType,
+)
+from joj.horse.schemas.record import RecordListDetail
+from joj.horse.services.db import db_session, get_db_engine
+from joj.horse.services.tiered_cache import get_tiered_cache
+
+# the domain user and role of (domain, user), see Domain.get_auth_cache_key,
+# they are invalidated by the mapper events and bulk writes of domain users
+# and roles, and by the deletion of users (whose domain users are deleted by
+# ON DELETE CASCADE). Other writes skipping the ORM, such as raw statements,
+# are visible after DOMAIN_AUTH_TTL at most.
+DOMAIN_AUTH_NAMESPACE = "domain_auth"
+DOMAIN_AUTH_VERSION = "domain_auth_versions"
+DOMAIN_AUTH_TTL = 3600
+
+# a few fragments of the content around the matches
+SEARCH_HEADLINE_OPTIONS = (
+    f"StartSel={SEARCH_HEADLINE_START}, StopSel={SEARCH_HEADLINE_STOP}, "
+    "MaxFragments=2, MaxWords=20, MinWords=5"
+)
 
 if TYPE_CHECKING:
     from joj.horse.models import (
@@ -20,10 +68,12 @@ if TYPE_CHECKING:
         ProblemSet,
         User,
     )
+    from joj.horse.schemas.query import PaginationQuery
 
 
 class Domain(URLORMModel, DomainDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "domains"
+    __table_args__ = get_timestamp_indexes("domains")
 
     owner_id: UUID = Field(
         sa_column=Column(
@@ -38,6 +88,168 @@ class Domain(URLORMModel, DomainDetail, table=True):  # type: ignore[call-arg]
     problems: List["Problem"] = Relationship(back_populates="domain")
     problem_sets: List["ProblemSet"] = Relationship(back_populates="domain")
 
+    @classmethod
+    async def get_auth_cache_key(cls, domain_id: Any, user_id: Optional[str]) -> str:
+        """
+        The key of the domain user and role of user_id in the domain, it
+        contains the version of the domain, which is replaced whenever a
+        domain user or role of the domain changes.
+        """
+        cache = get_tiered_cache()
+        version = await cache.get(str(domain_id), namespace=DOMAIN_AUTH_VERSION)
+        if version is None:
+            version = uuid4().hex
+            await cache.set(
+                str(domain_id),
+                version,
+                namespace=DOMAIN_AUTH_VERSION,
+                ttl=DOMAIN_AUTH_TTL,
+            )
+        return f"{domain_id}:{version}:{user_id or ''}"
+
+    @classmethod
+    async def find_route_entities(
+        cls,
+        domain: str,
+        user_id: Optional[str],
+        problem_set: Optional[str] = None,
+        problem: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Load the domain, the domain user of user_id and its domain role, the
+        problem set, the problem and the link between them with a single
+        statement, from the urls or ids in the path of a route. The values
+        are None if they are not found or not given.
+
+        The domain user and role are cached per (domain, user) once the id of
+        the domain is cached, and are merged into the session from the cache
+        instead of being joined.
+        """
+        from joj.horse import models
+
+        cache = get_tiered_cache()
+        key = cls.get_url_lookup_key(None, domain)
+        value = await cache.get(key, namespace=URL_LOOKUP_NAMESPACE)
+        auth_key = ""
+        auth = None
+        if value is not None and value["id"] is not None:
+            # the version is read before the rows, so that the rows changed
+            # in between are never cached with the new version
+            auth_key = await cls.get_auth_cache_key(value["id"], user_id)
+            auth = await cache.get(auth_key, namespace=DOMAIN_AUTH_NAMESPACE)
+
+        entities: Dict[str, Any] = {"domain": cls}
+        joins = []
+        role = literal(str(DefaultRole.GUEST))
+        if user_id is not None and auth is None:
+            entities["domain_user"] = models.DomainUser
+            joins.append(
+                (
+                    models.DomainUser,
+                    and_(
+                        models.DomainUser.domain_id == cls.id,
+                        models.DomainUser.user_id == user_id,
+                    ),
+                )
+            )
+            role = func.coalesce(models.DomainUser.role, role)
+        if auth is None:
+            entities["domain_role"] = models.DomainRole
+            joins.append(
+                (
+                    models.DomainRole,
+                    and_(
+                        models.DomainRole.domain_id == cls.id,
+                        models.DomainRole.role == role,
+                    ),
+                )
+            )
+        if problem_set is not None:
+            entities["problem_set"] = models.ProblemSet
+            joins.append(
+                (
+                    models.ProblemSet,
+                    and_(
+                        models.ProblemSet.domain_id == cls.id,
+                        models.ProblemSet.get_url_or_id_clause(problem_set),
+                    ),
+                )
+            )
+        if problem is not None:
+            entities["problem"] = models.Problem
+            joins.append(
+                (
+                    models.Problem,
+                    and_(
+                        models.Problem.domain_id == cls.id,
+                        models.Problem.get_url_or_id_clause(problem),
+                    ),
+                )
+            )
+        if problem_set is not None and problem is not None:
+            entities["problem_problem_set_link"] = models.ProblemProblemSetLink
+            joins.append(
+                (
+                    models.ProblemProblemSetLink,
+                    and_(
+                        models.ProblemProblemSetLink.problem_set_id
+                        == models.ProblemSet.id,
+                        models.ProblemProblemSetLink.problem_id == models.Problem.id,
+                    ),
+                )
+            )
+        # the domains not found are cached by the url lookups
+        if value is not None and value["id"] is None:
+            return {name: None for name in entities}
+        statement = select(*entities.values()).select_from(cls)  # type: ignore
+        for target, onclause in joins:
+            statement = statement.outerjoin(target, onclause)
+        statement = statement.where(cls.get_url_or_id_clause(domain))
+        async with db_session() as session:
+            try:
+                row = (await session.execute(statement)).first()
+            except DBAPIError:
+                raise
+            except StatementError:
+                # not cached, only the rows not found are
+                return {name: None for name in entities}
+            cache_negative = session.bind is get_db_engine()
+            result = dict(zip(entities, row)) if row is not None else None
+            if result is not None and auth is not None:
+                if user_id is not None:
+                    result["domain_user"] = await merge_cached_model(
+                        session, models.DomainUser, auth["domain_user"]
+                    )
+                result["domain_role"] = await merge_cached_model(
+                    session, models.DomainRole, auth["domain_role"]
+                )
+        if result is None:
+            if cache_negative:
+                await cache.set(
+                    key,
+                    {"id": None},
+                    namespace=URL_LOOKUP_NAMESPACE,
+                    ttl=URL_LOOKUP_NEGATIVE_TTL,
+                )
+            return {name: None for name in entities}
+        if value is None:
+            await cache.set(
+                key,
+                {"id": row[0].id},
+                namespace=URL_LOOKUP_NAMESPACE,
+                ttl=URL_LOOKUP_TTL,
+            )
+        elif auth is None and str(row[0].id) == str(value["id"]):
+            auth = {
+                name: result[name].dict() if result[name] is not None else None
+                for name in ("domain_user", "domain_role")
+                if name in result
+            }
+            await cache.set(
+                auth_key, auth, namespace=DOMAIN_AUTH_NAMESPACE, ttl=DOMAIN_AUTH_TTL
+            )
+        return result
+
     def find_problem_sets_statement(self, include_hidden: bool) -> Select:
         from joj.horse import models
 
@@ -48,6 +260,96 @@ class Domain(URLORMModel, DomainDetail, table=True):  # type: ignore[call-arg]
             statement = statement.where(models.ProblemSet.hidden != true())
         return statement
 
+    def find_search_statement(
+        self,
+        query: str,
+        include_hidden_problems: bool,
+        include_hidden_problem_sets: bool,
+    ) -> Subquery:
+        """
+        Match the problems and problem sets against the query with the search
+        vectors of their title and content, the rows have the columns
+        (type, id, url, title, hidden, rank, content).
+        """
+        from joj.horse import models
+
+        search_query = get_search_query(query)
+        statements = []
+        for model, type_, include_hidden in (
+            (models.Problem, DomainSearchResultType.problem, include_hidden_problems),
+            (
+                models.ProblemSet,
+                DomainSearchResultType.problem_set,
+                include_hidden_problem_sets,
+            ),
+        ):
+            search_vector = model.__table__.c.search_vector  # type: ignore[attr-defined]
+            statement = select(
+                literal(str(type_)).label("type"),
+                model.id,
+                model.url,
+                model.title,
+                model.hidden,
+                func.ts_rank(search_vector, search_query).label("rank"),
+                model.content,
+            ).where(
+                model.domain_id == self.id,
+                search_vector.op("@@")(search_query),
+            )
+            if not include_hidden:
+                statement = statement.where(model.hidden != true())
+            statements.append(statement)
+        return union_all(*statements).subquery("search")
+
+    async def search(
+        self,
+        query: str,
+        include_hidden_problems: bool,
+        include_hidden_problem_sets: bool,
+        pagination: "PaginationQuery",
+    ) -> Tuple[List[Row], Optional[int]]:
+        """
+        Search the problems and problem sets ranked by the relevance,
+        returns (rows, count), count is None if it is skipped.
+        The headlines are only made for the rows of the page.
+        """
+        search = self.find_search_statement(
+            query, include_hidden_problems, include_hidden_problem_sets
+        )
+        page = (
+            select(search)
+            .order_by(search.c.rank.desc(), search.c.id)
+            .offset(pagination.offset)
+            .limit(pagination.limit)
+            .subquery("page")
+        )
+        content = func.translate(
+            page.c.content, SEARCH_HEADLINE_START + SEARCH_HEADLINE_STOP, ""
+        )
+        headline = func.ts_headline(
+            literal_column(SEARCH_CONFIG),
+            content,
+            get_search_query(query),
+            SEARCH_HEADLINE_OPTIONS,
+        )
+        statement = select(
+            page.c.type,
+            page.c.id,
+            page.c.url,
+            page.c.title,
+            page.c.hidden,
+            page.c.rank,
+            headline.label("headline"),
+        ).order_by(page.c.rank.desc(), page.c.id)
+        async with db_session() as session:
+            count = None
+            if pagination.count:
+                result = await session.execute(select(func.count()).select_from(search))
+                count = result.scalar_one()
+            result = await session.execute(statement)
+            rows = result.all()
+        return rows, count
+
     def find_problems_statement(self, include_hidden: bool) -> Select:
         from joj.horse import models
 
@@ -105,24 +407,19 @@ class Domain(URLORMModel, DomainDetail, table=True):  # type: ignore[call-arg]
         return statement
 
     def find_candidates_statement(self, query: str) -> Select:
+        """
+        Search the users not in the domain, ranked by the similarity to the query.
+        """
         from joj.horse import models
 
-        statement = select(models.User, models.DomainUser)
-        statement = (
-            models.User.apply_search(statement, query)
-            .outerjoin_from(
-                models.User,
-                models.DomainUser,
-                models.User.id == models.DomainUser.user_id,
-            )
-            .where(
-                or_(
-                    models.DomainUser.domain_id == self.id,
-                    models.DomainUser.domain_id.is_(None),  # type: ignore[attr-defined]
-                )
-            )
+        domain_users = select(models.DomainUser.id).where(
+            models.DomainUser.domain_id == self.id,
+            models.DomainUser.user_id == models.User.id,
         )
-        return statement
+        statement = models.User.apply_search(models.User.sql_select(), query)
+        # anti-join, served by the unique index on (domain_id, user_id)
+        statement = statement.where(~exists(domain_users))
+        return models.User.apply_search_ordering(statement, query)
 
     @classmethod
     def find_groups_statement(cls, query: str) -> Select:
@@ -138,10 +435,17 @@ class Domain(URLORMModel, DomainDetail, table=True):  # type: ignore[call-arg]
     ) -> Select:
         from joj.horse import models
 
+        # only select the columns of RecordListDetail, rows are not hydrated
+        record_columns = [
+            getattr(models.Record, field)
+            for field in RecordListDetail.__fields__
+            if field not in ("problem_title", "problem_set_title")
+        ]
         statement = select(
-            models.Record, models.Problem.title, models.ProblemSet.title
+            *record_columns,
+            models.Problem.title.label("problem_title"),
+            models.ProblemSet.title.label("problem_set_title"),
         ).where(models.Record.domain_id == self.id)
-        statement = statement.options(defer("cases"))  # exclude record.cases
         statement = statement.outerjoin_from(
             models.Record,
             models.ProblemSet,
@@ -164,3 +468,20 @@ class Domain(URLORMModel, DomainDetail, table=True):  # type: ignore[call-arg]
 
 event.listen(Domain, "before_insert", url_pre_save)
 event.listen(Domain, "before_update", url_pre_save)
+event.listen(Domain, "after_delete", invalidate_url_lookups)
+
+
+def invalidate_domain_auth(mapper: Mapper, connection: Connection, target: Any) -> None:
+    """
+    Replace the version of the domain of the changed domain user or role,
+    all the cached domain users and roles of the domain are invalidated.
+    """
+    invalidate_cache_after_commit(target, DOMAIN_AUTH_VERSION, [str(target.domain_id)])
+
+
+def get_domain_auth_invalidations(objects: Sequence[Any]) -> Dict[str, Set[str]]:
+    """
+    Get the invalidations of a bulk write of domain users or roles,
+    see ORMUtils.get_bulk_invalidations.
+    """
+    return {DOMAIN_AUTH_VERSION: {str(obj.domain_id) for obj in objects}}
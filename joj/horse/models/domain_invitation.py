@@ -5,7 +5,11 @@ from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
 from sqlmodel import Field, Relationship
 from sqlmodel.sql.sqltypes import GUID
 
-from joj.horse.models.base import DomainURLORMModel, url_pre_save
+from joj.horse.models.base import (
+    DomainURLORMModel,
+    invalidate_url_lookups,
+    url_pre_save,
+)
 from joj.horse.models.domain import Domain
 from joj.horse.schemas.domain_invitation import DomainInvitationDetail
 
@@ -27,3 +31,4 @@ class DomainInvitation(DomainURLORMModel, DomainInvitationDetail, table=True):
 
 event.listen(DomainInvitation, "before_insert", url_pre_save)
 event.listen(DomainInvitation, "before_update", url_pre_save)
+event.listen(DomainInvitation, "after_delete", invalidate_url_lookups)
@@ -1,13 +1,17 @@
-from typing import Any, Dict
+from typing import Any, Dict, Sequence, Set
 from uuid import UUID
 
-from sqlalchemy import JSON
+from sqlalchemy import JSON, event
 from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
 from sqlmodel import Field, Relationship
 from sqlmodel.sql.sqltypes import GUID
 
 from joj.horse.models.base import BaseORMModel
-from joj.horse.models.domain import Domain
+from joj.horse.models.domain import (
+    Domain,
+    get_domain_auth_invalidations,
+    invalidate_domain_auth,
+)
 from joj.horse.schemas.domain_role import DomainRoleDetail
 from joj.horse.utils.errors import BizError, ErrorCode
 
@@ -27,7 +31,18 @@ class DomainRole(BaseORMModel, DomainRoleDetail, table=True):  # type: ignore[ca
     )
     domain: "Domain" = Relationship(back_populates="roles")
 
+    @classmethod
+    def get_bulk_invalidations(
+        cls, objects: Sequence["DomainRole"]
+    ) -> Dict[str, Set[str]]:
+        return get_domain_auth_invalidations(objects)
+
     @classmethod
     async def ensure_exists(cls, domain_id: UUID, role: str) -> None:
         if await DomainRole.one_or_none(domain_id=domain_id, role=role) is None:
             raise BizError(ErrorCode.DomainRoleNotFoundError)
+
+
+event.listen(DomainRole, "after_insert", invalidate_domain_auth)
+event.listen(DomainRole, "after_update", invalidate_domain_auth)
+event.listen(DomainRole, "after_delete", invalidate_domain_auth)
@@ -1,20 +1,26 @@
-from typing import TYPE_CHECKING, Union
+from typing import Any, Dict, Sequence, Set, Union
 from uuid import UUID
 
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Mapper
 from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
 from sqlalchemy.sql.functions import count
 from sqlmodel import Field, Relationship, select
 from sqlmodel.sql.sqltypes import GUID
 
-from joj.horse.models.base import BaseORMModel
-from joj.horse.models.domain import Domain
+from joj.horse.models.base import BaseORMModel, invalidate_cache_after_commit
+from joj.horse.models.domain import (
+    DOMAIN_AUTH_VERSION,
+    Domain,
+    get_domain_auth_invalidations,
+    invalidate_domain_auth,
+)
 from joj.horse.models.domain_role import DomainRole
 from joj.horse.models.permission import DefaultRole
+from joj.horse.models.user import User
 from joj.horse.utils.errors import BizError, ErrorCode
 
-if TYPE_CHECKING:
-    from joj.horse.models.user import User
-
 
 class DomainUser(BaseORMModel, table=True):  # type: ignore[call-arg]
     __tablename__ = "domain_users"
@@ -36,6 +42,12 @@ class DomainUser(BaseORMModel, table=True):  # type: ignore[call-arg]
     )
     user: "User" = Relationship(back_populates="domain_users")
 
+    @classmethod
+    def get_bulk_invalidations(
+        cls, objects: Sequence["DomainUser"]
+    ) -> Dict[str, Set[str]]:
+        return get_domain_auth_invalidations(objects)
+
     @classmethod
     async def add_domain_user(
         cls, domain_id: UUID, user_id: UUID, role: Union[str, DefaultRole]
@@ -79,3 +91,23 @@ class DomainUser(BaseORMModel, table=True):  # type: ignore[call-arg]
         )
         user_count = (await DomainUser.session_exec(statement)).one_or_none()
         return 0 if user_count is None else user_count
+
+
+event.listen(DomainUser, "after_insert", invalidate_domain_auth)
+event.listen(DomainUser, "after_update", invalidate_domain_auth)
+event.listen(DomainUser, "after_delete", invalidate_domain_auth)
+
+
+def invalidate_user_domain_auth(
+    mapper: Mapper, connection: Connection, target: Any
+) -> None:
+    """
+    The domain users of a deleted user are deleted by ON DELETE CASCADE
+    without mapper events, invalidate the domains of the user instead.
+    """
+    statement = select(DomainUser.domain_id).where(DomainUser.user_id == target.id)
+    domain_ids = connection.execute(statement).scalars().all()
+    invalidate_cache_after_commit(target, DOMAIN_AUTH_VERSION, map(str, domain_ids))
+
+
+event.listen(User, "before_delete", invalidate_user_domain_auth)
@@ -2,7 +2,7 @@ from typing import TYPE_CHECKING, Optional
 from uuid import UUID
 
 from sqlalchemy.orm import joinedload
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlmodel import Field, Relationship
 from sqlmodel.sql.sqltypes import GUID
 
@@ -12,9 +12,22 @@ from joj.horse.utils.base import is_uuid
 if TYPE_CHECKING:
     from joj.horse.models import Problem, ProblemSet
 
+# the positions of the problems in a problem set are sparse, a problem is
+# placed between its neighbours by taking the middle of their positions,
+# and the positions are spread again when there is no gap between them
+POSITION_GAP = 1 << 12
+
 
 class ProblemProblemSetLink(ORMUtils, table=True):  # type: ignore[call-arg]
     __tablename__ = "problem_problem_set_links"
+    __table_args__ = (
+        # the problems of a problem set in order, and the neighbours of a position
+        Index(
+            "ix_problem_problem_set_links_problem_set_id_position",
+            "problem_set_id",
+            "position",
+        ),
+    )
 
     problem_id: UUID = Field(
         sa_column=Column(
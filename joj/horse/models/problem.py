@@ -1,14 +1,23 @@
-from typing import TYPE_CHECKING, List, Optional, Type
+from typing import TYPE_CHECKING, Dict, List, Optional, Type
 from uuid import UUID
 
-from sqlalchemy import event
-from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
+from loguru import logger
+from sqlalchemy import Integer, event
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import Column, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql.expression import column, text, update, values
 from sqlmodel import Field, Relationship
 from sqlmodel.sql.sqltypes import GUID
 
-from joj.horse.models.base import DomainURLORMModel, url_pre_save
+from joj.horse.models.base import (
+    DomainURLORMModel,
+    add_search_vector,
+    invalidate_url_lookups,
+    url_pre_save,
+)
 from joj.horse.models.link_tables import ProblemProblemSetLink
 from joj.horse.schemas.problem import ProblemDetail, WithLatestRecordType
+from joj.horse.services.counter import BufferedCounter, CounterValues
 from joj.horse.services.db import db_session
 
 if TYPE_CHECKING:
@@ -21,10 +30,24 @@ if TYPE_CHECKING:
         User,
     )
 
+# num_submit and num_accept are buffered so that the problem rows are not
+# locked by every submission, the buffered increments are flushed by the app
+problem_counter = BufferedCounter("problem_counters", ("num_submit", "num_accept"))
+
 
 class Problem(DomainURLORMModel, ProblemDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "problems"
-    __table_args__ = (UniqueConstraint("domain_id", "url"),)
+    __table_args__ = (
+        UniqueConstraint("domain_id", "url"),
+        # listing of the visible problems in a domain
+        Index(
+            "ix_problems_domain_id_created_at_visible",
+            "domain_id",
+            "created_at",
+            "id",
+            postgresql_where=text("hidden <> true"),
+        ),
+    )
 
     domain_id: UUID = Field(
         sa_column=Column(
@@ -71,6 +94,7 @@ class Problem(DomainURLORMModel, ProblemDetail, table=True):  # type: ignore[cal
     ) -> List[WithLatestRecordType]:
         from joj.horse import models
 
+        await cls.load_pending_counters(problems)
         problem_ids = [problem.id for problem in problems]
         records = await models.Record.get_user_latest_records(
             problem_set_id=problem_set_id, problem_ids=problem_ids, user_id=user_id
@@ -81,6 +105,71 @@ class Problem(DomainURLORMModel, ProblemDetail, table=True):  # type: ignore[cal
         ]
         return problems
 
+    @classmethod
+    async def increment_counters(cls, problem_id: UUID, **values: int) -> None:
+        problem_counter.validate(values)
+        try:
+            await problem_counter.increment(problem_id, values)
+        except Exception as e:
+            logger.error("error when buffering problem counters:")
+            logger.exception(e)
+            await cls.apply_counters({problem_id: values})
+
+    @classmethod
+    async def apply_counters(cls, counters: Dict[UUID, CounterValues]) -> None:
+        """
+        Add the increments to the counters of the problems with one update.
+        """
+        rows = [
+            (id, counters[id].get("num_submit", 0), counters[id].get("num_accept", 0))
+            for id in sorted(counters)  # lock the rows in the same order
+        ]
+        counters_values = values(
+            column("id", GUID),
+            column("num_submit", Integer),
+            column("num_accept", Integer),
+            name="counters",
+        ).data(rows)
+        statement = (
+            update(cls)
+            .where(cls.id == counters_values.c.id)
+            .values(
+                num_submit=cls.num_submit + counters_values.c.num_submit,
+                num_accept=cls.num_accept + counters_values.c.num_accept,
+                # counting is not a modification of the problem
+                updated_at=cls.updated_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        async with db_session() as session:
+            await session.execute(statement)
+            await session.commit()
+
+    @classmethod
+    async def flush_counters(cls, batch_size: int = 1000) -> int:
+        """
+        Flush the buffered increments to the database,
+        return the number of problems updated.
+        """
+        return await problem_counter.flush(cls.apply_counters, batch_size)
+
+    @classmethod
+    async def load_pending_counters(cls, problems: List["Problem"]) -> None:
+        """
+        Add the increments not flushed yet to the counters of the problems.
+        """
+        try:
+            pending = await problem_counter.get_pending(
+                problem.id for problem in problems
+            )
+        except Exception as e:
+            logger.error("error when loading problem counters:")
+            logger.exception(e)
+            return
+        for problem in problems:
+            for field, delta in pending.get(problem.id, {}).items():
+                set_committed_value(problem, field, getattr(problem, field) + delta)
+
     async def get_latest_problem_config(self) -> Optional["ProblemConfig"]:
         from joj.horse import models
 
@@ -95,5 +184,8 @@ class Problem(DomainURLORMModel, ProblemDetail, table=True):  # type: ignore[cal
             return results.one_or_none()
 
 
+add_search_vector(Problem.__table__, {"title": "A", "content": "B"})  # type: ignore[attr-defined]
+
 event.listen(Problem, "before_insert", url_pre_save)
 event.listen(Problem, "before_update", url_pre_save)
+event.listen(Problem, "after_delete", invalidate_url_lookups)
@@ -6,7 +6,7 @@ import orjson
 
 # from joj.elephant.manager import Manager
 from lakefs_client.models import Commit
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlmodel import Field, Relationship
 from sqlmodel.sql.sqltypes import GUID
 from starlette.concurrency import run_in_threadpool
@@ -23,6 +23,10 @@ if TYPE_CHECKING:
 
 class ProblemConfig(BaseORMModel, ProblemConfigDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "problem_configs"
+    __table_args__ = (
+        # Problem.get_latest_problem_config
+        Index("ix_problem_configs_problem_id_created_at", "problem_id", "created_at"),
+    )
 
     problem_id: Optional[UUID] = Field(
         sa_column=Column(
@@ -2,7 +2,7 @@ from typing import TYPE_CHECKING, List
 
 from sqlmodel import Relationship
 
-from joj.horse.models.base import BaseORMModel
+from joj.horse.models.base import BaseORMModel, get_timestamp_indexes
 from joj.horse.schemas.problem_group import ProblemGroupDetail
 
 if TYPE_CHECKING:
@@ -11,5 +11,6 @@ if TYPE_CHECKING:
 
 class ProblemGroup(BaseORMModel, ProblemGroupDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "problem_groups"
+    __table_args__ = get_timestamp_indexes("problem_groups")
 
     problems: List["Problem"] = Relationship(back_populates="problem_group")
@@ -2,15 +2,22 @@ from typing import TYPE_CHECKING, List, Optional
 from uuid import UUID
 
 from sqlalchemy import event
-from sqlalchemy.ext.orderinglist import ordering_list
-from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
-from sqlmodel import Field, Relationship
+from sqlalchemy.schema import Column, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql.expression import func, text, update
+from sqlmodel import Field, Relationship, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.sql.sqltypes import GUID
 
-from joj.horse.models.base import DomainURLORMModel, url_pre_save
-from joj.horse.models.link_tables import ProblemProblemSetLink
+from joj.horse.models.base import (
+    DomainURLORMModel,
+    add_search_vector,
+    invalidate_url_lookups,
+    url_pre_save,
+)
+from joj.horse.models.link_tables import POSITION_GAP, ProblemProblemSetLink
 from joj.horse.schemas.base import Operation
 from joj.horse.schemas.problem_set import ProblemSetDetail
+from joj.horse.services.db import db_session
 from joj.horse.utils.errors import BizError, ErrorCode
 
 if TYPE_CHECKING:
@@ -19,7 +26,17 @@ if TYPE_CHECKING:
 
 class ProblemSet(DomainURLORMModel, ProblemSetDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "problem_sets"
-    __table_args__ = (UniqueConstraint("domain_id", "url"),)
+    __table_args__ = (
+        UniqueConstraint("domain_id", "url"),
+        # listing of the visible problem_sets in a domain
+        Index(
+            "ix_problem_sets_domain_id_created_at_visible",
+            "domain_id",
+            "created_at",
+            "id",
+            postgresql_where=text("hidden <> true"),
+        ),
+    )
 
     domain_id: UUID = Field(
         sa_column=Column(
@@ -47,12 +64,11 @@ class ProblemSet(DomainURLORMModel, ProblemSetDetail, table=True):  # type: igno
     #     },
     # )
 
-    # maintain the order of many to many relationship
+    # the order of many to many relationship, maintained by operate_problem
     problem_problem_set_links: List[ProblemProblemSetLink] = Relationship(
         back_populates="problem_set",
         sa_relationship_kwargs={
             "order_by": "ProblemProblemSetLink.position",
-            "collection_class": ordering_list("position"),
         },
     )
 
@@ -69,31 +85,122 @@ class ProblemSet(DomainURLORMModel, ProblemSetDetail, table=True):  # type: igno
     async def operate_problem(
         self, problem: "Problem", operation: Operation, position: Optional[int] = None
     ) -> None:
+        """
+        Add, move or delete the problem in the problem set with a single row
+        write, position is the index in the problems, or None for the end.
+        """
         assert problem.domain_id == self.domain_id
-        link = await ProblemProblemSetLink.one_or_none(
-            problem_set_id=self.id, problem_id=problem.id
+        async with db_session() as session:
+            # serialize the operations on the problem set,
+            # so that two problems never take the same gap
+            await session.execute(
+                select(ProblemSet.id).where(ProblemSet.id == self.id).with_for_update()
+            )
+            statement = select(ProblemProblemSetLink).where(
+                ProblemProblemSetLink.problem_set_id == self.id,
+                ProblemProblemSetLink.problem_id == problem.id,
+            )
+            link = (await session.exec(statement)).one_or_none()
+            if operation == Operation.Create:
+                if link is not None:
+                    raise BizError(ErrorCode.IntegrityError, "problem already added")
+                link = ProblemProblemSetLink(
+                    problem_set_id=self.id, problem_id=problem.id
+                )
+            else:
+                if link is None:
+                    raise BizError(ErrorCode.IntegrityError, "problem not added")
+
+            if operation == Operation.Read:
+                return
+            if operation == Operation.Delete:
+                await session.delete(link)
+            else:
+                link.position = await self.get_link_position(
+                    session, problem.id, position
+                )
+                session.add(link)
+            await session.commit()
+            if self in session:
+                await session.refresh(self)
+
+    async def get_link_position(
+        self, session: AsyncSession, problem_id: UUID, index: Optional[int]
+    ) -> int:
+        """
+        Get the position of the problem placed at index among the other
+        problems, or after them if index is None or out of range.
+        """
+        statement = select(ProblemProblemSetLink.position).where(
+            ProblemProblemSetLink.problem_set_id == self.id,
+            ProblemProblemSetLink.problem_id != problem_id,
         )
-        if operation == Operation.Create:
-            if link is not None:
-                raise BizError(ErrorCode.IntegrityError, "problem already added")
-            link = ProblemProblemSetLink(problem_set_id=self.id, problem_id=problem.id)
+        if index is not None and index > 0:
+            result = await session.exec(
+                statement.order_by(ProblemProblemSetLink.position)
+                .offset(index - 1)
+                .limit(2)
+            )
+            positions: List[Optional[int]] = list(result.all())
+        elif index is not None:
+            result = await session.exec(
+                statement.order_by(ProblemProblemSetLink.position).limit(1)
+            )
+            positions = [None, *result.all()]
         else:
-            if link is None:
-                raise BizError(ErrorCode.IntegrityError, "problem not added")
-
-        if operation == Operation.Read:
-            return
-        if operation in (Operation.Update, Operation.Delete):
-            self.problem_problem_set_links.remove(link)
-        if operation in (Operation.Create, Operation.Update):
-            if position is None:
-                self.problem_problem_set_links.append(link)
-            else:
-                self.problem_problem_set_links.insert(position, link)
-        if operation == Operation.Delete:
-            await link.delete_model(commit=False)
-        await self.save_model()
+            positions = []
+        if not positions:
+            result = await session.exec(
+                statement.order_by(ProblemProblemSetLink.position.desc()).limit(1)  # type: ignore[attr-defined]
+            )
+            positions = list(result.all())
+        positions.extend([None] * (2 - len(positions)))
+        prev, next_ = positions
+        if prev is None and next_ is None:
+            return 0
+        if next_ is None:
+            return prev + POSITION_GAP  # type: ignore[operator]
+        if prev is None:
+            return next_ - POSITION_GAP
+        if next_ - prev > 1:
+            return (prev + next_) // 2
+        await self.rebalance_positions(session)
+        return await self.get_link_position(session, problem_id, index)
+
+    async def rebalance_positions(self, session: AsyncSession) -> None:
+        """
+        Spread the positions of the problems evenly, keeping their order.
+        """
+        link_positions = (
+            select(
+                ProblemProblemSetLink.problem_id,
+                (
+                    func.row_number().over(
+                        order_by=(
+                            ProblemProblemSetLink.position,
+                            ProblemProblemSetLink.problem_id,
+                        )
+                    )
+                    * POSITION_GAP
+                ).label("position"),
+            )
+            .where(ProblemProblemSetLink.problem_set_id == self.id)
+            .subquery("link_positions")
+        )
+        statement = (
+            update(ProblemProblemSetLink)
+            .where(
+                ProblemProblemSetLink.problem_set_id == self.id,
+                ProblemProblemSetLink.problem_id == link_positions.c.problem_id,
+            )
+            .values(position=link_positions.c.position)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(statement)
+
 
+add_search_vector(ProblemSet.__table__, {"title": "A", "content": "B"})  # type: ignore[attr-defined]
 
 event.listen(ProblemSet, "before_insert", url_pre_save)
 event.listen(ProblemSet, "before_update", url_pre_save)
+event.listen(ProblemSet, "after_delete", invalidate_url_lookups)
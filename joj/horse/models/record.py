@@ -1,20 +1,40 @@
-from typing import TYPE_CHECKING, List, Optional
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 from uuid import UUID, uuid4
 
 from celery import Celery
 from celery.result import AsyncResult
 from fastapi import BackgroundTasks
 from loguru import logger
-from sqlalchemy.schema import Column, ForeignKey
-from sqlmodel import Field, Relationship
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import Column, ForeignKey, Index
+from sqlalchemy.sql.expression import (
+    Select,
+    and_,
+    func,
+    insert,
+    literal,
+    true,
+    update,
+)
+from sqlmodel import Field, Relationship, select
 from sqlmodel.sql.sqltypes import GUID
 from starlette.concurrency import run_in_threadpool
 
 from joj.horse.models.base import BaseORMModel
-from joj.horse.schemas.cache import get_redis_cache
+from joj.horse.models.user_latest_record import UserLatestRecord
 from joj.horse.schemas.problem import ProblemSolutionSubmit
 from joj.horse.schemas.record import RecordDetail, RecordPreview, RecordState
+from joj.horse.services.archive import (
+    get_archive_key,
+    get_archived_cases,
+    put_archive,
+)
+from joj.horse.services.db import db_session
 from joj.horse.services.lakefs import LakeFSRecord
+from joj.horse.services.tiered_cache import get_tiered_cache
+from joj.horse.utils.base import uuid7
 from joj.horse.utils.errors import BizError, ErrorCode
 
 if TYPE_CHECKING:
@@ -23,7 +43,18 @@ if TYPE_CHECKING:
 
 class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "records"
-    # __table_args__ = (UniqueConstraint("domain_id", "url"),)
+    # Domain.find_records_statement, ordered by created_at with id as tie-breaker
+    __table_args__ = (
+        Index("ix_records_domain_id_created_at", "domain_id", "created_at", "id"),
+        Index(
+            "ix_records_problem_set_id_created_at", "problem_set_id", "created_at", "id"
+        ),
+        Index("ix_records_problem_id_created_at", "problem_id", "created_at", "id"),
+        Index("ix_records_committer_id_created_at", "committer_id", "created_at", "id"),
+    )
+
+    # time-ordered ids keep the inserts at the right end of the primary key index
+    id: UUID = Field(default_factory=uuid7, primary_key=True, nullable=False)
 
     domain_id: UUID = Field(
         sa_column=Column(
@@ -74,6 +105,8 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
     )
 
     lakefs_access_key_id: Optional[str] = Field(None, nullable=True)
+    # object key of the cases moved to cold storage by "horse records archive"
+    cases_archive_key: Optional[str] = Field(None, nullable=True)
 
     @classmethod
     async def submit(
@@ -86,9 +119,6 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
         problem: "Problem",
         user: "User",
     ) -> "Record":
-        problem_config = await problem.get_latest_problem_config()
-        if problem_config is None:
-            raise BizError(ErrorCode.ProblemConfigNotFoundError)
         if problem_submit.language not in problem.languages:
             raise BizError(ErrorCode.UnsupportedLanguageError)
         problem_set_id = problem_set.id if problem_set else None
@@ -96,23 +126,25 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
             domain_id=problem.domain_id,
             problem_set_id=problem_set_id,
             problem_id=problem.id,
-            problem_config_id=problem_config.id,
             committer_id=user.id,
             language=problem_submit.language,
         )
-
-        await record.save_model(commit=False, refresh=False)
-        problem.num_submit += 1
-        await problem.save_model(commit=True, refresh=True)
-        await record.refresh_model()
-
-        key = cls.get_user_latest_record_key(problem_set_id, problem.id, user.id)
-        value = RecordPreview(
-            id=record.id, state=record.state, created_at=record.created_at
-        )
-
-        cache = get_redis_cache()
-        await cache.set(key, value, namespace="user_latest_records")
+        statement = cls.get_submit_statement(record, problem_set_id)
+        async with db_session() as session:
+            row = (await session.execute(statement)).one_or_none()
+            if row is None:
+                await session.rollback()
+                raise BizError(ErrorCode.ProblemConfigNotFoundError)
+            await session.commit()
+            # the problem is used by the upload after the commit expired it
+            if problem in session:
+                await session.refresh(problem)
+            record = cls(**row._mapping)
+            # the row is inserted, attach it to the session without inserting again
+            make_transient_to_detached(record)
+            session.add(record)
+        await problem.increment_counters(problem.id, num_submit=1)
+        await record.update_user_latest_record_cache(force=True)
 
         background_tasks.add_task(
             record.upload,
@@ -123,6 +155,61 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
 
         return record
 
+    @classmethod
+    def get_submit_statement(
+        cls, record: "Record", problem_set_id: Optional[UUID]
+    ) -> Select:
+        """
+        Build a single statement for the submission, which
+        1. inserts the record with the latest problem config of the problem,
+        2. updates the latest record of the committer,
+        and returns the record.
+        No row is returned if the problem has no config.
+        """
+        from joj.horse.models.problem_config import ProblemConfig
+
+        columns = cls.__table__.columns  # type: ignore
+        values = {
+            column.name: literal(getattr(record, column.name), column.type)
+            for column in columns
+            if column.name not in ("created_at", "updated_at", "problem_config_id")
+        }
+        config_statement = (
+            select(*values.values(), ProblemConfig.id)
+            .where(ProblemConfig.problem_id == record.problem_id)
+            .order_by(ProblemConfig.created_at.desc())  # type: ignore
+            .limit(1)
+        )
+        record_cte = (
+            insert(cls)
+            .from_select([*values.keys(), "problem_config_id"], config_statement)
+            .returning(*columns)
+            .cte("record")
+        )
+        # the upsert is joined instead of added by add_cte because independent
+        # ctes are lost in orm-enabled selects, it returns no row if a newer
+        # record of the committer is already the latest one
+        latest_record_cte = (
+            UserLatestRecord.get_upsert_statement(
+                select(
+                    literal(uuid7(), GUID),
+                    record_cte.c.committer_id,
+                    record_cte.c.problem_id,
+                    record_cte.c.problem_set_id,
+                    record_cte.c.id,
+                    record_cte.c.created_at,
+                ),
+                problem_set_id,
+            )
+            .returning(UserLatestRecord.record_id)
+            .cte("latest_record")
+        )
+        return (
+            select(record_cte)
+            .select_from(record_cte)
+            .outerjoin(latest_record_cte, true())
+        )
+
     async def upload(
         self,
         celery_app: Celery,
@@ -150,6 +237,7 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
             await run_in_threadpool(sync_func)
             self.task_id = uuid4()
             await self.save_model()
+            await self.update_user_latest_record_cache()
             await self.create_task(celery_app)
             logger.info("upload record success: {}", self)
         except Exception as e:
@@ -157,6 +245,59 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
             logger.exception(e)
             self.state = RecordState.failed
             await self.save_model()
+            await self.update_user_latest_record_cache()
+
+    async def load_archived_cases(self) -> None:
+        if self.cases_archive_key is None:
+            return
+        archived_cases = await run_in_threadpool(
+            get_archived_cases, self.cases_archive_key
+        )
+        cases = archived_cases.get(str(self.id))
+        if cases is None:
+            logger.warning("cases of record {} not found in archive", self.id)
+            return
+        # not a modification, keep the record clean in the session
+        set_committed_value(self, "cases", cases)
+
+    @classmethod
+    async def archive_cases(
+        cls, start: datetime, end: datetime, prefix: str, batch_size: int = 1000
+    ) -> int:
+        """
+        Move the cases of records created in [start, end) to cold storage.
+        Each batch is uploaded before the rows are updated, so that an
+        interrupted run can be resumed by running it again.
+        """
+        time_range = and_(cls.created_at >= start, cls.created_at < end)
+        statement = (
+            select(cls.id, cls.cases)
+            .where(time_range)
+            .where(cls.cases_archive_key.is_(None))  # type: ignore
+            .where(func.json_array_length(cls.cases) > 0)
+            .order_by(cls.id)
+            .limit(batch_size)
+        )
+        archived = 0
+        async with db_session() as session:
+            while True:
+                rows = (await session.exec(statement)).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                key = get_archive_key(prefix, f"{ids[0]}.ndjson.gz")
+                items = [{"id": str(row.id), "cases": row.cases} for row in rows]
+                await run_in_threadpool(put_archive, key, items)
+                await session.execute(
+                    update(cls)
+                    .where(time_range)
+                    .where(cls.id.in_(ids))  # type: ignore
+                    .values(cases=[], cases_archive_key=key)
+                )
+                await session.commit()
+                archived += len(rows)
+                logger.info("archived {} records to {}", len(rows), key)
+        return archived
 
     async def create_task(self, celery_app: Celery) -> AsyncResult:
         # create a task in celery with this record
@@ -179,6 +320,61 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
             problem_set_id, problem_id, user_id
         )
 
+    async def update_user_latest_record_cache(self, force: bool = False) -> None:
+        """
+        Update the cached preview of the latest record of the committer.
+        Unless forced, the cache is only updated if it already holds this record.
+        """
+        if self.problem_id is None or self.committer_id is None:
+            return
+        cache = get_tiered_cache()
+        key = self.get_user_latest_record_key(
+            self.problem_set_id, self.problem_id, self.committer_id
+        )
+        if not force:
+            value = await cache.get(key, namespace="user_latest_records")
+            try:
+                if RecordPreview(**value["record"]).id != self.id:
+                    return
+            except (TypeError, ValueError, KeyError):
+                return
+        record = RecordPreview(**self.dict())
+        await cache.set(key, {"record": record.dict()}, namespace="user_latest_records")
+
+    @classmethod
+    async def find_user_latest_records(
+        cls, problem_set_id: Optional[UUID], problem_ids: List[UUID], user_id: UUID
+    ) -> Dict[UUID, RecordPreview]:
+        """
+        Load the latest records of the user on the problems with a single query.
+        Only the columns of RecordPreview are selected.
+        """
+        if not problem_ids:
+            return {}
+        statement = (
+            select(UserLatestRecord.problem_id, cls.id, cls.state, cls.created_at)
+            .select_from(cls)
+            .join(UserLatestRecord, UserLatestRecord.record_id == cls.id)
+            .where(UserLatestRecord.user_id == user_id)
+            .where(UserLatestRecord.problem_id.in_(problem_ids))  # type: ignore
+        )
+        if problem_set_id is None:
+            statement = statement.where(
+                UserLatestRecord.problem_set_id.is_(None)  # type: ignore
+            )
+        else:
+            statement = statement.where(
+                UserLatestRecord.problem_set_id == problem_set_id
+            )
+        async with db_session() as session:
+            rows = (await session.exec(statement)).all()
+        return {
+            row.problem_id: RecordPreview(
+                id=row.id, state=row.state, created_at=row.created_at
+            )
+            for row in rows
+        }
+
     @classmethod
     async def get_user_latest_record(
         cls,
@@ -187,10 +383,19 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
         user_id: UUID,
         use_cache: bool = True,
     ) -> Optional[RecordPreview]:
-        cache = get_redis_cache()
+        cache = get_tiered_cache()
         key = cls.get_user_latest_record_key(problem_set_id, problem_id, user_id)
+
+        async def load() -> Dict[str, Any]:
+            records = await cls.find_user_latest_records(
+                problem_set_id, [problem_id], user_id
+            )
+            record = records.get(problem_id)
+            return {"record": record.dict() if record else None}
+
         if use_cache:
-            value = await cache.get(key, namespace="user_latest_records")
+            # concurrent misses of the key are loaded once
+            value = await cache.get_or_load(key, "user_latest_records", load)
             try:
                 data = value["record"]
                 if data is None:
@@ -202,36 +407,17 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
                 logger.error("error when loading record from cache:")
                 logger.exception(e)
 
-        statement = (
-            cls.sql_select()
-            .where(cls.problem_id == problem_id)
-            .where(cls.committer_id == user_id)
-            .order_by(cls.created_at.desc())  # type: ignore
-            .limit(1)
-        )
-        if problem_set_id is None:
-            statement = statement.where(cls.problem_set_id.is_(None))  # type: ignore
-        else:
-            statement = statement.where(cls.problem_set_id == problem_set_id)
-        result = await cls.session_exec(statement)
-        record_model: "Record" = result.one_or_none()
-        if record_model is None:
-            record = None
-        else:
-            record = RecordPreview(**record_model.dict())
+        value = await load()
         if use_cache:
-            await cache.set(
-                key,
-                {"record": record.dict() if record else None},
-                namespace="user_latest_records",
-            )
-        return record
+            await cache.set(key, value, namespace="user_latest_records")
+        data = value["record"]
+        return RecordPreview(**data) if data is not None else None
 
     @classmethod
     async def get_user_latest_records(
         cls, problem_set_id: Optional[UUID], problem_ids: List[UUID], user_id: UUID
     ) -> List[Optional[RecordPreview]]:
-        cache = get_redis_cache()
+        cache = get_tiered_cache()
         keys = [
             cls.get_user_latest_record_key(problem_set_id, problem_id, user_id)
             for problem_id in problem_ids
@@ -239,30 +425,33 @@ class Record(BaseORMModel, RecordDetail, table=True):  # type: ignore[call-arg]
         values = []
         if keys:
             values = await cache.multi_get(keys, namespace="user_latest_records")
-        records = []
-        updated_cache_pairs = []
+        records: List[Optional[RecordPreview]] = []
+        missed_indices = []
         for i, value in enumerate(values):
             record = None
             try:
                 data = value["record"]
                 if data is not None:
                     record = RecordPreview(**data)
-                use_cache = True
             except (TypeError, ValueError, KeyError):
-                use_cache = False
+                missed_indices.append(i)
             except Exception as e:
-                use_cache = False
+                missed_indices.append(i)
                 logger.error("error when loading records from cache:")
                 logger.exception(e)
-            if not use_cache:
-                record = await cls.get_user_latest_record(
-                    problem_set_id=problem_set_id,
-                    problem_id=problem_ids[i],
-                    user_id=user_id,
-                    use_cache=False,
-                )
-                updated_cache_pairs.append((keys[i], record.dict() if record else None))
             records.append(record)
+        updated_cache_pairs = []
+        if missed_indices:
+            # resolve all cache misses with one query
+            missed_records = await cls.find_user_latest_records(
+                problem_set_id, [problem_ids[i] for i in missed_indices], user_id
+            )
+            for i in missed_indices:
+                record = missed_records.get(problem_ids[i])
+                records[i] = record
+                updated_cache_pairs.append(
+                    (keys[i], {"record": record.dict() if record else None})
+                )
         if updated_cache_pairs:
             await cache.multi_set(updated_cache_pairs, namespace="user_latest_records")
         logger.info(
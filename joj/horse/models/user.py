@@ -1,14 +1,15 @@
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from pydantic import EmailStr, root_validator
-from sqlalchemy.sql.expression import Select, or_
-from sqlmodel import Field, Relationship
+from sqlalchemy.sql.expression import ColumnElement, Select, case, func, or_
+from sqlmodel import Field, Relationship, select
 
-from joj.horse.models.base import BaseORMModel
+from joj.horse.models.base import BaseORMModel, get_timestamp_indexes
 from joj.horse.models.permission import DefaultRole
 from joj.horse.models.user_oauth_account import UserOAuthAccount
 from joj.horse.schemas.user import JudgerCreate, UserCreate, UserDetail
 from joj.horse.services.db import db_session
+from joj.horse.services.trigram import is_trigram_enabled
 from joj.horse.utils.errors import BizError, ErrorCode
 
 if TYPE_CHECKING:
@@ -23,9 +24,13 @@ if TYPE_CHECKING:
     )
     from joj.horse.schemas.auth import JWTAccessToken
 
+# search results are capped to the best matches
+USER_SEARCH_LIMIT = 100
+
 
 class User(BaseORMModel, UserDetail, table=True):  # type: ignore[call-arg]
     __tablename__ = "users"
+    __table_args__ = get_timestamp_indexes("users")
 
     hashed_password: str = Field(
         "",
@@ -46,7 +51,11 @@ class User(BaseORMModel, UserDetail, table=True):  # type: ignore[call-arg]
     oauth_accounts: List["UserOAuthAccount"] = Relationship(back_populates="user")
     access_keys: List["UserAccessKey"] = Relationship(back_populates="user")
     owned_domains: List["Domain"] = Relationship(back_populates="owner")
-    domain_users: List["DomainUser"] = Relationship(back_populates="user")
+    # the domain users are deleted by ON DELETE CASCADE instead of being
+    # loaded and nullified, see invalidate_user_domain_auth
+    domain_users: List["DomainUser"] = Relationship(
+        back_populates="user", sa_relationship_kwargs={"passive_deletes": True}
+    )
     owned_problems: List["Problem"] = Relationship(back_populates="owner")
     owned_problem_sets: List["ProblemSet"] = Relationship(back_populates="owner")
     problem_configs: List["ProblemConfig"] = Relationship(back_populates="committer")
@@ -221,18 +230,56 @@ class User(BaseORMModel, UserDetail, table=True):  # type: ignore[call-arg]
         return statement
 
     @classmethod
-    def apply_search(cls, statement: Select, query: str) -> Select:
+    def get_search_rank(cls, query: str) -> ColumnElement:
+        columns = [cls.username_lower, cls.email_lower, cls.student_id, cls.real_name]
+        if is_trigram_enabled():
+            ranks = [func.word_similarity(query, column) for column in columns]
+        else:
+            # without pg_trgm, exact matches come first and then prefix matches
+            ranks = [
+                case(
+                    (func.lower(column) == query.lower(), 1.0),
+                    (
+                        func.lower(column).startswith(query.lower(), autoescape=True),
+                        0.5,
+                    ),
+                    else_=0.0,
+                )
+                for column in columns
+            ]
+        return func.greatest(*ranks)
+
+    @classmethod
+    def apply_search(
+        cls, statement: Select, query: str, limit: int = USER_SEARCH_LIMIT
+    ) -> Select:
+        """
+        Filter the users matching the query, only the best limit matches are
+        kept. The ILIKE predicates are served by the trigram indexes.
+        """
         looking_for = f"%{query}%"
-        statement = statement.where(
-            or_(
-                cls.username_lower.ilike(looking_for),  # type: ignore[attr-defined]
-                cls.email_lower.ilike(looking_for),  # type: ignore[attr-defined]
-                cls.student_id.ilike(looking_for),  # type: ignore[attr-defined]
-                cls.real_name.ilike(looking_for),  # type: ignore[attr-defined]
+        matches = (
+            select(cls.id)
+            .where(
+                or_(
+                    cls.username_lower.ilike(looking_for),  # type: ignore[attr-defined]
+                    cls.email_lower.ilike(looking_for),  # type: ignore[attr-defined]
+                    cls.student_id.ilike(looking_for),  # type: ignore[attr-defined]
+                    cls.real_name.ilike(looking_for),  # type: ignore[attr-defined]
+                )
             )
+            .order_by(cls.get_search_rank(query).desc(), cls.id)
+            .limit(limit)
         )
-        return statement
+        return statement.where(cls.id.in_(matches))  # type: ignore[attr-defined]
+
+    @classmethod
+    def apply_search_ordering(cls, statement: Select, query: str) -> Select:
+        return statement.order_by(cls.get_search_rank(query).desc())
 
     @classmethod
     def find_users_statement(cls, query: str) -> Select:
-        return cls.apply_search(cls.sql_select(), query)
+        statement = cls.sql_select()
+        if query:
+            statement = cls.apply_search(statement, query)
+        return statement
@@ -1,11 +1,14 @@
 from typing import TYPE_CHECKING, Optional
 from uuid import UUID
 
-from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.schema import Column, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql.expression import Select, text
 from sqlmodel import Field
 from sqlmodel.sql.sqltypes import GUID
 
 from joj.horse.models.base import BaseORMModel
+from joj.horse.utils.base import uuid7
 
 if TYPE_CHECKING:
     pass
@@ -14,9 +17,18 @@ if TYPE_CHECKING:
 class UserLatestRecord(BaseORMModel, table=True):  # type: ignore[call-arg]
     __tablename__ = "user_latest_records"
     __table_args__ = (
-        UniqueConstraint("user_id", "problem_id", "problem_set_id", "record_id"),
+        UniqueConstraint("user_id", "problem_id", "problem_set_id"),
+        # null problem_set_id never conflicts in the unique constraint above
+        Index(
+            "ix_user_latest_records_user_id_problem_id",
+            "user_id",
+            "problem_id",
+            unique=True,
+            postgresql_where=text("problem_set_id IS NULL"),
+        ),
     )
 
+    id: UUID = Field(default_factory=uuid7, primary_key=True, nullable=False)
     user_id: UUID = Field(
         sa_column=Column(
             GUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
@@ -37,3 +49,43 @@ class UserLatestRecord(BaseORMModel, table=True):  # type: ignore[call-arg]
             GUID, ForeignKey("records.id", ondelete="CASCADE"), nullable=False
         ),
     )
+
+    @classmethod
+    def get_upsert_statement(
+        cls, select_statement: Select, problem_set_id: Optional[UUID]
+    ) -> Insert:
+        """
+        Insert or update the latest records from the rows of select_statement, which
+        has the columns (id, user_id, problem_id, problem_set_id, record_id,
+        updated_at), updated_at is the creation time of the record.
+        A record older than the current latest record is not upserted,
+        so concurrent submissions committed out of order keep the newest one.
+        """
+        statement = insert(cls).from_select(
+            [
+                "id",
+                "user_id",
+                "problem_id",
+                "problem_set_id",
+                "record_id",
+                "updated_at",
+            ],
+            select_statement,
+        )
+        set_ = {
+            "record_id": statement.excluded.record_id,
+            "updated_at": statement.excluded.updated_at,
+        }
+        where = statement.excluded.updated_at >= cls.updated_at
+        if problem_set_id is None:
+            return statement.on_conflict_do_update(
+                index_elements=["user_id", "problem_id"],
+                index_where=text("problem_set_id IS NULL"),
+                set_=set_,
+                where=where,
+            )
+        return statement.on_conflict_do_update(
+            index_elements=["user_id", "problem_id", "problem_set_id"],
+            set_=set_,
+            where=where,
+        )
@@ -10,6 +10,7 @@ from joj.horse.schemas.domain import (
     DomainCreate as DomainCreate,
     DomainDetail as DomainDetail,
     DomainEdit as DomainEdit,
+    DomainSearchResult as DomainSearchResult,
     DomainTransfer as DomainTransfer,
 )
 from joj.horse.schemas.domain_invitation import (
@@ -39,6 +40,8 @@ from joj.horse.schemas.lakefs import (
 )
 from joj.horse.schemas.misc import (
     AuthTokens as AuthTokens,
+    CacheStats as CacheStats,
+    DatabasePoolStats as DatabasePoolStats,
     OAuth2Client as OAuth2Client,
     Redirect as Redirect,
 )
@@ -71,6 +74,7 @@ from joj.horse.schemas.problem_set import (
     ProblemSetUpdateProblem as ProblemSetUpdateProblem,
 )
 from joj.horse.schemas.query import (
+    CountStrategy as CountStrategy,
     OrderingQuery as OrderingQuery,
     PaginationQuery as PaginationQuery,
 )
@@ -11,6 +11,9 @@ from joj.horse.config import settings
 from joj.horse.models.domain import Domain
 from joj.horse.models.domain_role import DomainRole
 from joj.horse.models.domain_user import DomainUser
+from joj.horse.models.link_tables import ProblemProblemSetLink
+from joj.horse.models.problem import Problem
+from joj.horse.models.problem_set import ProblemSet
 from joj.horse.models.user import User
 from joj.horse.schemas import BaseModel
 from joj.horse.schemas.permission import (
@@ -25,6 +28,7 @@ from joj.horse.schemas.permission import (
     SitePermission,
 )
 from joj.horse.services.oauth import OAuth2Profile
+from joj.horse.services.tiered_cache import LRUCache
 from joj.horse.utils.errors import (
     BizError,
     ErrorCode,
@@ -34,6 +38,7 @@ from joj.horse.utils.errors import (
 )
 
 jwt_scheme = HTTPBearer(bearerFormat="JWT", auto_error=False)
+compiled_domain_permissions = LRUCache(max_size=1024, ttl=3600)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SecretType = Union[str, SecretStr]
@@ -273,24 +278,64 @@ def get_site_permission(site_role: str = Depends(get_site_role)) -> SitePermissi
     return DEFAULT_SITE_PERMISSION[DefaultRole.GUEST]
 
 
+class RouteEntities:
+    """
+    The entities in the path of a route, resolved once per request.
+    """
+
+    def __init__(self, entities: Optional[Dict[str, Any]] = None) -> None:
+        entities = entities or {}
+        self.domain: Optional[Domain] = entities.get("domain")
+        self.domain_user: Optional[DomainUser] = entities.get("domain_user")
+        self.domain_role: Optional[DomainRole] = entities.get("domain_role")
+        self.problem_set: Optional[ProblemSet] = entities.get("problem_set")
+        self.problem: Optional[Problem] = entities.get("problem")
+        self.problem_problem_set_link: Optional[ProblemProblemSetLink] = entities.get(
+            "problem_problem_set_link"
+        )
+
+
+async def resolve_route_entities(
+    request: Request,
+    jwt_access_token: Optional[JWTAccessToken] = Depends(
+        auth_jwt_decode_access_token_optional
+    ),
+) -> RouteEntities:
+    """
+    Load all the url or id path parameters of the route with one statement,
+    instead of a query for each of them in the dependencies.
+    """
+    path_params = request.path_params
+    if "domain" not in path_params:
+        return RouteEntities()
+    user_id = None
+    if jwt_access_token is not None and jwt_access_token.category == "user":
+        user_id = jwt_access_token.id
+    entities = await Domain.find_route_entities(
+        path_params["domain"],
+        user_id,
+        problem_set=path_params.get("problemSet"),
+        problem=path_params.get("problem"),
+    )
+    return RouteEntities(entities)
+
+
 async def get_domain(
     domain: str = Path(..., description="url or id of the domain"),
+    route_entities: RouteEntities = Depends(resolve_route_entities),
 ) -> Domain:
-    domain_model = await Domain.find_by_url_or_id(domain)
-    if domain_model is None:
+    if route_entities.domain is None:
         raise BizError(ErrorCode.DomainNotFoundError)
-    return domain_model
+    return route_entities.domain
 
 
 async def get_domain_user(
     jwt_access_token: JWTAccessToken = Depends(auth_jwt_decode_access_token),
     domain: Domain = Depends(get_domain),
+    route_entities: RouteEntities = Depends(resolve_route_entities),
 ) -> Optional[DomainUser]:
     if jwt_access_token.category == "user":
-        domain_user = await DomainUser.one_or_none(
-            domain_id=domain.id, user_id=jwt_access_token.id
-        )
-        return domain_user
+        return route_entities.domain_user
     return None
 
 
@@ -303,19 +348,31 @@ async def get_domain_role(
     return DefaultRole.GUEST
 
 
+def compile_domain_permission(domain_role: DomainRole) -> DomainPermission:
+    """
+    Parse the permission of the domain role, the parsed permissions are kept
+    until the role is updated, they must not be mutated.
+    """
+    if domain_role.updated_at is None:
+        return DomainPermission(**domain_role.permission)
+    key = (domain_role.id, domain_role.updated_at)
+    permission = compiled_domain_permissions.get(key)
+    if permission is None:
+        permission = DomainPermission(**domain_role.permission)
+        compiled_domain_permissions.set(key, permission)
+    return permission
+
+
 async def get_domain_permission(
-    domain: Domain = Depends(get_domain), domain_role: str = Depends(get_domain_role)
+    domain_role: str = Depends(get_domain_role),
+    route_entities: RouteEntities = Depends(resolve_route_entities),
 ) -> DomainPermission:
     if domain_role == DefaultRole.ROOT:
         return DEFAULT_DOMAIN_PERMISSION[DefaultRole.ROOT]
-    if domain:
-        _domain_role = await DomainRole.one_or_none(
-            domain_id=domain.id, role=domain_role
-        )
-    else:
-        _domain_role = None
+    # the domain role of domain_role is resolved with the domain
+    _domain_role = route_entities.domain_role
     if _domain_role:
-        return DomainPermission(**_domain_role.permission)
+        return compile_domain_permission(_domain_role)
     if domain_role in DEFAULT_DOMAIN_PERMISSION:
         return DEFAULT_DOMAIN_PERMISSION[DefaultRole(domain_role)]
     return DEFAULT_DOMAIN_PERMISSION[DefaultRole.GUEST]
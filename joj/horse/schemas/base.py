@@ -29,7 +29,7 @@ from pydantic import (
     create_model,
 )
 from pydantic.datetime_parse import parse_datetime
-from pydantic.fields import Undefined
+from pydantic.fields import Undefined, UndefinedType
 from pydantic.main import ModelMetaclass
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.functions import FunctionElement
@@ -239,8 +239,10 @@ def get_standard_list_response_sub_model(
     name = cls.__name__
     return create_model(
         f"{name}List",
-        count=(int, 0),
+        count=(Optional[int], 0),
         results=(List[cls], []),  # type: ignore
+        next_cursor=(Optional[str], None),
+        has_more=(bool, False),
         __base__=BaseModel,
     )
 
@@ -303,19 +305,25 @@ class StandardListResponse(Generic[BT]):
     def __new__(
         cls,
         results: Optional[List[BT]] = None,
-        count: Optional[int] = None,
+        count: Union[Optional[int], UndefinedType] = Undefined,
+        next_cursor: Optional[str] = None,
     ) -> "StandardListResponse[BT]":
         if results is None:
             results = []
         data_type = len(results) and type(results[0]) or Empty
         response_type, sub_model_type = get_standard_response_model(data_type, True)
-        if count is None:
+        if count is Undefined:
             count = len(results)
         response_data: PydanticBaseModel
         if sub_model_type is None:
             response_data = Empty()
         else:
-            response_data = sub_model_type(count=count, results=results)
+            response_data = sub_model_type(
+                count=count,
+                results=results,
+                next_cursor=next_cursor,
+                has_more=next_cursor is not None,
+            )
 
         return response_type(  # type: ignore
             error_code=ErrorCode.Success, error_msg=None, data=response_data
@@ -1,15 +1,73 @@
+import hashlib
 import logging
 from functools import lru_cache
+from typing import Any, List, Optional, Type
 
 logging.getLogger("aiocache.serializers").handlers = [
     logging.NullHandler()
 ]  # disable aiocache.serializers logger
+import orjson
 from aiocache import caches
 from aiocache.base import BaseCache
+from aiocache.serializers import BaseSerializer
+from pydantic import BaseModel
 
 from joj.horse.config import settings
 from joj.horse.utils.retry import retry_init
 
+# bump to invalidate all the values cached by the previous versions
+CACHE_FORMAT_VERSION = 1
+
+
+def get_cached_schemas() -> List[Type[BaseModel]]:
+    """
+    The schemas of the cached values, a change of any of them
+    invalidates all the cached values.
+    """
+    from joj.horse.models.domain_role import DomainRole
+    from joj.horse.models.domain_user import DomainUser
+    from joj.horse.schemas.record import RecordPreview
+
+    # the domain users and roles are cached by Domain.find_route_entities
+    return [RecordPreview, DomainUser, DomainRole]
+
+
+@lru_cache()
+def get_cache_schema_version() -> bytes:
+    digest = hashlib.blake2b(str(CACHE_FORMAT_VERSION).encode(), digest_size=4)
+    for schema in get_cached_schemas():
+        digest.update(schema.schema_json().encode())
+    return digest.hexdigest().encode()
+
+
+class VersionedSerializer(BaseSerializer):
+    """
+    Serialize the values with orjson, prefixed by the schema version.
+
+    The values written with another version are loaded as misses, so that
+    the values cached before a deploy are never parsed with the new schemas.
+    uuid and datetime are loaded as str, they should be parsed by the schemas.
+    """
+
+    DEFAULT_ENCODING = None
+
+    def __init__(self, *args: Any, version: Optional[bytes] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        if version is None:
+            version = get_cache_schema_version()
+        self.prefix = version + b":"
+
+    def dumps(self, value: Any) -> bytes:
+        return self.prefix + orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is None or not value.startswith(self.prefix):
+            return None
+        try:
+            return orjson.loads(memoryview(value)[len(self.prefix) :])
+        except orjson.JSONDecodeError:
+            return None
+
 
 @lru_cache()
 def init_cache() -> None:
@@ -17,7 +75,7 @@ def init_cache() -> None:
         {
             "default": {
                 "cache": "aiocache.SimpleMemoryCache",
-                "serializer": {"class": "aiocache.serializers.PickleSerializer"},
+                "serializer": {"class": "joj.horse.schemas.cache.VersionedSerializer"},
             },
             "redis": {
                 "cache": "aiocache.RedisCache",
@@ -26,7 +84,7 @@ def init_cache() -> None:
                 "password": settings.redis_password or None,
                 "db": settings.redis_db_index,
                 "timeout": 1,
-                "serializer": {"class": "aiocache.serializers.PickleSerializer"},
+                "serializer": {"class": "joj.horse.schemas.cache.VersionedSerializer"},
             },
         }
     )
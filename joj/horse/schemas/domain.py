@@ -1,6 +1,8 @@
-from typing import TYPE_CHECKING, Optional
+from enum import Enum
+from typing import TYPE_CHECKING, Any, List, Optional
 from uuid import UUID
 
+from pydantic import validator
 from sqlmodel import Field
 
 from joj.horse.schemas.base import (
@@ -15,6 +17,7 @@ from joj.horse.schemas.base import (
     URLORMSchema,
     UserInputURL,
 )
+from joj.horse.utils.base import StrEnumMixin
 
 if TYPE_CHECKING:
     pass
@@ -79,3 +82,49 @@ class DomainDetail(TimestampMixin, Domain):
 
 class DomainTag(BaseModel):
     __root__: LongStr
+
+
+class DomainSearchResultType(StrEnumMixin, Enum):
+    problem = "problem"
+    problem_set = "problem_set"
+
+
+# the matches in the headlines are delimited by control characters, which are
+# removed from the content first, so that no markup of the content is trusted
+SEARCH_HEADLINE_START = "\x02"
+SEARCH_HEADLINE_STOP = "\x03"
+
+
+def split_search_headline(headline: str) -> List["DomainSearchHeadlinePart"]:
+    first, *matches = headline.split(SEARCH_HEADLINE_START)
+    parts = [DomainSearchHeadlinePart(text=first, match=False)] if first else []
+    for text in matches:
+        match, _, rest = text.partition(SEARCH_HEADLINE_STOP)
+        if match:
+            parts.append(DomainSearchHeadlinePart(text=match, match=True))
+        if rest:
+            parts.append(DomainSearchHeadlinePart(text=rest, match=False))
+    return parts
+
+
+class DomainSearchHeadlinePart(BaseModel):
+    text: str = Field(..., description="plain text, not markup")
+    match: bool = Field(..., description="whether the text matches the query")
+
+
+class DomainSearchResult(BaseModel):
+    type: DomainSearchResultType
+    id: UUID
+    url: str
+    title: str
+    hidden: bool
+    rank: float = Field(..., description="relevance to the query")
+    headline: List[DomainSearchHeadlinePart] = Field(
+        ..., description="fragments of the content split at the matches"
+    )
+
+    @validator("headline", pre=True)
+    def split_headline(cls, v: Any) -> Any:
+        if isinstance(v, str):
+            return split_search_headline(v)
+        return v
@@ -1,3 +1,5 @@
+from pydantic import Field
+
 from joj.horse.schemas import BaseModel
 
 
@@ -24,3 +26,26 @@ class OAuth2Client(BaseModel):
     oauth_name: str
     display_name: str
     icon: str
+
+
+class DatabasePoolStats(BaseModel):
+    name: str
+    pid: int = Field(description="the stats are collected per worker process")
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    checkout_count: int
+    checkout_wait_seconds: float
+    max_checkout_wait_seconds: float
+
+
+class CacheStats(BaseModel):
+    namespace: str
+    pid: int = Field(description="the stats are collected per worker process")
+    local_hits: int = Field(description="served by the in-process cache")
+    redis_hits: int = Field(description="served by redis")
+    misses: int
+    coalesced: int = Field(description="waited for a concurrent load of the key")
+    stale_hits: int = Field(description="served stale while another worker loads")
+    loads: int
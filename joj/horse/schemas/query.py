@@ -1,7 +1,17 @@
-from typing import List
+from enum import Enum
+from typing import List, Optional
 
 from joj.horse.schemas import BaseModel
 from joj.horse.schemas.base import NoneNegativeInt, PaginationLimit
+from joj.horse.utils.base import StrEnumMixin
+
+
+class CountStrategy(StrEnumMixin, Enum):
+    exact = "exact"  # a separate count(*) query
+    window = "window"  # count(*) over () folded into the page query
+    estimated = "estimated"  # row estimate of the query planner
+    cached = "cached"  # exact count cached in redis
+    skipped = "skipped"  # no count, only has_more is reported
 
 
 class OrderingQuery(BaseModel):
@@ -11,3 +21,5 @@ class OrderingQuery(BaseModel):
 class PaginationQuery(BaseModel):
     offset: NoneNegativeInt
     limit: PaginationLimit
+    cursor: Optional[str] = None
+    count: bool = True
@@ -4,6 +4,7 @@ from typing import List, Optional
 from uuid import UUID
 
 from sqlalchemy import JSON
+from sqlalchemy.engine import Row
 from sqlalchemy.schema import Column
 from sqlmodel import Field
 
@@ -80,17 +81,9 @@ class RecordListDetail(Record):
     problem_title: Optional[str] = None
 
     @classmethod
-    def from_row(
-        cls,
-        record: "Record",
-        problem_title: Optional[str],
-        problem_set_title: Optional[str],
-    ) -> "RecordListDetail":
-        return cls(
-            **record.dict(),
-            problem_title=problem_title,
-            problem_set_title=problem_set_title,
-        )
+    def from_row(cls, row: Row) -> "RecordListDetail":
+        # the columns are selected by Domain.find_records_statement, skip validation
+        return cls.construct(**row._mapping)
 
 
 class RecordDetail(Record):
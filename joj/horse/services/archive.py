@@ -0,0 +1,61 @@
+import gzip
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import boto3
+import orjson
+
+from joj.horse.config import settings
+
+# archives whose cases are kept in memory by each worker
+ARCHIVE_CACHE_SIZE = 16
+
+
+@lru_cache
+def get_s3_client() -> Any:
+    scheme = "https" if settings.s3_https else "http"
+    return boto3.client(
+        "s3",
+        endpoint_url=f"{scheme}://{settings.s3_host}:{settings.s3_port}",
+        aws_access_key_id=settings.s3_username,
+        aws_secret_access_key=settings.s3_password,
+    )
+
+
+def get_archive_bucket() -> str:
+    if not settings.bucket_submission.startswith("s3://"):
+        raise ValueError("only s3 bucket can be used as cold storage")
+    return settings.bucket_submission[5:]
+
+
+def get_archive_key(*parts: str) -> str:
+    return "/".join(("archive", *parts))
+
+
+def put_archive(key: str, items: List[Dict[str, Any]]) -> None:
+    """
+    Store the items as gzipped newline delimited json in the submission bucket.
+    """
+    body = gzip.compress(b"".join(orjson.dumps(item) + b"\n" for item in items))
+    get_s3_client().put_object(
+        Bucket=get_archive_bucket(),
+        Key=key,
+        Body=body,
+        ContentType="application/gzip",
+    )
+
+
+def get_archive(key: str) -> List[Dict[str, Any]]:
+    response = get_s3_client().get_object(Bucket=get_archive_bucket(), Key=key)
+    body = gzip.decompress(response["Body"].read())
+    return [orjson.loads(line) for line in body.splitlines() if line]
+
+
+@lru_cache(maxsize=ARCHIVE_CACHE_SIZE)
+def get_archived_cases(key: str) -> Dict[str, Any]:
+    """
+    The cases of the records in an archive by record id. An archive holds
+    a batch of records and is never modified, so it is downloaded once for
+    all of them. The returned cases are shared and must not be mutated.
+    """
+    return {item["id"]: item["cases"] for item in get_archive(key)}
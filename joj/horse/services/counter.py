@@ -0,0 +1,221 @@
+"""
+Buffered counters in Redis.
+
+The increments of a row are accumulated in the hash {namespace}:{id}, and
+the id is added to the set {namespace}:pending. The flusher takes the
+pending hashes atomically and applies them to the database, so that the
+counted rows are not locked by every increment.
+
+Taken increments are moved to {namespace}:processing:{id} and the id to the
+set {namespace}:processing, they are only deleted after the database commit.
+A flush interrupted by an error, a cancellation or a crash leaves them there
+and the next flush applies them again, so increments are never lost. They may
+be applied twice if the process dies between the commit and the deletion.
+Only one flusher runs at a time, guarded by a redis lock. The lease of the
+lock is renewed before each batch, and a batch is cancelled if it is not
+applied within FLUSH_BATCH_TIMEOUT, well before the lease expires, so that
+another flusher never takes the lock while a batch may still commit.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Sequence
+from uuid import UUID
+
+from aioredlock import LockError
+from loguru import logger
+
+from joj.horse.schemas.cache import get_redis_cache
+from joj.horse.services.lock_manager import get_lock_manager
+
+# seconds, the lease of the flush lock and the time to apply a batch within it
+FLUSH_LOCK_TIMEOUT = 60.0
+FLUSH_BATCH_TIMEOUT = 30.0
+
+# KEYS: the hash, the pending set; ARGV: the id, field1, delta1, field2, delta2, ...
+INCREMENT_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+"""
+
+# KEYS: the pending set, the processing set; ARGV: the namespace, the count
+TAKE_SCRIPT = """
+local count = tonumber(ARGV[2]) - redis.call('SCARD', KEYS[2])
+if count > 0 then
+    for _, id in ipairs(redis.call('SPOP', KEYS[1], count)) do
+        local key = ARGV[1] .. ':' .. id
+        local processing_key = ARGV[1] .. ':processing:' .. id
+        local values = redis.call('HGETALL', key)
+        for i = 1, #values, 2 do
+            redis.call('HINCRBY', processing_key, values[i], values[i + 1])
+        end
+        redis.call('DEL', key)
+        redis.call('SADD', KEYS[2], id)
+    end
+end
+local result = {}
+for _, id in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    table.insert(result, id)
+    table.insert(result, redis.call('HGETALL', ARGV[1] .. ':processing:' .. id))
+end
+return result
+"""
+
+# KEYS: the processing set; ARGV: the namespace, id1, id2, ...
+ACK_SCRIPT = """
+for i = 2, #ARGV do
+    redis.call('SREM', KEYS[1], ARGV[i])
+    redis.call('DEL', ARGV[1] .. ':processing:' .. ARGV[i])
+end
+"""
+
+# KEYS: the hashes
+GET_SCRIPT = """
+local result = {}
+for _, key in ipairs(KEYS) do
+    table.insert(result, redis.call('HGETALL', key))
+end
+return result
+"""
+
+CounterValues = Dict[str, int]
+
+
+def parse_counter_values(items: Sequence[str]) -> CounterValues:
+    return {items[i]: int(items[i + 1]) for i in range(0, len(items), 2)}
+
+
+class BufferedCounter:
+    def __init__(self, namespace: str, fields: Sequence[str]) -> None:
+        self.namespace = namespace
+        self.fields = tuple(fields)
+
+    def get_key(self, id: UUID) -> str:
+        return f"{self.namespace}:{id}"
+
+    def get_pending_key(self) -> str:
+        return f"{self.namespace}:pending"
+
+    def get_processing_key(self, id: UUID) -> str:
+        return f"{self.namespace}:processing:{id}"
+
+    def get_processing_set_key(self) -> str:
+        return f"{self.namespace}:processing"
+
+    def validate(self, values: CounterValues) -> None:
+        for field in values:
+            if field not in self.fields:
+                raise ValueError(f"unknown counter field: {field}")
+
+    async def increment(self, id: UUID, values: CounterValues) -> None:
+        self.validate(values)
+        args: List[str] = [str(id)]
+        for field, delta in values.items():
+            args.extend((field, str(delta)))
+        cache = get_redis_cache()
+        await cache.raw(
+            "eval",
+            INCREMENT_SCRIPT,
+            [self.get_key(id), self.get_pending_key()],
+            args,
+        )
+
+    async def get_pending(self, ids: Iterable[UUID]) -> Dict[UUID, CounterValues]:
+        """
+        Get the increments not flushed yet, ids without increments are omitted.
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+        keys = []
+        for id in ids:
+            keys.extend((self.get_key(id), self.get_processing_key(id)))
+        cache = get_redis_cache()
+        result = await cache.raw("eval", GET_SCRIPT, keys, [])
+        pending = {}
+        for i, id in enumerate(ids):
+            values = parse_counter_values(result[2 * i])
+            for field, delta in parse_counter_values(result[2 * i + 1]).items():
+                values[field] = values.get(field, 0) + delta
+            if values:
+                pending[id] = values
+        return pending
+
+    async def take(self, count: int) -> Dict[UUID, CounterValues]:
+        """
+        Move at most count pending increments to processing and return them,
+        together with the ones left in processing by an interrupted flush.
+        """
+        cache = get_redis_cache()
+        result = await cache.raw(
+            "eval",
+            TAKE_SCRIPT,
+            [self.get_pending_key(), self.get_processing_set_key()],
+            [self.namespace, str(count)],
+        )
+        return {
+            UUID(result[i]): parse_counter_values(result[i + 1])
+            for i in range(0, len(result), 2)
+        }
+
+    async def ack(self, ids: Iterable[UUID]) -> None:
+        """
+        Delete the taken increments after they are applied.
+        """
+        cache = get_redis_cache()
+        await cache.raw(
+            "eval",
+            ACK_SCRIPT,
+            [self.get_processing_set_key()],
+            [self.namespace, *map(str, ids)],
+        )
+
+    async def flush(
+        self,
+        apply: Callable[[Dict[UUID, CounterValues]], Awaitable[Any]],
+        batch_size: int,
+    ) -> int:
+        """
+        Apply the pending increments in batches, return the number of ids applied.
+        Return 0 if another flusher holds the lock.
+        """
+        lock_manager = get_lock_manager()
+        try:
+            lock = await lock_manager.lock(
+                f"{self.namespace}:flush", lock_timeout=FLUSH_LOCK_TIMEOUT
+            )
+        except LockError:
+            return 0
+        count = 0
+        try:
+            while True:
+                # stop if the lease is lost, another flusher may hold the lock
+                await lock_manager.extend(lock)
+                pending = await self.take(batch_size)
+                if pending:
+                    await asyncio.wait_for(apply(pending), FLUSH_BATCH_TIMEOUT)
+                    await self.ack(pending)
+                    count += len(pending)
+                if len(pending) < batch_size:
+                    return count
+        except LockError:
+            logger.warning(f"lost the lock of flushing {self.namespace}")
+            return count
+        finally:
+            try:
+                await lock_manager.unlock(lock)
+            except LockError:
+                pass
+
+
+async def run_flusher(flush: Callable[[], Awaitable[Any]], interval: float) -> None:
+    """
+    Call flush every interval seconds until cancelled.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush()
+        except Exception as e:
+            logger.error("error when flushing counters:")
+            logger.exception(e)
@@ -1,10 +1,30 @@
+import asyncio
 import logging
+import random
+import time
 from contextlib import asynccontextmanager
 from functools import lru_cache
-from typing import AsyncGenerator
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+from uuid import uuid4
 
+from asyncpg import Connection as AsyncpgConnection
+from fastapi import Request
+from fastapi_jwt_auth import AuthJWT
 from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import URL, Connection, make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session, SessionTransaction
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.util.concurrency import greenlet_spawn
 from sqlalchemy_utils import create_database, database_exists
 from sqlmodel import SQLModel
@@ -12,8 +32,11 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette_context import context
 
 from joj.horse.config import settings
+from joj.horse.services.trigram import detect_trigram, ensure_trigram_indexes
 from joj.horse.utils.retry import retry_init
 
+T = TypeVar("T", bound=Callable[..., Any])
+
 
 @lru_cache()
 def get_db_url() -> str:
@@ -26,18 +49,89 @@ def get_db_url() -> str:
     )
 
 
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Record the checkouts and the time spent on waiting for them.
+    """
+
+    checkout_count = 0
+    checkout_wait_seconds = 0.0
+    max_checkout_wait_seconds = 0.0
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkout_count += 1
+            self.checkout_wait_seconds += elapsed
+            self.max_checkout_wait_seconds = max(
+                self.max_checkout_wait_seconds, elapsed
+            )
+
+
+class PgBouncerConnection(AsyncpgConnection):
+    # pgbouncer in transaction mode may reuse a server connection which
+    # already has a prepared statement with the same name
+    def _get_unique_id(self, prefix: str) -> str:
+        return f"__asyncpg_{prefix}_{uuid4()}__"
+
+
+def create_db_engine(db_url: Union[str, URL]) -> AsyncEngine:
+    connect_args: Dict[str, Any] = {
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_statement_cache_size,
+    }
+    if settings.db_pgbouncer:
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            connection_class=PgBouncerConnection,
+        )
+    return create_async_engine(
+        db_url,
+        future=True,
+        echo=settings.db_echo,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
 @lru_cache()
 def get_db_engine() -> AsyncEngine:
     db_url = get_db_url()
-    engine = create_async_engine(db_url, future=True, echo=settings.db_echo)
+    engine = create_db_engine(db_url)
     logging.getLogger("sqlalchemy.engine.Engine").handlers = [logging.NullHandler()]
     return engine
 
 
 @asynccontextmanager
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
-    # if a session is created for the request, use it directly
-    if context.exists() and "db_session" in context:
+    # if the request has a session, create it on first use and reuse it
+    if context.exists() and "db_session_request" in context:
+        # the engine is resolved with awaits, the lock keeps the concurrent
+        # first uses in the request from creating a session each
+        if "db_session_lock" not in context:
+            context["db_session_lock"] = asyncio.Lock()
+        async with context["db_session_lock"]:
+            if "db_session" not in context:
+                request = context["db_session_request"]
+                engine = await get_request_db_engine(request, AuthJWT(req=request))
+                session = AsyncSession(engine)
+                timeout = getattr(
+                    request.scope.get("endpoint"),
+                    "statement_timeout",
+                    settings.db_statement_timeout,
+                )
+                if timeout > 0:
+                    set_statement_timeout(session, timeout)
+                context["db_session"] = session
         try:
             yield context["db_session"]
         finally:
@@ -51,10 +145,113 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+@lru_cache()
+def get_db_replica_engines() -> List[AsyncEngine]:
+    engines = []
+    for dsn in settings.db_replicas.split(","):
+        if dsn.strip():
+            db_url = make_url(dsn.strip()).set(drivername="postgresql+asyncpg")
+            engines.append(create_db_engine(db_url))
+    return engines
+
+
+def get_db_engines() -> Dict[str, AsyncEngine]:
+    engines = {"primary": get_db_engine()}
+    for i, engine in enumerate(get_db_replica_engines()):
+        engines[f"replica{i}"] = engine
+    return engines
+
+
+def use_primary_db(endpoint: T) -> T:
+    """
+    Mark a GET endpoint which writes to the database,
+    so that it is not routed to the read replicas.
+    """
+    endpoint.use_primary_db = True  # type: ignore
+    return endpoint
+
+
+def statement_timeout(seconds: float) -> Callable[[T], T]:
+    """
+    Set the statement timeout of the request session for an endpoint.
+    """
+
+    def decorator(endpoint: T) -> T:
+        endpoint.statement_timeout = seconds  # type: ignore
+        return endpoint
+
+    return decorator
+
+
+def set_statement_timeout(session: AsyncSession, seconds: float) -> None:
+    milliseconds = int(seconds * 1000)
+
+    # SET LOCAL only lasts for the transaction, so that the pooled
+    # connections (or pgbouncer server connections) are not affected
+    @event.listens_for(session.sync_session, "after_begin")
+    def set_local_statement_timeout(
+        _session: Session, transaction: SessionTransaction, connection: Connection
+    ) -> None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {milliseconds}")
+
+
+# noinspection PyBroadException
+def get_jwt_user_id(auth_jwt: AuthJWT) -> Optional[str]:
+    try:
+        auth_jwt.jwt_optional()
+        payload = auth_jwt.get_raw_jwt()
+    except Exception:
+        return None
+    if not payload or payload.get("category") != "user":
+        return None
+    return str(payload.get("sub"))
+
+
+async def get_request_db_engine(request: Request, auth_jwt: AuthJWT) -> AsyncEngine:
+    """
+    Route the read-only requests to a random replica.
+    A user is pinned to the primary for a short time after writing,
+    so that users can always read their own writes.
+    """
+    replica_engines = get_db_replica_engines()
+    if not replica_engines:
+        return get_db_engine()
+    from joj.horse.schemas.cache import get_redis_cache
+
+    cache = get_redis_cache()
+    user_id = get_jwt_user_id(auth_jwt)
+    endpoint = request.scope.get("endpoint")
+    if request.method not in ("GET", "HEAD") or getattr(
+        endpoint, "use_primary_db", False
+    ):
+        if user_id is not None:
+            await cache.set(
+                user_id,
+                True,
+                ttl=settings.db_replica_pin_seconds,
+                namespace="db_primary_users",
+            )
+        return get_db_engine()
+    if user_id is not None and await cache.exists(
+        user_id, namespace="db_primary_users"
+    ):
+        return get_db_engine()
+    return random.choice(replica_engines)
+
+
+async def request_db_session_dependency(request: Request) -> AsyncGenerator[None, None]:
+    # the session of the request is created by db_session on first use,
+    # requests not using the database do not create it at all
+    context["db_session_request"] = request
+    try:
+        yield
+    finally:
+        if "db_session" in context:
+            await context["db_session"].close()
+
+
 async def db_session_dependency() -> AsyncGenerator[AsyncSession, None]:
-    # create a session for each request
     async with db_session() as session:
-        context["db_session"] = session
         yield session
 
 
@@ -70,9 +267,12 @@ async def ensure_db() -> None:
         logger.info("Database {} created.", settings.db_name)
         async with engine.begin() as conn:
             await conn.run_sync(SQLModel.metadata.create_all)
+            await ensure_trigram_indexes(conn)
             logger.info("SQLModel generated schema.")
     else:  # pragma: no cover
         logger.info("Database {} already exists.", settings.db_name)
+    async with engine.connect() as conn:
+        await detect_trigram(conn)
 
 
 @retry_init("SQLModel")
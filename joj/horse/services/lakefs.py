@@ -79,10 +79,11 @@ def create_bucket(bucket: str) -> None:
     if not settings.s3_host or not settings.s3_port:
         raise ValueError("s3 host or port not defined")
     logger.info(f"LakeFS: create bucket {bucket} automatically.")
+    scheme = "https" if settings.s3_https else "http"
     try:
         s3 = boto3.resource(
             "s3",
-            endpoint_url=f"http://{settings.s3_host}:{settings.s3_port}",
+            endpoint_url=f"{scheme}://{settings.s3_host}:{settings.s3_port}",
             aws_access_key_id=settings.s3_username,
             aws_secret_access_key=settings.s3_password,
             # config=Config(signature_version="s3v4"),
@@ -12,7 +12,7 @@ def get_redis_instances() -> List[Dict[str, Any]]:
         {
             "host": settings.redis_host,
             "port": settings.redis_port,
-            "password": settings.redis_password,
+            "password": settings.redis_password or None,
             "db": settings.redis_db_index,
         }
     ]
@@ -0,0 +1,151 @@
+"""
+Monthly range partitions of tables partitioned by created_at.
+
+The partitions are named {table}_{YYYY}_{MM}, rows outside of all the
+monthly partitions fall into {table}_default. A monthly partition can not be
+created while the default partition has rows of its month, these rows are
+moved into the new partition by create_monthly_partitions.
+"""
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.expression import text
+
+# tables that may be partitioned by the migrations
+PARTITIONED_TABLES = ("records",)
+PARTITION_NAME_RE = re.compile(r"(?P<table>\w+?)_(?P<year>\d{4})_(?P<month>\d{2})")
+
+
+def get_month_start(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def get_partition_name(table: str, month: datetime) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def get_default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def parse_partition_name(table: str, name: str) -> Optional[datetime]:
+    match = PARTITION_NAME_RE.fullmatch(name)
+    if match is None or match["table"] != table:
+        return None
+    return datetime(int(match["year"]), int(match["month"]), 1, tzinfo=timezone.utc)
+
+
+def is_partition_of(table: str, name: str) -> bool:
+    return (
+        name == get_default_partition_name(table)
+        or parse_partition_name(table, name) is not None
+    )
+
+
+def get_create_partition_sql(table: str, month: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {get_partition_name(table, month)} "
+        f"PARTITION OF {table} FOR VALUES "
+        f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def get_create_default_partition_sql(table: str) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {get_default_partition_name(table)} "
+        f"PARTITION OF {table} DEFAULT"
+    )
+
+
+async def is_partitioned(conn: AsyncConnection, table: str) -> bool:
+    statement = text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table"
+    )
+    result = await conn.execute(statement, {"table": table})
+    return result.first() is not None
+
+
+async def get_partition_names(conn: AsyncConnection, table: str) -> List[str]:
+    statement = text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table"
+    )
+    result = await conn.execute(statement, {"table": table})
+    return [name for (name,) in result]
+
+
+async def get_monthly_partitions(
+    conn: AsyncConnection, table: str
+) -> List[Tuple[str, datetime]]:
+    partitions = []
+    for name in await get_partition_names(conn, table):
+        month = parse_partition_name(table, name)
+        if month is not None:
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda x: x[1])
+
+
+async def create_monthly_partitions(
+    conn: AsyncConnection, table: str, start: datetime, months: int
+) -> List[str]:
+    """
+    Ensure the monthly partitions of the months from start.
+    If the default partition has rows of a new month, it is detached,
+    the rows are moved into the new partition and it is attached again.
+    The table is locked until the transaction of conn is committed.
+    """
+    partitions = await get_partition_names(conn, table)
+    default_name = get_default_partition_name(table)
+    month = get_month_start(start)
+    names = []
+    for _ in range(months):
+        name = get_partition_name(table, month)
+        if name not in partitions:
+            if default_name in partitions and await has_rows_in_month(
+                conn, default_name, month
+            ):
+                await move_default_rows(conn, table, month)
+            else:
+                await conn.execute(text(get_create_partition_sql(table, month)))
+        names.append(name)
+        month = add_months(month, 1)
+    return names
+
+
+def get_month_range(month: datetime) -> Dict[str, datetime]:
+    return {"start": month, "end": add_months(month, 1)}
+
+
+async def has_rows_in_month(conn: AsyncConnection, name: str, month: datetime) -> bool:
+    statement = text(
+        f"SELECT 1 FROM {name} "
+        "WHERE created_at >= :start AND created_at < :end LIMIT 1"
+    )
+    result = await conn.execute(statement, get_month_range(month))
+    return result.first() is not None
+
+
+async def move_default_rows(conn: AsyncConnection, table: str, month: datetime) -> None:
+    default_name = get_default_partition_name(table)
+    await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default_name}"))
+    await conn.execute(text(get_create_partition_sql(table, month)))
+    statement = text(
+        f"WITH moved AS (DELETE FROM {default_name} "
+        "WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {table} SELECT * FROM moved"
+    )
+    await conn.execute(statement, get_month_range(month))
+    await conn.execute(
+        text(f"ALTER TABLE {table} ATTACH PARTITION {default_name} DEFAULT")
+    )
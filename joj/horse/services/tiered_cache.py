@@ -0,0 +1,406 @@
+"""
+Two-tier cache, an in-process LRU in front of Redis.
+
+Every worker keeps the values it reads from Redis in a bounded LRU with a
+short TTL. A write to Redis publishes the written keys on the invalidation
+channel, and every other worker evicts them from its LRU, so a worker reads
+a stale value at most until the message arrives. The local tier is only used
+while the worker is subscribed to the channel, and it is cleared whenever the
+subscription is (re)established, because messages may have been missed.
+
+The values in the local tier are shared by the readers, they must not be
+mutated.
+
+get_or_load protects the keys expensive to load from stampedes. Concurrent
+loads of a key are coalesced in the worker, and across the workers only the
+holder of a short lease in Redis loads it while the others wait for the value
+or use the stale one. With a ttl, a key is refreshed before it expires with a
+probability growing as the expiry approaches (XFetch), so that the hot keys
+are reloaded by one caller instead of all of them missing at the same time.
+"""
+import asyncio
+import math
+import random
+import time
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    DefaultDict,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from uuid import uuid4
+
+import aioredis
+import orjson
+from loguru import logger
+
+from joj.horse.config import settings
+from joj.horse.schemas.cache import get_redis_cache
+
+# KEYS: the lease; ARGV: the token of the holder
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+"""
+
+# set by the leader of a flight if it is cancelled, the waiters retry
+RETRY = object()
+
+
+class LRUCache:
+    """
+    Bounded LRU with TTL, the least recently used entry is evicted on overflow
+    and the expired entries are evicted when they are read.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.max_size <= 0:
+            return
+        if ttl is None or ttl > self.ttl:
+            ttl = self.ttl
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class TieredCache:
+    def __init__(
+        self,
+        channel: str,
+        local_max_size: int,
+        local_ttl: float,
+        lease_ttl: float = 5,
+        lease_poll_interval: float = 0.05,
+        refresh_beta: float = 1,
+    ) -> None:
+        self.channel = channel
+        self.local = LRUCache(local_max_size, local_ttl)
+        self.lease_ttl = lease_ttl
+        self.lease_poll_interval = lease_poll_interval
+        # larger values refresh earlier
+        self.refresh_beta = refresh_beta
+        self.flights: Dict[Tuple[str, str], "asyncio.Future[Any]"] = {}
+        # the messages published by this instance are ignored by itself
+        self.sender = uuid4().hex
+        self.listening = False
+        # bumped by every invalidation, a value read from redis is not kept
+        # locally if an invalidation arrives while it is being read
+        self.generation = 0
+        self.stats: DefaultDict[str, Counter] = defaultdict(Counter)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            namespace: {
+                "local_hits": counter["local_hits"],
+                "redis_hits": counter["redis_hits"],
+                "misses": counter["misses"],
+                "coalesced": counter["coalesced"],
+                "stale_hits": counter["stale_hits"],
+                "loads": counter["loads"],
+            }
+            for namespace, counter in self.stats.items()
+        }
+
+    def get_local(self, namespace: str, key: str) -> Optional[Any]:
+        if not self.listening:
+            return None
+        return self.local.get((namespace, key))
+
+    def set_local(
+        self, namespace: str, key: str, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        if self.listening and value is not None:
+            self.local.set((namespace, key), value, ttl)
+
+    async def get(self, key: str, namespace: str) -> Optional[Any]:
+        value = self.get_local(namespace, key)
+        if value is not None:
+            self.stats[namespace]["local_hits"] += 1
+            return value
+        generation = self.generation
+        value = await get_redis_cache().get(key, namespace=namespace)
+        if value is None:
+            self.stats[namespace]["misses"] += 1
+            return None
+        self.stats[namespace]["redis_hits"] += 1
+        if generation == self.generation:
+            self.set_local(namespace, key, value)
+        return value
+
+    async def multi_get(self, keys: Sequence[str], namespace: str) -> List[Any]:
+        values: List[Any] = [self.get_local(namespace, key) for key in keys]
+        missed_indices = [i for i, value in enumerate(values) if value is None]
+        self.stats[namespace]["local_hits"] += len(keys) - len(missed_indices)
+        if not missed_indices:
+            return values
+        generation = self.generation
+        missed_values = await get_redis_cache().multi_get(
+            [keys[i] for i in missed_indices], namespace=namespace
+        )
+        keep_local = generation == self.generation
+        for i, value in zip(missed_indices, missed_values):
+            values[i] = value
+            if value is None:
+                self.stats[namespace]["misses"] += 1
+                continue
+            self.stats[namespace]["redis_hits"] += 1
+            if keep_local:
+                self.set_local(namespace, keys[i], value)
+        return values
+
+    async def set(
+        self, key: str, value: Any, namespace: str, ttl: Optional[int] = None
+    ) -> None:
+        await get_redis_cache().set(key, value, ttl=ttl, namespace=namespace)
+        await self.publish(namespace, [key])
+        self.set_local(namespace, key, value, ttl)
+
+    async def multi_set(
+        self,
+        pairs: Sequence[Tuple[str, Any]],
+        namespace: str,
+        ttl: Optional[int] = None,
+    ) -> None:
+        if not pairs:
+            return
+        await get_redis_cache().multi_set(pairs, ttl=ttl, namespace=namespace)
+        await self.publish(namespace, [key for key, _ in pairs])
+        for key, value in pairs:
+            self.set_local(namespace, key, value, ttl)
+
+    async def delete(self, key: str, namespace: str) -> None:
+        await self.multi_delete([key], namespace=namespace)
+
+    async def multi_delete(self, keys: Sequence[str], namespace: str) -> None:
+        cache = get_redis_cache()
+        for key in keys:
+            self.local.delete((namespace, key))
+            await cache.delete(key, namespace=namespace)
+        await self.publish(namespace, keys)
+
+    async def publish(self, namespace: str, keys: Iterable[str]) -> None:
+        message = orjson.dumps(
+            {"sender": self.sender, "namespace": namespace, "keys": list(keys)}
+        )
+        await get_redis_cache().raw("publish", self.channel, message)
+
+    def get_lease_key(self, key: str, namespace: str) -> str:
+        return f"cache_lease:{namespace}:{key}"
+
+    async def acquire_lease(self, key: str, namespace: str) -> Optional[str]:
+        token = uuid4().hex
+        acquired = await get_redis_cache().raw(
+            "set",
+            self.get_lease_key(key, namespace),
+            token,
+            pexpire=int(self.lease_ttl * 1000),
+            exist="SET_IF_NOT_EXIST",
+        )
+        return token if acquired else None
+
+    async def release_lease(self, key: str, namespace: str, token: str) -> None:
+        await get_redis_cache().raw(
+            "eval",
+            RELEASE_LEASE_SCRIPT,
+            [self.get_lease_key(key, namespace)],
+            [token],
+        )
+
+    def should_refresh(self, entry: Dict[str, Any]) -> bool:
+        """
+        XFetch, refresh with a probability growing as the expiry approaches,
+        earlier for the values taking longer to load.
+        """
+        gap = -entry["delta"] * self.refresh_beta * math.log(1 - random.random())
+        return time.time() + gap >= entry["expires_at"]
+
+    async def get_or_load(
+        self,
+        key: str,
+        namespace: str,
+        load: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """
+        Get the value of the key, or load and cache it if it is missing,
+        coalescing the concurrent loads of the key in the worker and across
+        the workers. The loaded value must not be None.
+
+        With a ttl, the value is cached with the time it took to load and its
+        expiry for the early refresh, so a namespace should either always or
+        never be given a ttl here, and not be written by set directly.
+        """
+        flight_key = (namespace, key)
+        while True:
+            flight = self.flights.get(flight_key)
+            if flight is None:
+                break
+            self.stats[namespace]["coalesced"] += 1
+            value = await asyncio.shield(flight)
+            if value is not RETRY:
+                return value
+        flight = asyncio.get_running_loop().create_future()
+        self.flights[flight_key] = flight
+        try:
+            value = await self.load_shared(key, namespace, load, ttl)
+        except asyncio.CancelledError:
+            flight.set_result(RETRY)
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # retrieved, the waiters (if any) raise it
+            flight.exception()
+            raise
+        else:
+            flight.set_result(value)
+            return value
+        finally:
+            del self.flights[flight_key]
+
+    async def load_shared(
+        self,
+        key: str,
+        namespace: str,
+        load: Callable[[], Awaitable[Any]],
+        ttl: Optional[int],
+    ) -> Any:
+        entry = await self.get(key, namespace=namespace)
+        if entry is not None:
+            if ttl is None:
+                return entry
+            if not self.should_refresh(entry):
+                return entry["value"]
+        token = await self.acquire_lease(key, namespace)
+        if token is None:
+            if entry is not None:
+                # another worker is refreshing it
+                self.stats[namespace]["stale_hits"] += 1
+                return entry["value"] if ttl is not None else entry
+            entry = await self.wait_for_lease(key, namespace)
+            if entry is not None:
+                return entry["value"] if ttl is not None else entry
+        try:
+            start = time.perf_counter()
+            value = await load()
+            self.stats[namespace]["loads"] += 1
+            if ttl is None:
+                await self.set(key, value, namespace=namespace)
+            else:
+                entry = {
+                    "value": value,
+                    "delta": time.perf_counter() - start,
+                    "expires_at": time.time() + ttl,
+                }
+                await self.set(key, entry, namespace=namespace, ttl=ttl)
+        finally:
+            if token is not None:
+                await self.release_lease(key, namespace, token)
+        return value
+
+    async def wait_for_lease(self, key: str, namespace: str) -> Optional[Any]:
+        """
+        Wait for the holder of the lease to cache the value, at most until
+        the lease expires. Return None if the value is still missing.
+        """
+        deadline = time.monotonic() + self.lease_ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.lease_poll_interval)
+            entry = await get_redis_cache().get(key, namespace=namespace)
+            if entry is not None:
+                self.stats[namespace]["coalesced"] += 1
+                return entry
+        return None
+
+    def invalidate(self, message: bytes) -> None:
+        try:
+            data = orjson.loads(message)
+            if data["sender"] == self.sender:
+                return
+            namespace = data["namespace"]
+            keys = data["keys"]
+        except (orjson.JSONDecodeError, TypeError, KeyError):
+            logger.warning("invalid cache invalidation message: {}", message)
+            self.local.clear()
+            self.generation += 1
+            return
+        for key in keys:
+            self.local.delete((namespace, key))
+        self.generation += 1
+
+    def reset_local(self, listening: bool) -> None:
+        self.local.clear()
+        self.generation += 1
+        self.listening = listening
+
+    async def listen(self, retry_interval: float = 1) -> None:
+        """
+        Subscribe to the invalidation channel until cancelled,
+        the subscription is retried if the connection is lost.
+        """
+        while True:
+            redis = None
+            try:
+                redis = await aioredis.create_redis(
+                    (settings.redis_host, settings.redis_port),
+                    password=settings.redis_password or None,
+                )
+                (channel,) = await redis.subscribe(self.channel)
+                self.reset_local(True)
+                while await channel.wait_message():
+                    self.invalidate(await channel.get())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("error when listening to cache invalidations:")
+                logger.exception(e)
+            finally:
+                self.reset_local(False)
+                if redis is not None:
+                    redis.close()
+            await asyncio.sleep(retry_interval)
+
+
+@lru_cache()
+def get_tiered_cache() -> TieredCache:
+    # channels are shared by all the databases of a redis server
+    return TieredCache(
+        channel=f"cache_invalidation:{settings.redis_db_index}",
+        local_max_size=settings.cache_local_size,
+        local_ttl=settings.cache_local_ttl,
+    )
@@ -0,0 +1,68 @@
+"""
+Trigram indexes of pg_trgm for substring search.
+
+The GIN indexes are not declared in the models, because their operator
+class only exists after the extension is created. They are created by the
+migrations, or by ensure_trigram_indexes on a database created from the
+models. The search falls back to plain ILIKE scans if the extension is not
+available on the server.
+"""
+import re
+from typing import Dict, Tuple
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.expression import text
+
+# columns searched with ILIKE '%query%'
+TRIGRAM_INDEXED_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "users": ("username_lower", "email_lower", "student_id", "real_name"),
+}
+TRIGRAM_INDEX_NAME_RE = re.compile(r"ix_\w+_trgm")
+
+trigram_enabled = False
+
+
+def is_trigram_enabled() -> bool:
+    return trigram_enabled
+
+
+def get_trigram_index_name(table: str, column: str) -> str:
+    return f"ix_{table}_{column}_trgm"
+
+
+def is_trigram_index(name: str) -> bool:
+    return TRIGRAM_INDEX_NAME_RE.fullmatch(name) is not None
+
+
+def get_create_trigram_index_sql(table: str, column: str) -> str:
+    return (
+        f"CREATE INDEX IF NOT EXISTS {get_trigram_index_name(table, column)} "
+        f"ON {table} USING gin ({column} gin_trgm_ops)"
+    )
+
+
+async def detect_trigram(conn: AsyncConnection) -> bool:
+    global trigram_enabled
+    result = await conn.execute(
+        text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    )
+    trigram_enabled = result.first() is not None
+    return trigram_enabled
+
+
+async def ensure_trigram_indexes(conn: AsyncConnection) -> bool:
+    """
+    Create the extension and the indexes if the extension is available.
+    """
+    result = await conn.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    )
+    if result.first() is None:
+        logger.warning("pg_trgm is not available, user search is not indexed.")
+        return False
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for table, columns in TRIGRAM_INDEXED_COLUMNS.items():
+        for column in columns:
+            await conn.execute(text(get_create_trigram_index_sql(table, column)))
+    return True
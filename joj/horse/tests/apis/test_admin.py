@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+from pytest_lazyfixture import lazy_fixture
+
+from joj.horse import apis, models
+from joj.horse.app import app
+from joj.horse.tests.utils.utils import (
+    do_api_request,
+    generate_auth_headers,
+    get_base_url,
+)
+from joj.horse.utils.errors import ErrorCode
+from joj.horse.utils.fastapi.ndjson import NDJSON_MEDIA_TYPE
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(name="TestAdmin", on=["TestAuthLogin"])
+class TestAdmin:
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    async def test_list_db_pools(self, client: AsyncClient, user: models.User) -> None:
+        url = app.url_path_for("list_db_pools")
+        response = await do_api_request(client, "GET", url, user)
+        assert response.status_code == 200
+        res = response.json()
+        assert res["errorCode"] == ErrorCode.Success
+        pools = res["data"]["results"]
+        assert pools[0]["name"] == "primary"
+        assert pools[0]["size"] >= 0
+        # the previous requests have used the pool
+        assert pools[0]["checkoutCount"] >= 1
+
+    @pytest.mark.parametrize("user", [lazy_fixture("global_guest_user")])
+    async def test_list_db_pools_forbidden(
+        self, client: AsyncClient, user: models.User
+    ) -> None:
+        url = app.url_path_for("list_db_pools")
+        response = await do_api_request(client, "GET", url, user)
+        assert response.status_code == 403
+
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    async def test_list_users_ndjson(
+        self, client: AsyncClient, user: models.User
+    ) -> None:
+        # the users router has a list_users endpoint as well
+        url = f"{get_base_url(apis.admin)}/users"
+        headers = generate_auth_headers(user)
+        headers["Accept"] = NDJSON_MEDIA_TYPE
+        response = await do_api_request(
+            client, "GET", url, user, {"ordering": "created_at"}, headers=headers
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == NDJSON_MEDIA_TYPE
+        users = [json.loads(line) for line in response.text.splitlines()]
+        assert user.username in [x["username"] for x in users]
+        assert all("hashedPassword" not in x for x in users)
+        # the same rows in the same order as the pages
+        response = await do_api_request(
+            client, "GET", url, user, {"ordering": "created_at", "limit": "500"}
+        )
+        assert response.status_code == 200
+        res = response.json()
+        assert [x["id"] for x in users] == [x["id"] for x in res["data"]["results"]]
+
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    async def test_list_cache_stats(
+        self, client: AsyncClient, user: models.User
+    ) -> None:
+        url = app.url_path_for("list_cache_stats")
+        response = await do_api_request(client, "GET", url, user)
+        assert response.status_code == 200
+        res = response.json()
+        assert res["errorCode"] == ErrorCode.Success
+        for stats in res["data"]["results"]:
+            assert stats["localHits"] >= 0
+            assert stats["redisHits"] >= 0
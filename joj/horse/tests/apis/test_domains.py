@@ -249,6 +249,60 @@ class TestDomainList:
     ) -> None:
         await self.list_domain_helper(client, user, "-updated_at")
 
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    @pytest.mark.parametrize("ordering", ["updated_at", "-created_at"])
+    async def test_list_domain_cursor(
+        self, client: AsyncClient, user: models.User, ordering: str
+    ) -> None:
+        res = await self.list_domain_helper(client, user, ordering)
+        expected = [x["id"] for x in res["results"]]
+        query = {"ordering": ordering, "limit": "2"}
+        ids = []
+        while True:
+            response = await do_api_request(client, "GET", self.url, user, query)
+            res = validate_response(response)
+            assert res["count"] == GLOBAL_DOMAIN_COUNT + 2
+            assert len(res["results"]) <= 2
+            ids.extend(x["id"] for x in res["results"])
+            if not res["nextCursor"]:
+                break
+            query["cursor"] = res["nextCursor"]
+        assert ids == expected
+
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    async def test_list_domain_cursor_illegal(
+        self, client: AsyncClient, user: models.User
+    ) -> None:
+        response = await do_api_request(
+            client, "GET", self.url, user, {"ordering": "updated_at", "limit": "2"}
+        )
+        res = validate_response(response)
+        response = await do_api_request(
+            client,
+            "GET",
+            self.url,
+            user,
+            {"ordering": "-updated_at", "cursor": res["nextCursor"]},
+        )
+        res = response.json()
+        assert res["errorCode"] == ErrorCode.IllegalFieldError
+
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    async def test_list_domain_skip_count(
+        self, client: AsyncClient, user: models.User
+    ) -> None:
+        response = await do_api_request(
+            client, "GET", self.url, user, {"limit": "1", "count": "false"}
+        )
+        res = validate_response(response)
+        assert res["count"] is None
+        assert len(res["results"]) == 1
+        assert res["hasMore"]
+        response = await do_api_request(client, "GET", self.url, user)
+        res = validate_response(response)
+        assert res["count"] == GLOBAL_DOMAIN_COUNT + 2
+        assert not res["hasMore"]
+
     @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
     async def test_list_domain_illegal_field(
         self, client: AsyncClient, user: models.User
@@ -390,6 +444,25 @@ class TestDomainUserGet:
     async def test_global_users(self) -> None:
         pass
 
+    @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
+    async def test_search_candidates(
+        self, client: AsyncClient, user: models.User, global_domain: models.Domain
+    ) -> None:
+        url = app.url_path_for("search_domain_candidates", domain=global_domain.url)
+        response = await do_api_request(
+            client, "GET", url, user, {"query": "global_guest_user"}
+        )
+        res = validate_response(response)
+        usernames = [x["username"] for x in res["results"]]
+        # the exact match is ranked first
+        assert usernames[0] == "global_guest_user"
+        response = await do_api_request(client, "GET", url, user, {"query": "global"})
+        res = validate_response(response)
+        domain_users = await models.DomainUser.all(domain_id=global_domain.id)
+        member_ids = {str(x.user_id) for x in domain_users}
+        assert str(user.id) in member_ids
+        assert all(x["id"] not in member_ids for x in res["results"])
+
 
 @pytest.mark.asyncio
 @pytest.mark.depends(name="TestDomainUserRemove", on=["TestDomainUserGet"])
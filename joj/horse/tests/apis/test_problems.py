@@ -1,7 +1,16 @@
+from typing import Any, Dict, List
+
 import pytest
+from httpx import AsyncClient
 
 from joj.horse import apis, models
-from joj.horse.tests.utils.utils import get_base_url, parametrize_global_problems
+from joj.horse.app import app
+from joj.horse.tests.utils.utils import (
+    do_api_request,
+    get_base_url,
+    parametrize_global_problems,
+    validate_response,
+)
 
 base_user_url = get_base_url(apis.user)
 
@@ -12,3 +21,63 @@ class TestProblemCreate:
     @parametrize_global_problems
     async def test_global_problems(self, problem: models.Problem) -> None:
         pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestProblemSetCreate", "TestDomainUserAdd"])
+class TestProblemSearch:
+    @staticmethod
+    async def search(
+        client: AsyncClient, user: models.User, domain: models.Domain, query: str
+    ) -> List[Dict[str, Any]]:
+        url = app.url_path_for("search_domain", domain=domain.url)
+        response = await do_api_request(client, "GET", url, user, {"query": query})
+        return validate_response(response)["results"]
+
+    async def test_search(
+        self,
+        client: AsyncClient,
+        global_domain: models.Domain,
+        global_root_user: models.User,
+        global_domain_user: models.User,
+        global_problem_set: models.ProblemSet,
+    ) -> None:
+        problems = [
+            models.Problem(
+                domain_id=global_domain.id,
+                owner_id=global_root_user.id,
+                title=title,
+                url=f"search_problem_{i}",
+                content=content,
+                hidden=hidden,
+            )
+            for i, (title, content, hidden) in enumerate(
+                [
+                    ("needle in the title", "", False),
+                    ("haystack", "<b>a haystack</b> with a \x02needle inside", False),
+                    ("hidden needle", "", True),
+                ]
+            )
+        ]
+        await models.Problem.bulk_insert(problems)
+        results = await self.search(client, global_root_user, global_domain, "needle")
+        # the matches in the title are ranked first
+        urls = [x["url"] for x in results]
+        assert set(urls[:2]) == {"search_problem_0", "search_problem_2"}
+        assert urls[2] == "search_problem_1"
+        # the content is plain text, only the matches are marked
+        headline = results[2]["headline"]
+        assert [x["text"] for x in headline if x["match"]] == ["needle"]
+        assert "haystack" in headline[0]["text"]
+        assert "\x02" not in "".join(x["text"] for x in headline)
+        results = await self.search(client, global_domain_user, global_domain, "needle")
+        assert [x["url"] for x in results] == ["search_problem_0", "search_problem_1"]
+        results = await self.search(
+            client, global_root_user, global_domain, "needle -haystack"
+        )
+        assert {x["url"] for x in results} == {"search_problem_0", "search_problem_2"}
+        results = await self.search(
+            client, global_root_user, global_domain, global_problem_set.title
+        )
+        assert results[0]["type"] == "problem_set"
+        assert results[0]["id"] == str(global_problem_set.id)
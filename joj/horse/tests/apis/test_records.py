@@ -1,16 +1,49 @@
+from typing import Optional
+from uuid import UUID
+
 import pytest
 from httpx import AsyncClient
 from pytest_lazyfixture import lazy_fixture
+from sqlalchemy.sql.expression import literal, select
+from sqlalchemy.types import DateTime
+from sqlmodel.sql.sqltypes import GUID
 
 from joj.horse import models
 from joj.horse.app import app
+from joj.horse.schemas.cache import get_redis_cache
+from joj.horse.services.db import db_session
 from joj.horse.tests.utils.utils import (
+    count_sql_statements,
     create_test_problem,
     create_test_problem_set,
     do_api_request,
     validate_test_problem,
     validate_test_problem_set,
 )
+from joj.horse.utils.base import uuid7
+
+
+async def upsert_latest_record(
+    user_id: UUID,
+    problem_id: UUID,
+    problem_set_id: Optional[UUID],
+    record: models.Record,
+) -> None:
+    # the upsert of the submission, see Record.get_submit_statement
+    statement = models.UserLatestRecord.get_upsert_statement(
+        select(
+            literal(uuid7(), GUID),
+            literal(user_id, GUID),
+            literal(problem_id, GUID),
+            literal(problem_set_id, GUID),
+            literal(record.id, GUID),
+            literal(record.created_at, DateTime(timezone=True)),
+        ),
+        problem_set_id,
+    )
+    async with db_session() as session:
+        await session.execute(statement)
+        await session.commit()
 
 
 @pytest.fixture(scope="module")
@@ -276,6 +309,103 @@ class TestRecordList:
         )
 
 
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestDomainCreate"])
+class TestUserLatestRecord:
+    async def test_get_user_latest_record(
+        self,
+        global_root_user: models.User,
+        problem_0: models.Problem,
+        problem_1: models.Problem,
+        problem_set_0: models.ProblemSet,
+        record_0: models.Record,
+        record_1: models.Record,
+        record_2: models.Record,
+    ) -> None:
+        for record in (record_0, record_1):
+            await upsert_latest_record(
+                user_id=global_root_user.id,
+                problem_id=record.problem_id,
+                problem_set_id=record.problem_set_id,
+                record=record,
+            )
+        for problem_set_id, problem_id, record in (
+            (None, problem_0.id, record_0),
+            (problem_set_0.id, problem_0.id, record_1),
+        ):
+            latest_record = await models.Record.get_user_latest_record(
+                problem_set_id, problem_id, global_root_user.id, use_cache=False
+            )
+            assert latest_record is not None
+            assert latest_record.id == record.id
+        latest_record = await models.Record.get_user_latest_record(
+            None, problem_1.id, global_root_user.id, use_cache=False
+        )
+        assert latest_record is None
+        # upsert replaces the latest record of (user, problem, problem set)
+        await upsert_latest_record(
+            user_id=global_root_user.id,
+            problem_id=problem_0.id,
+            problem_set_id=None,
+            record=record_2,
+        )
+        latest_record = await models.Record.get_user_latest_record(
+            None, problem_0.id, global_root_user.id, use_cache=False
+        )
+        assert latest_record is not None
+        assert latest_record.id == record_2.id
+        # an older record committed later does not replace the latest record
+        await upsert_latest_record(
+            user_id=global_root_user.id,
+            problem_id=problem_0.id,
+            problem_set_id=None,
+            record=record_0,
+        )
+        latest_record = await models.Record.get_user_latest_record(
+            None, problem_0.id, global_root_user.id, use_cache=False
+        )
+        assert latest_record is not None
+        assert latest_record.id == record_2.id
+
+    async def test_get_user_latest_records_cache_miss(
+        self,
+        global_root_user: models.User,
+        problem_0: models.Problem,
+        problem_1: models.Problem,
+        problem_set_0: models.ProblemSet,
+        record_1: models.Record,
+    ) -> None:
+        await upsert_latest_record(
+            user_id=global_root_user.id,
+            problem_id=problem_0.id,
+            problem_set_id=problem_set_0.id,
+            record=record_1,
+        )
+        problem_ids = [problem_0.id, problem_1.id]
+        cache = get_redis_cache()
+        for problem_id in problem_ids:
+            key = models.Record.get_user_latest_record_key(
+                problem_set_0.id, problem_id, global_root_user.id
+            )
+            await cache.delete(key, namespace="user_latest_records")
+        # all cache misses are resolved by one query
+        with count_sql_statements() as statements:
+            records = await models.Record.get_user_latest_records(
+                problem_set_0.id, problem_ids, global_root_user.id
+            )
+        assert len(statements) == 1
+        assert records[0] is not None
+        assert records[0].id == record_1.id
+        assert records[1] is None
+        # the misses are cached, including the empty one
+        with count_sql_statements() as statements:
+            cached_records = await models.Record.get_user_latest_records(
+                problem_set_0.id, problem_ids, global_root_user.id
+            )
+        assert len(statements) == 0
+        assert cached_records == records
+
+
 #     @pytest.mark.parametrize("user", [lazy_fixture("global_root_user")])
 #     async def test_list_domain_desc(
 #         self, client: AsyncClient, user: models.User
@@ -38,6 +38,8 @@ async def postgres(request: Any) -> None:
     init_logging(test=True)
     settings.db_name += "_test"
     settings.db_echo = False
+    # the tests flush the counters themselves, without racing the flusher
+    settings.counter_flush_interval = 0
     db_url = get_db_url()
     try:
         await greenlet_spawn(drop_database, db_url)
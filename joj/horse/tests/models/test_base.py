@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta, timezone
+from typing import List
+from uuid import UUID
+
+import pytest
+from sqlmodel import select
+
+from joj.horse import models
+from joj.horse.schemas.permission import DefaultRole
+from joj.horse.schemas.query import OrderingQuery, PaginationQuery
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestDomainCreate"])
+class TestBulkWrite:
+    async def test_bulk_insert(self) -> None:
+        problem_groups = [models.ProblemGroup() for _ in range(3)]
+        result = await models.ProblemGroup.bulk_insert(problem_groups, returning=True)
+        assert [x.id for x in result] == [x.id for x in problem_groups]
+        for problem_group in result:
+            assert problem_group.created_at is not None
+            assert problem_group.updated_at is not None
+        assert await models.ProblemGroup.bulk_insert([]) == []
+
+    async def test_bulk_insert_problems(
+        self, global_domain_2: models.Domain, global_root_user: models.User
+    ) -> None:
+        problems = [
+            models.Problem(
+                domain_id=global_domain_2.id,
+                owner_id=global_root_user.id,
+                title=f"bulk_problem_{i}",
+                url=f"bulk_problem_{i}",
+                content="",
+            )
+            for i in range(2)
+        ]
+        await models.Problem.bulk_insert(problems)
+        for problem in problems:
+            result = await models.Problem.one_or_none(id=problem.id)
+            assert result is not None
+            assert result.url == problem.url
+            assert result.num_submit == 0
+
+    async def test_bulk_upsert(self, global_domain_2: models.Domain) -> None:
+        domain_roles = [
+            models.DomainRole(
+                domain_id=global_domain_2.id, role=f"bulk_{i}", permission={"i": i}
+            )
+            for i in range(2)
+        ]
+        result = await models.DomainRole.bulk_upsert(
+            domain_roles, ["domain_id", "role"], returning=True
+        )
+        assert len(result) == 2
+        domain_roles = [
+            models.DomainRole(
+                domain_id=global_domain_2.id, role=f"bulk_{i}", permission={"i": -i}
+            )
+            for i in range(3)
+        ]
+        result = await models.DomainRole.bulk_upsert(
+            domain_roles, ["domain_id", "role"], returning=True
+        )
+        assert {x.role: x.permission for x in result} == {
+            "bulk_0": {"i": 0},
+            "bulk_1": {"i": -1},
+            "bulk_2": {"i": -2},
+        }
+        # the ids of the existing rows are kept
+        domain_role = await models.DomainRole.one_or_none(
+            domain_id=global_domain_2.id, role="bulk_2"
+        )
+        assert domain_role is not None and domain_role.id == domain_roles[2].id
+        result = await models.DomainRole.bulk_upsert(
+            [
+                models.DomainRole(
+                    domain_id=global_domain_2.id, role="bulk_0", permission={}
+                )
+            ],
+            ["domain_id", "role"],
+            update_fields=[],
+            returning=True,
+        )
+        assert result == []
+
+    async def test_bulk_update(self, global_domain_2: models.Domain) -> None:
+        domain_roles = [
+            domain_role
+            for domain_role in await models.DomainRole.all(domain_id=global_domain_2.id)
+            if domain_role.role.startswith("bulk_")
+        ]
+        for domain_role in domain_roles:
+            domain_role.permission = {"updated": domain_role.role}
+        result = await models.DomainRole.bulk_update(
+            domain_roles, ["permission"], returning=True
+        )
+        assert len(result) == len(domain_roles) == 3
+        domain_role = await models.DomainRole.one_or_none(
+            domain_id=global_domain_2.id, role="bulk_1"
+        )
+        assert domain_role is not None
+        assert domain_role.permission == {"updated": "bulk_1"}
+        domain_role = await models.DomainRole.one_or_none(
+            domain_id=global_domain_2.id, role=str(DefaultRole.ROOT)
+        )
+        assert domain_role is not None
+        assert "updated" not in domain_role.permission
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestDomainCreate"])
+class TestKeysetPagination:
+    @pytest.mark.parametrize(
+        "orderings", [["due_at"], ["-due_at"], ["due_at", "-title"]]
+    )
+    async def test_null_values(
+        self,
+        global_domain_2: models.Domain,
+        global_root_user: models.User,
+        orderings: List[str],
+    ) -> None:
+        due_at = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        problem_sets = [
+            models.ProblemSet(
+                domain_id=global_domain_2.id,
+                owner_id=global_root_user.id,
+                title=f"keyset_{i % 2}",
+                url=f"keyset_{'_'.join(orderings)}_{i}",
+                due_at=due_at + timedelta(days=i % 3) if i % 2 else None,
+            )
+            for i in range(6)
+        ]
+        await models.ProblemSet.bulk_insert(problem_sets)
+        statement = select(models.ProblemSet).where(
+            models.ProblemSet.url.startswith(f"keyset_{'_'.join(orderings)}_")
+        )
+        ordering = OrderingQuery(orderings=orderings)
+        rows, _, _ = await models.ProblemSet.execute_list_statement(
+            statement, ordering, PaginationQuery(offset=0, limit=100)
+        )
+        expected = [x.id for x in rows]
+        assert len(expected) == len(problem_sets)
+
+        # the pages go through the rows sorted by NULL values
+        ids: List[UUID] = []
+        pagination = PaginationQuery(offset=0, limit=1)
+        while True:
+            rows, _, next_cursor = await models.ProblemSet.execute_list_statement(
+                statement, ordering, pagination
+            )
+            ids.extend(x.id for x in rows)
+            if next_cursor is None:
+                break
+            pagination = PaginationQuery(offset=0, limit=1, cursor=next_cursor)
+        assert ids == expected
@@ -0,0 +1,271 @@
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from joj.horse import models
+from joj.horse.models.base import URL_LOOKUP_NAMESPACE, URL_LOOKUP_TTL
+from joj.horse.models.permission import DefaultRole
+from joj.horse.schemas.base import Operation
+from joj.horse.schemas.cache import get_redis_cache
+from joj.horse.schemas.user import JudgerCreate
+from joj.horse.services.db import get_db_engine
+from joj.horse.services.tiered_cache import get_tiered_cache
+
+
+@contextmanager
+def record_statements() -> Iterator[List[str]]:
+    statements: List[str] = []
+
+    def before_cursor_execute(*args: Any) -> None:
+        statements.append(args[2])
+
+    engine = get_db_engine().sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestProblemSetCreate", "TestDomainUserAdd"])
+class TestDomainRouteEntities:
+    async def test_find_route_entities(
+        self,
+        global_domain: models.Domain,
+        global_problem_set: models.ProblemSet,
+        global_root_user: models.User,
+        global_domain_user: models.User,
+    ) -> None:
+        problems = [
+            models.Problem(
+                domain_id=global_domain.id,
+                owner_id=global_root_user.id,
+                title=f"route_problem_{i}",
+                url=f"route_problem_{i}",
+                content="",
+            )
+            for i in range(2)
+        ]
+        await models.Problem.bulk_insert(problems)
+        await global_problem_set.operate_problem(problems[0], Operation.Create)
+
+        with record_statements() as statements:
+            entities = await models.Domain.find_route_entities(
+                global_domain.url,
+                str(global_domain_user.id),
+                problem_set=global_problem_set.url,
+                problem=str(problems[0].id),
+            )
+        assert len(statements) == 1
+        assert entities["domain"].id == global_domain.id
+        assert entities["domain_user"].user_id == global_domain_user.id
+        assert entities["domain_role"].role == entities["domain_user"].role
+        assert entities["problem_set"].id == global_problem_set.id
+        assert entities["problem"].id == problems[0].id
+        link = entities["problem_problem_set_link"]
+        assert link.problem_id == problems[0].id
+
+        entities = await models.Domain.find_route_entities(
+            str(global_domain.id),
+            None,
+            problem_set=str(global_problem_set.id),
+            problem=problems[1].url,
+        )
+        assert "domain_user" not in entities
+        assert entities["problem"].id == problems[1].id
+        assert entities["problem_problem_set_link"] is None
+
+        entities = await models.Domain.find_route_entities(
+            global_domain.url, None, problem="route_problem_not_exist"
+        )
+        assert entities["domain"].id == global_domain.id
+        assert entities["problem"] is None
+
+        entities = await models.Domain.find_route_entities(
+            "route_domain_not_exist", None
+        )
+        assert all(value is None for value in entities.values())
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestProblemSetCreate", "TestDomainUserAdd"])
+class TestDomainURLLookup:
+    async def test_find_by_url_lookup(
+        self,
+        global_domain: models.Domain,
+        global_domain_2: models.Domain,
+        global_root_user: models.User,
+    ) -> None:
+        url = "lookup_problem"
+        assert await models.Problem.find_by_domain_url_or_id(global_domain, url) is None
+        key = models.Problem.get_url_lookup_key(global_domain.id, url)
+        cache = get_tiered_cache()
+        assert await cache.get(key, namespace=URL_LOOKUP_NAMESPACE) == {"id": None}
+
+        # the rows not found are invalidated on insert
+        problem = models.Problem(
+            domain_id=global_domain.id,
+            owner_id=global_root_user.id,
+            title=url,
+            url=url,
+            content="",
+        )
+        await problem.save_model()
+        result = await models.Problem.find_by_domain_url_or_id(global_domain, url)
+        assert result is not None and result.id == problem.id
+        value = await cache.get(key, namespace=URL_LOOKUP_NAMESPACE)
+        assert str(value["id"]) == str(problem.id)
+        # the rows found expire too
+        ttl = await get_redis_cache().raw("ttl", f"{URL_LOOKUP_NAMESPACE}:{key}")
+        assert 0 < ttl <= URL_LOOKUP_TTL
+        result = await models.Problem.find_by_domain_url_or_id(global_domain, url)
+        assert result is not None and result.id == problem.id
+        # scoped by the domain
+        assert (
+            await models.Problem.find_by_domain_url_or_id(global_domain_2, url) is None
+        )
+
+        # the old url is invalidated on update
+        problem.url = f"{url}_renamed"
+        await problem.save_model()
+        assert await models.Problem.find_by_domain_url_or_id(global_domain, url) is None
+        result = await models.Problem.find_by_domain_url_or_id(
+            global_domain, problem.url
+        )
+        assert result is not None and result.id == problem.id
+
+        await problem.delete_model()
+        assert (
+            await models.Problem.find_by_domain_url_or_id(
+                global_domain, str(problem.id)
+            )
+            is None
+        )
+        assert (
+            await models.Problem.find_by_domain_url_or_id(global_domain, problem.url)
+            is None
+        )
+
+    async def test_route_entities_not_found(self) -> None:
+        domain = "lookup_domain_not_exist"
+        entities = await models.Domain.find_route_entities(domain, None)
+        assert entities["domain"] is None
+
+        with record_statements() as statements:
+            entities = await models.Domain.find_route_entities(domain, None)
+            assert await models.Domain.find_by_url_or_id(domain) is None
+        assert entities["domain"] is None
+        assert statements == []
+
+    async def test_lookup_error_not_cached(
+        self, monkeypatch: pytest.MonkeyPatch, global_domain: models.Domain
+    ) -> None:
+        def execute(*args: Any, **kwargs: Any) -> None:
+            raise OperationalError("SELECT", {}, Exception("connection lost"))
+
+        domain = "lookup_domain_error"
+        url = "lookup_problem_error"
+        with monkeypatch.context() as m:
+            m.setattr(Session, "execute", execute)
+            with pytest.raises(OperationalError):
+                await models.Domain.find_route_entities(domain, None)
+            with pytest.raises(OperationalError):
+                await models.Problem.find_by_domain_url_or_id(global_domain, url)
+        # only the rows not found by the queries succeeded are cached
+        cache = get_tiered_cache()
+        key = models.Domain.get_url_lookup_key(None, domain)
+        assert await cache.get(key, namespace=URL_LOOKUP_NAMESPACE) is None
+        key = models.Problem.get_url_lookup_key(global_domain.id, url)
+        assert await cache.get(key, namespace=URL_LOOKUP_NAMESPACE) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestDomainUserAdd"])
+class TestDomainAuthCache:
+    async def find_auth(
+        self, domain: models.Domain, user: models.User
+    ) -> Tuple[Optional[models.DomainUser], Optional[models.DomainRole]]:
+        # the first call caches the id of the domain, the second one the auth
+        for _ in range(2):
+            await models.Domain.find_route_entities(domain.url, str(user.id))
+        with record_statements() as statements:
+            entities = await models.Domain.find_route_entities(domain.url, str(user.id))
+        assert len(statements) == 1
+        assert "domain_users" not in statements[0]
+        assert "domain_roles" not in statements[0]
+        assert entities["domain"].id == domain.id
+        return entities["domain_user"], entities["domain_role"]
+
+    async def test_invalidate(
+        self, global_domain_2: models.Domain, global_guest_user: models.User
+    ) -> None:
+        domain_user, domain_role = await self.find_auth(
+            global_domain_2, global_guest_user
+        )
+        assert domain_user is None
+        assert domain_role is not None and domain_role.role == DefaultRole.GUEST
+
+        domain_role = models.DomainRole(
+            domain_id=global_domain_2.id, role="auth_cache", permission={}
+        )
+        await domain_role.save_model()
+        domain_user = await models.DomainUser.add_domain_user(
+            global_domain_2.id, global_guest_user.id, domain_role.role
+        )
+        await domain_user.save_model()
+        result, result_role = await self.find_auth(global_domain_2, global_guest_user)
+        assert result is not None and result.id == domain_user.id
+        assert result_role is not None and result_role.id == domain_role.id
+        assert result_role.permission == {}
+
+        domain_role.permission = {"general": {"view": True}}
+        await domain_role.save_model()
+        _, result_role = await self.find_auth(global_domain_2, global_guest_user)
+        assert result_role is not None
+        assert result_role.permission == {"general": {"view": True}}
+
+        await domain_user.delete_model()
+        result, result_role = await self.find_auth(global_domain_2, global_guest_user)
+        assert result is None
+        assert result_role is not None and result_role.role == DefaultRole.GUEST
+
+    async def test_invalidate_bulk(self, global_domain_2: models.Domain) -> None:
+        auth_key = await models.Domain.get_auth_cache_key(global_domain_2.id, None)
+        domain_role = models.DomainRole(
+            domain_id=global_domain_2.id, role="auth_cache_bulk", permission={}
+        )
+        await models.DomainRole.bulk_insert([domain_role])
+        new_auth_key = await models.Domain.get_auth_cache_key(global_domain_2.id, None)
+        assert new_auth_key != auth_key
+
+        domain_role.permission = {"general": {"view": True}}
+        await models.DomainRole.bulk_update([domain_role], ["permission"])
+        auth_key = await models.Domain.get_auth_cache_key(global_domain_2.id, None)
+        assert new_auth_key != auth_key
+
+    async def test_invalidate_user_deletion(
+        self, global_domain_2: models.Domain
+    ) -> None:
+        user = await models.User.create_judger(
+            JudgerCreate(
+                username="auth_cache_user",
+                email="auth_cache_user@example.com",
+                password="auth_cache_user",
+            )
+        )
+        domain_user = await models.DomainUser.add_domain_user(
+            global_domain_2.id, user.id, DefaultRole.GUEST
+        )
+        await domain_user.save_model()
+        result, _ = await self.find_auth(global_domain_2, user)
+        assert result is not None and result.id == domain_user.id
+
+        # the domain user is deleted by ON DELETE CASCADE
+        await user.delete_model()
+        result, _ = await self.find_auth(global_domain_2, user)
+        assert result is None
@@ -0,0 +1,81 @@
+from typing import List
+
+import pytest
+from sqlmodel import select
+
+from joj.horse import models
+from joj.horse.schemas.base import Operation
+from joj.horse.services.db import db_session
+
+
+async def get_problem_urls(problem_set: models.ProblemSet) -> List[str]:
+    statement = (
+        select(models.Problem.url)
+        .join(models.ProblemProblemSetLink)
+        .where(models.ProblemProblemSetLink.problem_set_id == problem_set.id)
+        .order_by(models.ProblemProblemSetLink.position)
+    )
+    async with db_session() as session:
+        return list((await session.exec(statement)).all())
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestProblemSetCreate"])
+class TestProblemSetOperateProblem:
+    async def test_operate_problem(
+        self, global_problem_set_1: models.ProblemSet, global_root_user: models.User
+    ) -> None:
+        problem_set = global_problem_set_1
+        problems = [
+            models.Problem(
+                domain_id=problem_set.domain_id,
+                owner_id=global_root_user.id,
+                title=f"position_problem_{i}",
+                url=f"position_problem_{i}",
+                content="",
+            )
+            for i in range(4)
+        ]
+        await models.Problem.bulk_insert(problems)
+        urls = [problem.url for problem in problems]
+        for problem in problems[:3]:
+            await problem_set.operate_problem(problem, Operation.Create)
+        assert await get_problem_urls(problem_set) == urls[:3]
+        await problem_set.operate_problem(problems[3], Operation.Create, 0)
+        assert await get_problem_urls(problem_set) == [urls[3], *urls[:3]]
+        await problem_set.operate_problem(problems[3], Operation.Update, 2)
+        assert await get_problem_urls(problem_set) == [*urls[:2], urls[3], urls[2]]
+        await problem_set.operate_problem(problems[0], Operation.Update, 100)
+        assert await get_problem_urls(problem_set) == [
+            *urls[1:2],
+            urls[3],
+            *urls[2:3],
+            urls[0],
+        ]
+        await problem_set.operate_problem(problems[3], Operation.Delete)
+        assert await get_problem_urls(problem_set) == [urls[1], urls[2], urls[0]]
+
+    async def test_rebalance(
+        self, global_problem_set_1: models.ProblemSet, global_root_user: models.User
+    ) -> None:
+        problem_set = global_problem_set_1
+        problems = [
+            models.Problem(
+                domain_id=problem_set.domain_id,
+                owner_id=global_root_user.id,
+                title=f"rebalance_problem_{i}",
+                url=f"rebalance_problem_{i}",
+                content="",
+            )
+            for i in range(16)
+        ]
+        await models.Problem.bulk_insert(problems)
+        urls = await get_problem_urls(problem_set)
+        # halve the gap after the first problem until the positions are rebalanced
+        for problem in problems:
+            await problem_set.operate_problem(problem, Operation.Create, 1)
+            urls.insert(1, problem.url)
+            assert await get_problem_urls(problem_set) == urls
+        links = await models.ProblemProblemSetLink.all(problem_set_id=problem_set.id)
+        positions = [link.position for link in links]
+        assert len(set(positions)) == len(positions)
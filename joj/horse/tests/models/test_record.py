@@ -0,0 +1,276 @@
+import asyncio
+from datetime import timedelta
+from io import BytesIO
+from time import perf_counter
+from typing import Any, Dict, Tuple
+
+import pytest
+from fastapi import BackgroundTasks
+from httpx import AsyncClient
+from loguru import logger
+
+from joj.horse import models, schemas
+from joj.horse.app import app
+from joj.horse.models.problem import problem_counter
+from joj.horse.schemas.problem import ProblemSolutionSubmit
+from joj.horse.services import archive, counter
+from joj.horse.tests.utils.utils import do_api_request
+from joj.horse.utils.errors import BizError, ErrorCode
+
+SUBMIT_COUNT = 20
+
+
+async def create_problem(
+    domain: models.Domain, user: models.User, url: str, with_config: bool
+) -> models.Problem:
+    problem = models.Problem(
+        domain_id=domain.id,
+        owner_id=user.id,
+        title=url,
+        url=url,
+        content="",
+        languages=["c"],
+    )
+    await problem.save_model()
+    if with_config:
+        problem_config = models.ProblemConfig(
+            problem_id=problem.id, committer_id=user.id, commit_id=url
+        )
+        await problem_config.save_model()
+    return problem
+
+
+async def submit(problem: models.Problem, user: models.User) -> models.Record:
+    return await models.Record.submit(
+        background_tasks=BackgroundTasks(),
+        celery_app=None,  # type: ignore
+        problem_submit=ProblemSolutionSubmit(language="c", files=[]),
+        problem_set=None,
+        problem=problem,
+        user=user,
+    )
+
+
+class FakeS3Client:
+    def __init__(self) -> None:
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.get_count = 0
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs: Any) -> None:
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        self.get_count += 1
+        return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+
+
+@pytest.fixture
+def s3_client(monkeypatch: Any) -> FakeS3Client:
+    client = FakeS3Client()
+    monkeypatch.setattr(archive, "get_s3_client", lambda: client)
+    archive.get_archived_cases.cache_clear()
+    return client
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestDomainCreate"])
+class TestRecordSubmit:
+    async def test_submit(
+        self, global_domain_1: models.Domain, global_root_user: models.User
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_submit_problem", True
+        )
+        record = await submit(problem, global_root_user)
+        assert record.problem_id == problem.id
+        assert record.committer_id == global_root_user.id
+        assert record.problem_config_id is not None
+        assert record.created_at is not None
+        latest_record = await models.Record.get_user_latest_record(
+            None, problem.id, global_root_user.id, use_cache=False
+        )
+        assert latest_record is not None
+        assert latest_record.id == record.id
+
+    async def test_submit_without_config(
+        self, global_domain_1: models.Domain, global_root_user: models.User
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_submit_no_config", False
+        )
+        with pytest.raises(BizError) as e:
+            await submit(problem, global_root_user)
+        assert e.value.error_code == ErrorCode.ProblemConfigNotFoundError
+        assert await models.Record.all(problem_id=problem.id) == []
+        problem = await models.Problem.one_or_none(id=problem.id)
+        assert problem is not None and problem.num_submit == 0
+
+    async def test_submit_concurrently(
+        self, global_domain_1: models.Domain, global_root_user: models.User
+    ) -> None:
+        """
+        A benchmark of the submission latency, and num_submit must not lose
+        any of the concurrent increments.
+        """
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_submit_concurrently", True
+        )
+
+        async def timed_submit() -> Tuple[models.Record, float]:
+            problem_copy = await models.Problem.one_or_none(id=problem.id)
+            start = perf_counter()
+            record = await submit(problem_copy, global_root_user)  # type: ignore
+            return record, perf_counter() - start
+
+        results: Any = await asyncio.gather(
+            *(timed_submit() for _ in range(SUBMIT_COUNT))
+        )
+        latencies = sorted(latency for _, latency in results)
+        logger.info(
+            f"submit latency of {SUBMIT_COUNT} concurrent submissions: "
+            f"p50 {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+            f"max {latencies[-1] * 1000:.2f}ms"
+        )
+        # the increments are buffered until flushed
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        await models.Problem.load_pending_counters([problem])
+        assert problem.num_submit == SUBMIT_COUNT
+        await models.Problem.flush_counters()
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_submit == SUBMIT_COUNT
+        await models.Problem.load_pending_counters([problem])
+        assert problem.num_submit == SUBMIT_COUNT
+        records = await models.Record.all(problem_id=problem.id)
+        assert len(records) == SUBMIT_COUNT
+
+    async def test_accept_counter(
+        self, global_domain_1: models.Domain, global_root_user: models.User
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_accept_counter", True
+        )
+        await models.Problem.increment_counters(problem.id, num_accept=2)
+        await models.Problem.increment_counters(problem.id, num_accept=1)
+        await models.Problem.load_pending_counters([problem])
+        assert problem.num_accept == 3
+        assert problem.num_submit == 0
+        await models.Problem.flush_counters()
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_accept == 3
+        with pytest.raises(ValueError):
+            await models.Problem.increment_counters(problem.id, num_view=1)
+
+    async def test_flush_interrupted(
+        self, global_domain_1: models.Domain, global_root_user: models.User
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_flush_interrupted", True
+        )
+        await submit(problem, global_root_user)
+
+        async def cancelled_apply(pending: Any) -> None:
+            assert problem.id in pending
+            raise asyncio.CancelledError()
+
+        # the taken increments survive a cancelled flush
+        with pytest.raises(asyncio.CancelledError):
+            await problem_counter.flush(cancelled_apply, 1000)
+        await submit(problem, global_root_user)
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_submit == 0
+        await models.Problem.load_pending_counters([problem])
+        assert problem.num_submit == 2
+        await models.Problem.flush_counters()
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_submit == 2
+        await models.Problem.flush_counters()
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_submit == 2
+
+    async def test_flush_timeout(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        global_domain_1: models.Domain,
+        global_root_user: models.User,
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_flush_timeout", True
+        )
+        await submit(problem, global_root_user)
+        monkeypatch.setattr(counter, "FLUSH_BATCH_TIMEOUT", 0.1)
+
+        async def slow_apply(pending: Any) -> None:
+            await asyncio.sleep(1)
+
+        # the batch is cancelled before the lease of the lock can expire,
+        # and the lock is released for the next flush
+        with pytest.raises(asyncio.TimeoutError):
+            await problem_counter.flush(slow_apply, 1000)
+        await models.Problem.flush_counters()
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_submit == 1
+
+    async def test_judge_accept_counter(
+        self,
+        client: AsyncClient,
+        global_domain_1: models.Domain,
+        global_root_user: models.User,
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_judge_accept_counter", True
+        )
+        record = await submit(problem, global_root_user)
+        url = app.url_path_for(
+            "submit_record_by_judger", domain=global_domain_1.url, record=record.id
+        )
+        # accepting the record again does not count twice
+        for _ in range(2):
+            response = await do_api_request(
+                client,
+                "PUT",
+                url,
+                global_root_user,
+                data={"state": schemas.RecordState.accepted},
+            )
+            assert response.status_code == 200
+            assert response.json()["errorCode"] == "Success"
+        await models.Problem.flush_counters()
+        problem = await models.Problem.one_or_none(id=problem.id)  # type: ignore
+        assert problem.num_submit == 1
+        assert problem.num_accept == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestDomainCreate"])
+class TestRecordArchive:
+    async def test_archive_cases(
+        self,
+        s3_client: FakeS3Client,
+        global_domain_1: models.Domain,
+        global_root_user: models.User,
+    ) -> None:
+        problem = await create_problem(
+            global_domain_1, global_root_user, "record_archive_cases", True
+        )
+        records = [await submit(problem, global_root_user) for _ in range(2)]
+        cases = [schemas.RecordCase(score=i, stdout=f"case {i}") for i in range(3)]
+        for i, record in enumerate(records):
+            record.cases = [case.dict() for case in cases[i:]]
+            await record.save_model()
+        start = records[0].created_at
+        end = records[1].created_at + timedelta(microseconds=1)
+        archived = await models.Record.archive_cases(start, end, "test/archive")
+        assert archived == 2
+        # archiving again skips the archived records
+        assert await models.Record.archive_cases(start, end, "test/archive") == 0
+        assert len(s3_client.objects) == 1
+
+        key = f"archive/test/archive/{records[0].id}.ndjson.gz"
+        for i, record in enumerate(records):
+            record = await models.Record.one_or_none(id=record.id)  # type: ignore
+            assert record.cases == []
+            assert record.cases_archive_key == key
+            await record.load_archived_cases()
+            assert [schemas.RecordCase(**case) for case in record.cases] == cases[i:]
+        # the archive of the batch is downloaded once
+        assert s3_client.get_count == 1
@@ -0,0 +1,79 @@
+import pickle
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, Callable, List
+
+import pytest
+from loguru import logger
+
+from joj.horse.schemas.cache import VersionedSerializer, get_redis_cache
+from joj.horse.schemas.record import RecordPreview, RecordState
+from joj.horse.utils.base import uuid7
+
+BENCHMARK_COUNT = 1000
+
+
+def get_user_latest_record_values(count: int) -> List[Any]:
+    return [
+        {
+            "record": RecordPreview(
+                id=uuid7(),
+                state=RecordState.accepted,
+                created_at=datetime.now(tz=timezone.utc),
+            ).dict()
+        }
+        for _ in range(count)
+    ]
+
+
+def test_serializer() -> None:
+    serializer = VersionedSerializer()
+    value = get_user_latest_record_values(1)[0]
+    loaded = serializer.loads(serializer.dumps(value))
+    assert RecordPreview(**loaded["record"]) == RecordPreview(**value["record"])
+    assert serializer.loads(serializer.dumps({1: None})) == {"1": None}
+    assert serializer.loads(None) is None
+    assert serializer.loads(pickle.dumps(value)) is None
+    assert serializer.loads(serializer.prefix + b"{") is None
+    # the values written by another version are misses
+    other = VersionedSerializer(version=b"other")
+    assert other.loads(serializer.dumps(value)) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.benchmark
+async def test_serializer_benchmark(app: Any) -> None:
+    """
+    A benchmark of the serializer against pickle on the latest records.
+    """
+    values = get_user_latest_record_values(BENCHMARK_COUNT)
+    serializer = VersionedSerializer()
+    cache = get_redis_cache()
+
+    async def measure(
+        name: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]
+    ) -> int:
+        start = perf_counter()
+        encoded = [dumps(value) for value in values]
+        encode_time = perf_counter() - start
+        start = perf_counter()
+        for value in encoded:
+            loads(value)
+        decode_time = perf_counter() - start
+        memory = 0
+        for i, value in enumerate(encoded):
+            key = f"serializer_benchmark:{name}:{i}"
+            await cache.raw("set", key, value)
+            memory += await cache.raw("execute", b"MEMORY", b"USAGE", key)
+            await cache.raw("delete", key)
+        logger.info(
+            f"{name} of {BENCHMARK_COUNT} latest records: "
+            f"encode {encode_time * 1000:.2f}ms, decode {decode_time * 1000:.2f}ms, "
+            f"{sum(map(len, encoded)) / BENCHMARK_COUNT:.1f} bytes per value, "
+            f"{memory / BENCHMARK_COUNT:.1f} bytes per key in redis"
+        )
+        return memory
+
+    pickle_memory = await measure("pickle", pickle.dumps, pickle.loads)
+    memory = await measure("orjson", serializer.dumps, serializer.loads)
+    assert memory < pickle_memory
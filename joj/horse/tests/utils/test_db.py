@@ -0,0 +1,163 @@
+import asyncio
+from typing import Any, AsyncGenerator, Dict
+
+import pytest
+from fastapi import Depends, FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from starlette_context import context
+from starlette_context.middleware import RawContextMiddleware
+
+from joj.horse import models
+from joj.horse.config import settings
+from joj.horse.schemas.cache import get_redis_cache
+from joj.horse.services.db import (
+    db_session,
+    get_db_engine,
+    get_db_replica_engines,
+    get_db_url,
+    request_db_session_dependency,
+    use_primary_db,
+)
+from joj.horse.tests.utils.utils import generate_auth_headers
+
+db_app = FastAPI(dependencies=[Depends(request_db_session_dependency)])
+db_app.add_middleware(RawContextMiddleware)
+
+
+async def get_engine_name() -> Dict[str, Any]:
+    async with db_session() as session:
+        primary = session.bind is get_db_engine()
+    return {"primary": primary}
+
+
+@db_app.get("/engine")
+async def get_engine() -> Dict[str, Any]:
+    return await get_engine_name()
+
+
+@db_app.post("/engine")
+async def post_engine() -> Dict[str, Any]:
+    return await get_engine_name()
+
+
+@db_app.get("/primary_engine")
+@use_primary_db
+async def get_primary_engine() -> Dict[str, Any]:
+    return await get_engine_name()
+
+
+@db_app.get("/no_db")
+async def get_no_db() -> Dict[str, Any]:
+    return {"session": "db_session" in context}
+
+
+@db_app.get("/reuse")
+async def get_reuse() -> Dict[str, Any]:
+    async with db_session() as first:
+        await first.execute(text("SELECT 1"))
+    async with db_session() as second:
+        await second.execute(text("SELECT 1"))
+    return {"reused": first is second, "session": "db_session" in context}
+
+
+@db_app.get("/concurrent")
+async def get_concurrent() -> Dict[str, Any]:
+    async def get_session() -> Any:
+        async with db_session() as session:
+            return session
+
+    first, second = await asyncio.gather(get_session(), get_session())
+    return {"reused": first is second}
+
+
+def get_checkout_count() -> int:
+    return get_db_engine().pool.checkout_count  # type: ignore
+
+
+@pytest.fixture
+async def lazy_db_client(app: FastAPI) -> AsyncGenerator[AsyncClient, Any]:
+    async with AsyncClient(app=db_app, base_url="http://testserver") as c:
+        yield c
+
+
+@pytest.fixture
+async def db_client(
+    app: FastAPI,
+    monkeypatch: pytest.MonkeyPatch,
+    global_guest_user: models.User,
+    global_domain_user: models.User,
+) -> AsyncGenerator[AsyncClient, Any]:
+    # the replica is another engine of the primary database
+    monkeypatch.setattr(settings, "db_replicas", get_db_url())
+    monkeypatch.setattr(settings, "db_replica_pin_seconds", 1)
+    get_db_replica_engines.cache_clear()
+    for user in (global_guest_user, global_domain_user):
+        await get_redis_cache().delete(str(user.id), namespace="db_primary_users")
+    async with AsyncClient(app=db_app, base_url="http://testserver") as c:
+        yield c
+    for engine in get_db_replica_engines():
+        await engine.dispose()
+    get_db_replica_engines.cache_clear()
+
+
+async def is_primary(client: AsyncClient, method: str, url: str, **kwargs: Any) -> bool:
+    response = await client.request(method, url, **kwargs)
+    assert response.status_code == 200
+    return response.json()["primary"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestAuthRegister"])
+class TestReplicaRouting:
+    async def test_replica(
+        self, db_client: AsyncClient, global_guest_user: models.User
+    ) -> None:
+        headers = generate_auth_headers(global_guest_user)
+        assert not await is_primary(db_client, "GET", "/engine")
+        assert not await is_primary(db_client, "GET", "/engine", headers=headers)
+        assert await is_primary(db_client, "GET", "/primary_engine")
+
+    async def test_pin_after_write(
+        self,
+        db_client: AsyncClient,
+        global_guest_user: models.User,
+        global_domain_user: models.User,
+    ) -> None:
+        headers = generate_auth_headers(global_guest_user)
+        assert await is_primary(db_client, "POST", "/engine", headers=headers)
+        # the writer reads from the primary, the others from the replica
+        assert await is_primary(db_client, "GET", "/engine", headers=headers)
+        assert not await is_primary(db_client, "GET", "/engine")
+        other_headers = generate_auth_headers(global_domain_user)
+        assert not await is_primary(db_client, "GET", "/engine", headers=other_headers)
+
+        await asyncio.sleep(settings.db_replica_pin_seconds + 0.1)
+        assert not await is_primary(db_client, "GET", "/engine", headers=headers)
+
+    async def test_concurrent_first_use(
+        self, db_client: AsyncClient, global_guest_user: models.User
+    ) -> None:
+        # the engine of a logged in user is resolved with a redis round trip
+        headers = generate_auth_headers(global_guest_user)
+        response = await db_client.get("/concurrent", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == {"reused": True}
+
+
+@pytest.mark.asyncio
+class TestLazyRequestSession:
+    async def test_no_db(self, lazy_db_client: AsyncClient) -> None:
+        checkout_count = get_checkout_count()
+        response = await lazy_db_client.get("/no_db")
+        assert response.status_code == 200
+        assert response.json() == {"session": False}
+        assert get_checkout_count() == checkout_count
+
+    async def test_reuse(self, lazy_db_client: AsyncClient) -> None:
+        checkout_count = get_checkout_count()
+        response = await lazy_db_client.get("/reuse")
+        assert response.status_code == 200
+        assert response.json() == {"reused": True, "session": True}
+        # both statements run in the transaction of a single connection
+        assert get_checkout_count() == checkout_count + 1
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import FastAPI
+from sqlalchemy.sql.expression import text
+
+from joj.horse.services.db import get_db_engine
+from joj.horse.services.partition import (
+    add_months,
+    create_monthly_partitions,
+    get_create_default_partition_sql,
+    get_create_partition_sql,
+    get_month_start,
+    get_monthly_partitions,
+    get_partition_name,
+    get_partition_names,
+    is_partition_of,
+    parse_partition_name,
+)
+
+
+def month(year: int, month: int) -> datetime:
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "start,months,expected",
+    [
+        (month(2022, 1), 0, month(2022, 1)),
+        (month(2022, 1), 1, month(2022, 2)),
+        (month(2022, 11), 2, month(2023, 1)),
+        (month(2022, 12), 13, month(2024, 1)),
+        (month(2022, 1), -1, month(2021, 12)),
+        (month(2022, 3), -15, month(2020, 12)),
+    ],
+)
+def test_add_months(start: datetime, months: int, expected: datetime) -> None:
+    assert add_months(start, months) == expected
+
+
+def test_get_month_start() -> None:
+    assert get_month_start(datetime(2022, 3, 31, 23, 59)) == month(2022, 3)
+    # the months are in utc
+    cst = timezone(timedelta(hours=8))
+    assert get_month_start(datetime(2022, 4, 1, 7, tzinfo=cst)) == month(2022, 3)
+    assert get_month_start(datetime(2022, 4, 1, 8, tzinfo=cst)) == month(2022, 4)
+
+
+def test_partition_name() -> None:
+    name = get_partition_name("records", month(2022, 3))
+    assert name == "records_2022_03"
+    assert parse_partition_name("records", name) == month(2022, 3)
+    assert parse_partition_name("problems", name) is None
+    assert parse_partition_name("records", "records_2022_3") is None
+    assert parse_partition_name("records", "records_2022_03_old") is None
+    assert is_partition_of("records", name)
+    assert is_partition_of("records", "records_default")
+    assert not is_partition_of("records", "records")
+    assert not is_partition_of("records", "user_latest_records")
+
+
+def test_partition_bounds() -> None:
+    # the upper bound is exclusive and equals the lower bound of the next month
+    assert get_create_partition_sql("records", month(2022, 12)) == (
+        "CREATE TABLE IF NOT EXISTS records_2022_12 PARTITION OF records "
+        "FOR VALUES FROM ('2022-12-01T00:00:00+00:00') "
+        "TO ('2023-01-01T00:00:00+00:00')"
+    )
+    assert get_create_default_partition_sql("records") == (
+        "CREATE TABLE IF NOT EXISTS records_default PARTITION OF records DEFAULT"
+    )
+
+
+@pytest.mark.asyncio
+async def test_move_default_rows(app: FastAPI) -> None:
+    table = "partition_test"
+    async with get_db_engine().begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await conn.execute(
+            text(
+                f"CREATE TABLE {table} (id int, created_at timestamptz) "
+                "PARTITION BY RANGE (created_at)"
+            )
+        )
+        await conn.execute(text(get_create_default_partition_sql(table)))
+        rows = [
+            {"id": i, "created_at": created_at}
+            for i, created_at in enumerate(
+                [month(2022, 3), datetime(2022, 3, 31, 23), month(2022, 4)]
+            )
+        ]
+        await conn.execute(text(f"INSERT INTO {table} VALUES (:id, :created_at)"), rows)
+        names = await create_monthly_partitions(conn, table, month(2022, 3), 2)
+        assert names == ["partition_test_2022_03", "partition_test_2022_04"]
+        assert await create_monthly_partitions(conn, table, month(2022, 3), 2) == names
+        assert [x for x, _ in await get_monthly_partitions(conn, table)] == names
+        for name, ids in [
+            ("partition_test_2022_03", [0, 1]),
+            ("partition_test_2022_04", [2]),
+            ("partition_test_default", []),
+        ]:
+            result = await conn.execute(text(f"SELECT id FROM {name} ORDER BY id"))
+            assert result.scalars().all() == ids
+        assert "partition_test_default" in await get_partition_names(conn, table)
+        await conn.execute(text(f"DROP TABLE {table}"))
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from joj.horse import models
+from joj.horse.config import settings
+from joj.horse.schemas.base import Empty, StandardResponse
+from joj.horse.services.db import db_session, get_db_engine, set_statement_timeout
+from joj.horse.tests.utils.utils import generate_auth_headers
+from joj.horse.utils.errors import ErrorCode
+from joj.horse.utils.exception_handlers import register_exception_handlers
+from joj.horse.utils.fastapi.router import MyRouter, request_deadline
+
+router = MyRouter()
+handler_events: Dict[str, asyncio.Event] = {}
+
+
+async def wait_until_cancelled() -> None:
+    handler_events["started"].set()
+    try:
+        await asyncio.sleep(10)
+    except asyncio.CancelledError:
+        handler_events["cancelled"].set()
+        raise
+
+
+@router.get("/sleep")
+@request_deadline(0.1)
+async def sleep() -> StandardResponse[Empty]:
+    await wait_until_cancelled()
+    return StandardResponse()
+
+
+@router.get("/wait")
+async def wait() -> StandardResponse[Empty]:
+    await wait_until_cancelled()
+    return StandardResponse()
+
+
+@router.post("/echo")
+@request_deadline(1)
+async def echo(data: List[int]) -> List[int]:
+    return data
+
+
+@router.get("/statement_timeout")
+async def sleep_in_database() -> StandardResponse[Empty]:
+    async with db_session() as session:
+        set_statement_timeout(session, 0.01)
+        await session.execute(text("SELECT pg_sleep(1)"))
+    return StandardResponse()
+
+
+deadline_app = FastAPI()
+register_exception_handlers(deadline_app)
+deadline_app.include_router(router)
+
+
+@pytest.fixture
+async def deadline_client() -> Any:
+    handler_events.update(started=asyncio.Event(), cancelled=asyncio.Event())
+    async with AsyncClient(app=deadline_app, base_url="http://testserver") as c:
+        yield c
+
+
+@pytest.mark.asyncio
+class TestDeadlineRoute:
+    async def test_deadline(self, deadline_client: AsyncClient) -> None:
+        response = await deadline_client.get("/sleep")
+        assert response.status_code == 200
+        assert response.json()["errorCode"] == ErrorCode.RequestTimeoutError
+        assert handler_events["cancelled"].is_set()
+
+    async def test_body(self, deadline_client: AsyncClient) -> None:
+        # the body of other methods is left to the route handler
+        response = await deadline_client.post("/echo", json=[1, 2, 3])
+        assert response.status_code == 200
+        assert response.json() == [1, 2, 3]
+
+    async def test_statement_timeout(
+        self, app: FastAPI, deadline_client: AsyncClient
+    ) -> None:
+        response = await deadline_client.get("/statement_timeout")
+        assert response.status_code == 200
+        res = response.json()
+        assert res["errorCode"] == ErrorCode.RequestTimeoutError
+        assert res["errorMsg"] == "statement timeout"
+
+    async def test_disconnect(self, deadline_client: AsyncClient) -> None:
+        disconnected = asyncio.Event()
+        messages: List[Dict[str, Any]] = []
+
+        async def receive() -> Dict[str, Any]:
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/wait",
+            "raw_path": b"/wait",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "server": ("testserver", 80),
+            "client": ("127.0.0.1", 12345),
+        }
+        task = asyncio.create_task(deadline_app(scope, receive, send))
+        await asyncio.wait_for(handler_events["started"].wait(), 1)
+        disconnected.set()
+        await asyncio.wait_for(task, 5)
+        assert handler_events["cancelled"].is_set()
+        assert messages[0]["status"] == 499
+
+
+@pytest.mark.asyncio
+@pytest.mark.depends(on=["TestAuthRegister"])
+class TestStatementTimeout:
+    async def test_list_timeout(
+        self,
+        app: FastAPI,
+        client: AsyncClient,
+        monkeypatch: pytest.MonkeyPatch,
+        global_guest_user: models.User,
+    ) -> None:
+        # the list is blocked by the lock until the statement times out
+        monkeypatch.setattr(settings, "db_statement_timeout", 0.1)
+        async with get_db_engine().connect() as conn:
+            await conn.execute(text("LOCK TABLE domains IN ACCESS EXCLUSIVE MODE"))
+            response = await client.get(
+                app.url_path_for("list_domains"),
+                headers=generate_auth_headers(global_guest_user),
+            )
+            await conn.rollback()
+        assert response.status_code == 200
+        res = response.json()
+        assert res["errorCode"] == ErrorCode.RequestTimeoutError
+        assert res["errorMsg"] == "statement timeout"
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from typing import Any, AsyncGenerator, List, Tuple
+
+import pytest
+
+from joj.horse.schemas.cache import get_redis_cache
+from joj.horse.services.tiered_cache import LRUCache, TieredCache
+
+
+async def wait_listening(cache: TieredCache) -> None:
+    for _ in range(100):
+        if cache.listening:
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError("cache is not listening")
+
+
+async def wait_evicted(cache: TieredCache, namespace: str, key: str) -> None:
+    for _ in range(100):
+        if cache.local.get((namespace, key)) is None:
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError("key is not evicted")
+
+
+@pytest.fixture
+async def workers(app: Any) -> AsyncGenerator[Tuple[TieredCache, TieredCache], Any]:
+    # two workers sharing the channel
+    caches = (
+        TieredCache("cache_invalidation:test", local_max_size=16, local_ttl=60),
+        TieredCache("cache_invalidation:test", local_max_size=16, local_ttl=60),
+    )
+    tasks = [asyncio.create_task(cache.listen()) for cache in caches]
+    for cache in caches:
+        await wait_listening(cache)
+    yield caches
+    for task in tasks:
+        task.cancel()
+
+
+def test_lru_cache() -> None:
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # b is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    cache.set("d", 4, ttl=-1)
+    assert cache.get("d") is None
+    # the expired entry is removed when read
+    assert len(cache) == 1
+    assert LRUCache(max_size=0, ttl=60).get("a") is None
+
+
+@pytest.mark.asyncio
+class TestTieredCache:
+    async def test_get(self, workers: Tuple[TieredCache, TieredCache]) -> None:
+        worker_1, _ = workers
+        namespace = "test_tiered_get"
+        await get_redis_cache().delete("a", namespace=namespace)
+        assert await worker_1.get("a", namespace=namespace) is None
+        await get_redis_cache().set("a", {"value": 1}, namespace=namespace)
+        assert await worker_1.get("a", namespace=namespace) == {"value": 1}
+        assert await worker_1.get("a", namespace=namespace) == {"value": 1}
+        assert await worker_1.multi_get(["a", "b"], namespace=namespace) == [
+            {"value": 1},
+            None,
+        ]
+        stats = worker_1.get_stats()[namespace]
+        assert stats["local_hits"] == 2
+        assert stats["redis_hits"] == 1
+        assert stats["misses"] == 2
+
+    async def test_invalidate(self, workers: Tuple[TieredCache, TieredCache]) -> None:
+        worker_1, worker_2 = workers
+        namespace = "test_tiered_invalidate"
+        await worker_1.multi_set([("a", 1), ("b", 2)], namespace=namespace)
+        assert await worker_2.multi_get(["a", "b"], namespace=namespace) == [1, 2]
+        assert worker_2.local.get((namespace, "a")) == 1
+
+        await worker_1.set("a", 3, namespace=namespace)
+        await wait_evicted(worker_2, namespace, "a")
+        assert await worker_2.get("a", namespace=namespace) == 3
+        # worker_1 keeps its own write
+        assert worker_1.local.get((namespace, "a")) == 3
+
+        await worker_1.delete("b", namespace=namespace)
+        await wait_evicted(worker_2, namespace, "b")
+        assert await worker_2.get("b", namespace=namespace) is None
+
+    async def test_not_listening(self) -> None:
+        cache = TieredCache("cache_invalidation:test", local_max_size=16, local_ttl=60)
+        namespace = "test_tiered_not_listening"
+        await cache.set("a", 1, namespace=namespace)
+        assert len(cache.local) == 0
+        assert await cache.get("a", namespace=namespace) == 1
+        assert cache.get_stats()[namespace]["redis_hits"] == 1
+
+
+@pytest.mark.asyncio
+class TestTieredCacheLoad:
+    async def test_coalesce(self, workers: Tuple[TieredCache, TieredCache]) -> None:
+        namespace = "test_tiered_coalesce"
+        await get_redis_cache().delete("a", namespace=namespace)
+        loads: List[int] = []
+
+        async def load() -> int:
+            loads.append(1)
+            await asyncio.sleep(0.2)
+            return 42
+
+        # the workers share the load by the lease
+        results = await asyncio.gather(
+            *(
+                worker.get_or_load("a", namespace, load, ttl=60)
+                for worker in workers
+                for _ in range(5)
+            )
+        )
+        assert results == [42] * 10
+        assert len(loads) == 1
+        assert sum(w.get_stats()[namespace]["coalesced"] for w in workers) == 9
+
+    async def test_load_error(self, workers: Tuple[TieredCache, TieredCache]) -> None:
+        worker_1, _ = workers
+        namespace = "test_tiered_load_error"
+        await get_redis_cache().delete("a", namespace=namespace)
+
+        async def load() -> int:
+            await asyncio.sleep(0.1)
+            raise ValueError("load error")
+
+        results = await asyncio.gather(
+            *(worker_1.get_or_load("a", namespace, load) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert worker_1.flights == {}
+        assert await get_redis_cache().get("a", namespace=namespace) is None
+
+    async def test_stale(self, workers: Tuple[TieredCache, TieredCache]) -> None:
+        worker_1, worker_2 = workers
+        namespace = "test_tiered_stale"
+        entry = {"value": 1, "delta": 0.1, "expires_at": time.time() - 1}
+        await worker_1.set("a", entry, namespace=namespace, ttl=60)
+        assert worker_1.should_refresh(entry)
+
+        async def load() -> int:
+            return 2
+
+        # worker_2 is refreshing the key
+        token = await worker_2.acquire_lease("a", namespace)
+        assert token is not None
+        assert await worker_1.get_or_load("a", namespace, load, ttl=60) == 1
+        assert worker_1.get_stats()[namespace]["stale_hits"] == 1
+        await worker_2.release_lease("a", namespace, token)
+        assert await worker_1.get_or_load("a", namespace, load, ttl=60) == 2
+        # far from the expiry, it is not refreshed
+        entry = await worker_1.get("a", namespace=namespace)
+        assert entry["value"] == 2
+        assert not worker_1.should_refresh(entry)
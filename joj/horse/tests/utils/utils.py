@@ -1,4 +1,5 @@
-from typing import Any, Dict, Optional, Tuple, Union
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, List, Optional, Tuple, Union
 from uuid import UUID
 
 import jwt
@@ -8,9 +9,11 @@ from httpx import AsyncClient, Response
 from loguru import logger
 from pydantic import BaseModel
 from pytest_lazyfixture import lazy_fixture
+from sqlalchemy import event
 
 from joj.horse import apis, models, schemas
 from joj.horse.config import settings
+from joj.horse.services.db import get_db_engine
 from joj.horse.utils.errors import ErrorCode
 
 GLOBAL_DOMAIN_COUNT = 3
@@ -34,6 +37,21 @@ def validate_response(
     return res["data"]
 
 
+@contextmanager
+def count_sql_statements() -> Generator[List[str], None, None]:
+    statements: List[str] = []
+
+    def before_cursor_execute(_: Any, __: Any, statement: str, *args: Any) -> None:
+        statements.append(statement)
+
+    engine = get_db_engine().sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 def to_dict(data: Union[Dict[Any, Any], BaseModel]) -> Dict[Any, Any]:
     if isinstance(data, dict):
         return data
@@ -1,3 +1,6 @@
+import os
+import threading
+import time
 from enum import Enum
 from pathlib import Path
 from shutil import rmtree
@@ -19,6 +22,36 @@ def is_uuid(s: Any) -> bool:
     return True
 
 
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)
+
+
+def uuid7() -> UUID:
+    """
+    Time-ordered UUID (version 7 of RFC 9562),
+    48 bits of unix milliseconds followed by 74 random bits.
+    Within the same millisecond the random bits are incremented,
+    so the ids generated by a process are strictly increasing.
+    """
+    global _uuid7_last
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big") >> 6
+    with _uuid7_lock:
+        last_timestamp_ms, last_rand = _uuid7_last
+        if timestamp_ms <= last_timestamp_ms:
+            timestamp_ms = last_timestamp_ms
+            rand = last_rand + 1
+            if rand >> 74:
+                timestamp_ms, rand = timestamp_ms + 1, 0
+        _uuid7_last = (timestamp_ms, rand)
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76  # version
+    value |= (rand >> 62) << 64
+    value |= 0x2 << 62  # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF
+    return UUID(int=value)
+
+
 class TemporaryDirectory:
     def __init__(
         self,
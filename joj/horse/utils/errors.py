@@ -12,6 +12,7 @@ class ErrorCode(str, Enum):
     IllegalFieldError = "IllegalFieldError"
     IntegrityError = "IntegrityError"
     LockError = "LockError"
+    RequestTimeoutError = "RequestTimeoutError"
     # NotFoundError = "NotFoundError"
 
     APINotImplementedError = "APINotImplementedError"
@@ -32,6 +32,17 @@ async def sqlalchemy_integrity_error_handler(
     return business_exception_response(BizError(ErrorCode.IntegrityError, str(exc)))
 
 
+async def sqlalchemy_dbapi_error_handler(
+    request: Request, exc: sqlalchemy.exc.DBAPIError
+) -> JSONResponse:
+    # query_canceled, the statement timeout is exceeded
+    if getattr(exc.orig, "sqlstate", None) == "57014":
+        return business_exception_response(
+            BizError(ErrorCode.RequestTimeoutError, "statement timeout")
+        )
+    return await general_exception_handler(request, exc)
+
+
 async def business_exception_handler(request: Request, exc: BizError) -> JSONResponse:
     return business_exception_response(exc)
 
@@ -52,5 +63,6 @@ def register_exception_handlers(app: FastAPI) -> None:
     app.add_exception_handler(
         sqlalchemy.exc.IntegrityError, sqlalchemy_integrity_error_handler
     )
+    app.add_exception_handler(sqlalchemy.exc.DBAPIError, sqlalchemy_dbapi_error_handler)
     app.add_exception_handler(BizError, business_exception_handler)
     app.add_exception_handler(Exception, general_exception_handler)
@@ -0,0 +1,114 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Type,
+    Union,
+)
+
+import orjson
+from loguru import logger
+from pydantic import BaseModel
+from sqlalchemy.sql.expression import Select
+from starlette.responses import StreamingResponse
+
+from joj.horse.schemas.base import BT, StandardListResponse
+from joj.horse.schemas.query import CountStrategy, OrderingQuery, PaginationQuery
+
+if TYPE_CHECKING:
+    from joj.horse.models.base import ORMUtils
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def encode_ndjson(
+    batches: AsyncIterable[List[Any]],
+    transform: Optional[Callable[[Any], BaseModel]] = None,
+) -> AsyncIterator[bytes]:
+    try:
+        async for batch in batches:
+            if transform is not None:
+                batch = [transform(item) for item in batch]
+            yield b"".join(
+                orjson.dumps(item.dict(by_alias=True)) + b"\n" for item in batch
+            )
+    except Exception as e:
+        # the status code has been sent, the client sees a truncated stream
+        logger.error("error when streaming ndjson:")
+        logger.exception(e)
+        raise
+
+
+class NDJSONResponse(StreamingResponse):
+    """
+    Stream the batches of items as newline delimited json, one item per line.
+    The items are converted by transform first if it is set, e.g. to the
+    response model so that only its fields are written.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def __init__(
+        self,
+        batches: AsyncIterable[List[Any]],
+        transform: Optional[Callable[[Any], BaseModel]] = None,
+        status_code: int = 200,
+    ) -> None:
+        super().__init__(encode_ndjson(batches, transform), status_code=status_code)
+
+
+if TYPE_CHECKING:
+    ListResponse = Union[StandardListResponse[BT], NDJSONResponse]
+else:
+
+    class ListResponse:
+        """
+        The response of list endpoints, a page of results or the stream of all
+        of them. MyRouter uses StandardListResponse[item] as the response model.
+        """
+
+        def __class_getitem__(cls, item: Any) -> Any:
+            return Union[StandardListResponse[item], NDJSONResponse]
+
+
+async def stream_or_list(
+    model: Type["ORMUtils"],
+    statement: Select,
+    ordering: Optional[OrderingQuery],
+    pagination: Optional[PaginationQuery],
+    stream: bool,
+    converter: Optional[Callable[[Any], BT]] = None,
+    batch_converter: Optional[Callable[[List[Any]], Awaitable[List[BT]]]] = None,
+    count_strategy: CountStrategy = CountStrategy.exact,
+) -> "ListResponse[BT]":
+    """
+    Stream all the results of the list statement as NDJSON if stream is set,
+    otherwise return a page of them.
+    The rows are converted to the results by converter one by one,
+    or by batch_converter a batch at a time.
+    """
+
+    async def convert(rows: List[Any]) -> List[Any]:
+        if batch_converter is not None:
+            return await batch_converter(rows)
+        if converter is not None:
+            return [converter(row) for row in rows]
+        return rows
+
+    async def convert_batches() -> AsyncIterator[List[Any]]:
+        rows: List[Any]
+        async for rows in model.stream_list_statement(statement, ordering):
+            yield await convert(rows)
+
+    if stream:
+        return NDJSONResponse(convert_batches())
+    rows: List[Any]
+    rows, count, next_cursor = await model.execute_list_statement(
+        statement, ordering, pagination, count_strategy=count_strategy
+    )
+    return StandardListResponse(await convert(rows), count, next_cursor)
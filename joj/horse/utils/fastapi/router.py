@@ -1,20 +1,122 @@
+import asyncio
 import functools
+from contextlib import suppress
 from inspect import Parameter, signature
-from typing import TYPE_CHECKING, Any, Callable, List, get_type_hints
-
-from fastapi import APIRouter, Depends, FastAPI
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Coroutine,
+    List,
+    Set,
+    Type,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from fastapi import APIRouter, Depends, FastAPI, Request, Response
 from fastapi.routing import APIRoute
 from loguru import logger
 from pydantic.fields import ModelField
 
+from joj.horse.config import settings
 from joj.horse.schemas import BaseModel
 from joj.horse.schemas.permission import PermissionBase
+from joj.horse.utils.errors import BizError, ErrorCode
+
+T = TypeVar("T", bound=Callable[..., Any])
 
 
 class Detail(BaseModel):
     detail: str
 
 
+def request_deadline(seconds: float) -> Callable[[T], T]:
+    """
+    Set the deadline of an endpoint, overriding settings.request_deadline.
+    """
+
+    def decorator(endpoint: T) -> T:
+        endpoint.request_deadline = seconds  # type: ignore
+        return endpoint
+
+    return decorator
+
+
+async def wait_for_disconnect(request: Request, interval: float = 1) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+class DeadlineRoute(APIRoute):
+    """
+    Cancel the route handler when the client disconnects or the deadline exceeds,
+    so that the running database queries, redis calls and the awaiting of
+    threadpool jobs are cancelled together.
+
+    Disconnects are only watched for GET and HEAD requests, because receiving
+    the disconnect message would also consume the messages of the body, which
+    must be left to the route handler.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        route_handler = super().get_route_handler()
+        deadline = getattr(self.endpoint, "request_deadline", None)
+
+        async def deadline_route_handler(request: Request) -> Response:
+            timeout = settings.request_deadline if deadline is None else deadline
+            handler_task = asyncio.ensure_future(route_handler(request))
+            tasks: Set["asyncio.Future[Any]"] = {handler_task}
+            disconnect_task = None
+            if request.method in ("GET", "HEAD"):
+                disconnect_task = asyncio.ensure_future(wait_for_disconnect(request))
+                tasks.add(disconnect_task)
+            try:
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=timeout if timeout > 0 else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                if disconnect_task is not None:
+                    disconnect_task.cancel()
+                if not handler_task.done():
+                    handler_task.cancel()
+                    with suppress(asyncio.CancelledError, Exception):
+                        await handler_task
+            if handler_task in done:
+                return handler_task.result()
+            if disconnect_task in done:
+                logger.info(f"client disconnected, cancelled: {request.url.path}")
+                # nobody is listening, 499 is only for the access log
+                return Response(status_code=499)
+            raise BizError(
+                ErrorCode.RequestTimeoutError,
+                f"request cancelled after the deadline of {timeout} seconds",
+            )
+
+        return deadline_route_handler
+
+
+def get_response_model(endpoint: Callable[..., Any]) -> Any:
+    """
+    Use the annotated return type as the response model, the responses returned
+    directly (e.g. NDJSONResponse in ListResponse) are removed from unions.
+    """
+    return_type = get_type_hints(endpoint).get("return")
+    if get_origin(return_type) is Union:
+        args = tuple(
+            arg
+            for arg in get_args(return_type)
+            if not (isinstance(arg, type) and issubclass(arg, Response))
+        )
+        return Union[args]
+    return return_type
+
+
 class MyRouter(APIRouter):
     """
     Overrides the route decorator logic to use the annotated return type as the `response_model` if unspecified.
@@ -48,6 +150,11 @@ class MyRouter(APIRouter):
 
         return wrapper
 
+    def __init__(
+        self, *args: Any, route_class: Type[APIRoute] = DeadlineRoute, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, route_class=route_class, **kwargs)
+
     get = _parse_permissions(APIRouter.get)
     put = _parse_permissions(APIRouter.put)
     post = _parse_permissions(APIRouter.post)
@@ -61,7 +168,7 @@ class MyRouter(APIRouter):
         self, path: str, endpoint: Callable[..., Any], **kwargs: Any
     ) -> None:
         if kwargs.get("response_model") is None:
-            kwargs["response_model"] = get_type_hints(endpoint).get("return")
+            kwargs["response_model"] = get_response_model(endpoint)
         kwargs["responses"] = {403: {"model": Detail}}
         return super().add_api_route(path, endpoint, **kwargs)
 
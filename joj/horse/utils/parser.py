@@ -3,15 +3,22 @@ from functools import lru_cache
 from typing import Any, Callable, Coroutine, List, Optional
 from uuid import UUID
 
-from fastapi import Depends, File, Path, Query, UploadFile
-from sqlalchemy.orm import joinedload, subqueryload
+from fastapi import Depends, File, Header, Path, Query, UploadFile
+from sqlalchemy.orm import joinedload
 
 from joj.horse import models
 from joj.horse.models.permission import PermissionType, ScopeType
-from joj.horse.schemas.auth import Authentication, DomainAuthentication, get_domain
+from joj.horse.schemas.auth import (
+    Authentication,
+    DomainAuthentication,
+    RouteEntities,
+    get_domain,
+    resolve_route_entities,
+)
 from joj.horse.schemas.base import NoneEmptyLongStr, NoneNegativeInt, PaginationLimit
 from joj.horse.schemas.query import OrderingQuery, PaginationQuery
 from joj.horse.utils.errors import BizError, ErrorCode, ForbiddenError
+from joj.horse.utils.fastapi.ndjson import NDJSON_MEDIA_TYPE
 
 
 async def parse_uid(
@@ -67,7 +74,9 @@ async def parse_relevant_domain_with_tag(
     """
     Check whether a user in domain has equivalent permission for relevant_domain
     """
-    relevant_domain = await get_domain(relevant_domain_url_or_id)
+    relevant_domain = await models.Domain.find_by_url_or_id(relevant_domain_url_or_id)
+    if relevant_domain is None:
+        raise BizError(ErrorCode.DomainNotFoundError)
     if relevant_domain.tag != domain.tag:
         raise ForbiddenError(message="relevant domain Permission Denied.")
     return relevant_domain
@@ -112,9 +121,8 @@ async def parse_domain_invitation(
     raise BizError(ErrorCode.DomainInvitationBadRequestError)
 
 
-async def parse_problem_without_validation(
-    problem: str = Path(..., description="url or id of the problem"),
-    domain: models.Domain = Depends(parse_domain_from_auth),
+async def get_problem_by_url_or_id(
+    problem: str, domain: models.Domain
 ) -> models.Problem:
     problem_model = await models.Problem.find_by_domain_url_or_id(domain, problem)
     if problem_model:
@@ -122,6 +130,16 @@ async def parse_problem_without_validation(
     raise BizError(ErrorCode.ProblemNotFoundError)
 
 
+async def parse_problem_without_validation(
+    problem: str = Path(..., description="url or id of the problem"),
+    domain: models.Domain = Depends(parse_domain_from_auth),
+    route_entities: RouteEntities = Depends(resolve_route_entities),
+) -> models.Problem:
+    if route_entities.problem:
+        return route_entities.problem
+    raise BizError(ErrorCode.ProblemNotFoundError)
+
+
 def parse_problem(
     problem: models.Problem = Depends(parse_problem_without_validation),
     auth: Authentication = Depends(),
@@ -159,25 +177,15 @@ def parse_view_hidden_problem_set(
 @lru_cache
 def parse_problem_set_factory(
     load_problems: bool = False,
-    load_links: bool = False,
 ) -> Callable[..., Coroutine[Any, Any, models.ProblemSet]]:
-    options = []
-    if load_links:
-        options.append(
-            subqueryload(models.ProblemSet.problem_problem_set_links).joinedload(
-                models.ProblemProblemSetLink.problem, innerjoin=True
-            )
-        )
-
     async def wrapped(
         problem_set: str = Path(..., description="url or id of the problem set"),
         domain: models.Domain = Depends(parse_domain_from_auth),
         include_hidden: bool = Depends(parse_view_hidden_problem_set),
+        route_entities: RouteEntities = Depends(resolve_route_entities),
     ) -> models.ProblemSet:
         nonlocal load_problems
-        problem_set_model = await models.ProblemSet.find_by_domain_url_or_id(
-            domain, problem_set, options
-        )
+        problem_set_model = route_entities.problem_set
         if problem_set_model is None:
             raise BizError(ErrorCode.ProblemSetNotFoundError)
         if not include_hidden:
@@ -204,10 +212,9 @@ parse_problem_set = parse_problem_set_factory()
 async def parse_problem_problem_set_link(
     problem_set: models.ProblemSet = Depends(parse_problem_set),
     problem: models.Problem = Depends(parse_problem_without_validation),
+    route_entities: RouteEntities = Depends(resolve_route_entities),
 ) -> models.ProblemProblemSetLink:
-    link = await models.ProblemProblemSetLink.one_or_none(
-        problem_set_id=problem_set.id, problem_id=problem.id
-    )
+    link = route_entities.problem_problem_set_link
     if link is not None:
         link.problem_set = problem_set
         link.problem = problem
@@ -298,8 +305,28 @@ def parse_ordering_query(
 def parse_pagination_query(
     offset: NoneNegativeInt = Query(0),
     limit: PaginationLimit = Query(100),
+    cursor: Optional[str] = Query(
+        None,
+        description="Opaque cursor returned as nextCursor of the previous page.\n"
+        "If set, offset is ignored and the same ordering must be used.",
+    ),
+    count: bool = Query(
+        True,
+        description="Whether to count the results.\n"
+        "Set to false to skip the count and only report hasMore.",
+    ),
 ) -> PaginationQuery:
-    return PaginationQuery(offset=offset, limit=limit)
+    return PaginationQuery(offset=offset, limit=limit, cursor=cursor, count=count)
+
+
+def parse_stream_query(
+    accept: str = Header(
+        "",
+        description=f"Set to {NDJSON_MEDIA_TYPE} to stream all the results "
+        "as newline delimited json, the pagination is ignored.",
+    ),
+) -> bool:
+    return NDJSON_MEDIA_TYPE in accept
 
 
 def parse_file_path(
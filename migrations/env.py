@@ -1,5 +1,6 @@
 import asyncio
 from logging.config import fileConfig
+from typing import Any, Callable, Optional, Set
 
 from alembic import context
 from pydantic_universal_settings import init_settings
@@ -9,6 +10,12 @@ from sqlmodel import SQLModel
 import joj.horse.models  # noqa
 from joj.horse.config import AllSettings
 from joj.horse.services.db import get_db_engine
+from joj.horse.services.partition import (
+    PARTITIONED_TABLES,
+    is_partition_of,
+    is_partitioned,
+)
+from joj.horse.services.trigram import is_trigram_index
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -25,6 +32,36 @@ fileConfig(config.config_file_name)
 # target_metadata = mymodel.Base.metadata
 target_metadata = SQLModel.metadata
 
+
+def include_name(name: Optional[str], type_: str, parent_names: Any) -> bool:
+    # the partitions are created by the migrations and "horse records" commands
+    if type_ == "table" and name is not None:
+        return not any(is_partition_of(table, name) for table in PARTITIONED_TABLES)
+    # the trigram indexes are not declared in the models
+    if type_ == "index" and name is not None:
+        return not is_trigram_index(name)
+    return True
+
+
+def get_include_object(partitioned_tables: Set[str]) -> Callable[..., bool]:
+    """
+    The models always declare the unpartitioned schema. When a table is
+    partitioned by the migrations, the foreign keys referencing it are dropped,
+    so they are skipped here instead of being added back by autogenerate.
+    Its primary key also becomes (id, created_at), but primary keys are not
+    compared by autogenerate.
+    """
+
+    def include_object(
+        obj: Any, name: Optional[str], type_: str, reflected: bool, compare_to: Any
+    ) -> bool:
+        if type_ == "foreign_key_constraint" and not reflected:
+            return obj.referred_table.name not in partitioned_tables
+        return True
+
+    return include_object
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,14 +86,20 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
     )
 
     with context.begin_transaction():
         context.run_migrations()
 
 
-def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+def do_run_migrations(connection: Connection, partitioned_tables: Set[str]) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        include_object=get_include_object(partitioned_tables),
+    )
 
     with context.begin_transaction():
         context.run_migrations()
@@ -73,7 +116,13 @@ async def run_migrations_online() -> None:
     connectable = get_db_engine()
 
     async with connectable.connect() as connection:
-        await connection.run_sync(do_run_migrations)
+        partitioned_tables = set()
+        for table in PARTITIONED_TABLES:
+            if await is_partitioned(connection, table):
+                partitioned_tables.add(table)
+        # end the transaction begun by the queries, the migrations begin their own
+        await connection.commit()
+        await connection.run_sync(do_run_migrations, partitioned_tables)
 
 
 if context.is_offline_mode():
@@ -0,0 +1,145 @@
+"""partition records by month
+
+The cases_archive_key column is always added. The conversion of records
+into a table partitioned by the month of created_at is optional, run
+`alembic -x partition_records=true upgrade head` to enable it. New monthly
+partitions are created by `horse records create-partitions`.
+
+The primary key of a partitioned table must contain the partition key,
+so records.id is no longer referenced by user_latest_records.record_id.
+
+Revision ID: 8c4f2a6d1e93
+Revises: 0b668715406d
+Create Date: 2026-10-18 15:26:09.514830
+
+"""
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+import sqlmodel
+import sqlmodel.sql.sqltypes
+from alembic import context, op
+
+from joj.horse.services.partition import (
+    add_months,
+    get_create_default_partition_sql,
+    get_create_partition_sql,
+    get_month_start,
+)
+
+# revision identifiers, used by Alembic.
+revision = "8c4f2a6d1e93"
+down_revision = "0b668715406d"
+branch_labels = None
+depends_on = None
+
+# number of monthly partitions created ahead of the current month
+PARTITIONS_AHEAD = 3
+
+
+def is_records_partitioned() -> bool:
+    statement = sa.text(
+        "SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'records'"
+    )
+    return op.get_bind().execute(statement).first() is not None
+
+
+def create_records_constraints(primary_key: list) -> None:
+    op.create_primary_key("records_pkey", "records", primary_key)
+    for column in ["domain_id", "problem_set_id", "problem_id", "committer_id"]:
+        op.create_index(
+            f"ix_records_{column}_created_at",
+            "records",
+            [column, "created_at", "id"],
+        )
+    foreign_keys = [
+        ("domain_id", "domains", "CASCADE"),
+        ("problem_set_id", "problem_sets", "SET NULL"),
+        ("problem_id", "problems", "SET NULL"),
+        ("problem_config_id", "problem_configs", "SET NULL"),
+        ("committer_id", "users", "SET NULL"),
+        ("judger_id", "users", "SET NULL"),
+    ]
+    for column, table, ondelete in foreign_keys:
+        op.create_foreign_key(
+            f"records_{column}_fkey",
+            "records",
+            table,
+            [column],
+            ["id"],
+            ondelete=ondelete,
+        )
+
+
+def partition_records() -> None:
+    op.drop_constraint(
+        "user_latest_records_record_id_fkey",
+        "user_latest_records",
+        type_="foreignkey",
+    )
+    op.rename_table("records", "records_unpartitioned")
+    op.execute(
+        "CREATE TABLE records (LIKE records_unpartitioned "
+        "INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)"
+    )
+    first = (
+        op.get_bind()
+        .execute(sa.text("SELECT min(created_at) FROM records_unpartitioned"))
+        .scalar()
+    )
+    end = add_months(get_month_start(datetime.now(tz=timezone.utc)), PARTITIONS_AHEAD)
+    month = get_month_start(first) if first else end
+    while month <= end:
+        op.execute(get_create_partition_sql("records", month))
+        month = add_months(month, 1)
+    op.execute(get_create_default_partition_sql("records"))
+    # load the rows before building the indexes
+    op.execute("INSERT INTO records SELECT * FROM records_unpartitioned")
+    op.drop_table("records_unpartitioned")
+    create_records_constraints(["id", "created_at"])
+
+
+def unpartition_records() -> None:
+    op.rename_table("records", "records_partitioned")
+    op.execute(
+        "CREATE TABLE records (LIKE records_partitioned "
+        "INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    op.execute("INSERT INTO records SELECT * FROM records_partitioned")
+    op.drop_table("records_partitioned")
+    create_records_constraints(["id"])
+    op.execute(
+        "DELETE FROM user_latest_records WHERE NOT EXISTS "
+        "(SELECT 1 FROM records WHERE records.id = user_latest_records.record_id)"
+    )
+    op.create_foreign_key(
+        "user_latest_records_record_id_fkey",
+        "user_latest_records",
+        "records",
+        ["record_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.add_column(
+        "records",
+        sa.Column(
+            "cases_archive_key", sqlmodel.sql.sqltypes.AutoString(), nullable=True
+        ),
+    )
+    # ### end Alembic commands ###
+    x_arguments = context.get_x_argument(as_dictionary=True)
+    if x_arguments.get("partition_records", "").lower() in ("1", "true", "yes"):
+        partition_records()
+
+
+def downgrade() -> None:
+    if is_records_partitioned():
+        unpartition_records()
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_column("records", "cases_archive_key")
+    # ### end Alembic commands ###
@@ -0,0 +1,43 @@
+"""user trigram indexes
+
+The GIN indexes of pg_trgm serve the ILIKE '%query%' predicates of the
+user search. They are skipped with a warning if the extension is not
+available on the server, the search still works with sequential scans.
+
+Revision ID: d5b3f07a2c61
+Revises: 8c4f2a6d1e93
+Create Date: 2026-10-18 17:42:31.208764
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from loguru import logger
+
+from joj.horse.services.trigram import (
+    TRIGRAM_INDEXED_COLUMNS,
+    get_create_trigram_index_sql,
+    get_trigram_index_name,
+)
+
+# revision identifiers, used by Alembic.
+revision = "d5b3f07a2c61"
+down_revision = "8c4f2a6d1e93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    statement = sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if op.get_bind().execute(statement).first() is None:
+        logger.warning("pg_trgm is not available, skip the trigram indexes.")
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, columns in TRIGRAM_INDEXED_COLUMNS.items():
+        for column in columns:
+            op.execute(get_create_trigram_index_sql(table, column))
+
+
+def downgrade() -> None:
+    for table, columns in TRIGRAM_INDEXED_COLUMNS.items():
+        for column in columns:
+            op.execute(f"DROP INDEX IF EXISTS {get_trigram_index_name(table, column)}")